@@ -0,0 +1,78 @@
+"""
+Soak-проверка логов сессий: 10k партий подряд, у каждой свой SessionLogger.
+Партия пишет события и LLM-запись, затем закрывается (как GameEngine.release на game_over);
+часть партий "теряется" без close — их файлы должен вытеснить LRU-пул LogWriter.
+
+Проверяется, что число открытых файлов пула не превышает max_open, а число дескрипторов процесса
+и память (tracemalloc) после прогрева не растут с количеством партий. Логи пишутся во временную папку.
+
+    python benchmarks/log_soak.py --games 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from src.core.logger import LogWriter, SessionLogger  # noqa: E402
+
+PROMPT = [{"role": "system", "content": "Ты — игрок в Бункер.\n" + "Аргументируй свою полезность. " * 40},
+          {"role": "user", "content": "Твой ход."}]
+
+
+def fd_count() -> int:
+    try:
+        return len(os.listdir(f"/proc/{os.getpid()}/fd"))
+    except OSError:
+        return -1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--max-open", type=int, default=64)
+    parser.add_argument("--leak-every", type=int, default=10, help="каждая N-я партия не закрывает логгер")
+    parser.add_argument("--fd-slack", type=int, default=8, help="допустимый рост дескрипторов после прогрева")
+    parser.add_argument("--heap-slack", type=float, default=0.5,
+                        help="допустимый рост памяти после прогрева (доля от базовой)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="log_soak_") as tmp:
+        os.chdir(tmp)
+        writer = LogWriter(max_open=args.max_open)
+        tracemalloc.start()
+        baseline_fds = None
+        baseline_heap = None
+        peak_open = 0
+
+        for i in range(1, args.games + 1):
+            logger = SessionLogger("Soak", f"S{i:05d}", "soak", writer=writer)
+            logger.log_event("TURN", f"game {i}", {"round": 1}, actor="bot1")
+            logger.log_llm("soak-model", PROMPT, '{"speech": "..."}', latency_ms=1.0, actor="bot1")
+            if i % args.leak_every:
+                logger.close()
+
+            if i % 500 == 0:
+                writer.flush()
+                peak_open = max(peak_open, writer.open_files())
+                fds = fd_count()
+                heap = tracemalloc.get_traced_memory()[0] // 1024
+                # Прогрев — первые 500 партий (пул файлов и кэши заполнены); дальше память и дескрипторы не растут
+                if baseline_fds is None: baseline_fds, baseline_heap = fds, heap
+                print(f"games {i:>6}: open log files {writer.open_files():>3}, fds {fds:>4}, heap {heap} KiB")
+                assert writer.open_files() <= args.max_open, f"pool exceeded max_open: {writer.open_files()}"
+                if fds >= 0:
+                    assert fds <= baseline_fds + args.fd_slack, f"fd leak: {baseline_fds} -> {fds}"
+                assert heap <= baseline_heap * (1 + args.heap_slack) + 256, f"heap grows: {baseline_heap} -> {heap} KiB"
+
+        writer.flush()
+        os.chdir(ROOT)
+
+    print(f"✅ {args.games} games: peak open log files {peak_open} (max {args.max_open}), fds and heap stable")
+
+
+if __name__ == "__main__":
+    main()
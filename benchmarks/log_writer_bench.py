@@ -0,0 +1,82 @@
+"""
+Бенчмарк логов сессии: сколько времени event loop тратит на логирование одного хода бота.
+
+Ход = 3 log_event + 1 log_llm с системным промптом ~6 КБ (как у ботов Бункера).
+Сравниваются:
+  - inline: запись прямо в вызывающем коде (json.dumps + write + flush, как до фонового потока)
+  - queued: SessionLogger + LogWriter (вызов только кладет запись в очередь)
+Время flush() в замер queued не входит — его платит поток записи, а не event loop.
+
+    python benchmarks/log_writer_bench.py --turns 2000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from src.core.logger import LogWriter, SessionLogger  # noqa: E402
+
+SYSTEM_PROMPT = "\n".join(f"Правило {i}: веди себя как выживший, аргументируй полезность для бункера." for i in range(80))
+
+
+def turn_payload(i: int):
+    prompt = [{"role": "system", "content": SYSTEM_PROMPT},
+              {"role": "user", "content": f"Раунд {i // 6 + 1}. Твой ход, игрок {i % 6}."}]
+    return prompt, f'{{"speech": "Я нужен бункеру, ход {i}", "intent": "NONE"}}'
+
+
+def bench_inline(folder: str, turns: int) -> float:
+    path = os.path.join(folder, "inline.jsonl")
+    spent = 0.0
+    with open(path, "a", encoding="utf-8") as f:
+        for i in range(turns):
+            prompt, response = turn_payload(i)
+            started = time.perf_counter()
+            for kind in ("TURN", "JUDGE", "VOTE"):
+                f.write(json.dumps({"ts": time.time(), "type": kind, "msg": f"{kind} {i}"}, ensure_ascii=False) + "\n")
+                f.flush()
+            f.write(json.dumps({"ts": time.time(), "type": "LLM", "prompt": prompt, "response": response},
+                               ensure_ascii=False) + "\n")
+            f.flush()
+            spent += time.perf_counter() - started
+    return spent
+
+
+def bench_queued(folder: str, turns: int) -> float:
+    writer = LogWriter()
+    os.chdir(folder)
+    logger = SessionLogger("Bench", "BENCH", "bench", writer=writer)
+    spent = 0.0
+    for i in range(turns):
+        prompt, response = turn_payload(i)
+        started = time.perf_counter()
+        for kind in ("TURN", "JUDGE", "VOTE"):
+            logger.log_event(kind, f"{kind} {i}")
+        logger.log_llm("bench-model", prompt, response, latency_ms=1.0, actor=f"bot{i % 6}")
+        spent += time.perf_counter() - started
+    logger.close()
+    writer.flush()
+    os.chdir(ROOT)
+    return spent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="log_bench_") as tmp:
+        inline = bench_inline(tmp, args.turns)
+        queued = bench_queued(tmp, args.turns)
+
+    print(f"inline: {inline / args.turns * 1e6:8.1f} µs/turn")
+    print(f"queued: {queued / args.turns * 1e6:8.1f} µs/turn  (x{inline / queued:.1f})")
+
+
+if __name__ == "__main__":
+    main()
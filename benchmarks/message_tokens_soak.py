@@ -0,0 +1,77 @@
+"""
+Soak-проверка MessageTokenStore: 10k партий подряд по 3 раунда, 1-4 человека за столом.
+На каждый ход — set/get токена хода и дашборда для каждого человека (как process_game_events).
+Каждая N-я партия не доходит до game_over (release не вызывается) — ее токены должны вытеснить
+LRU-лимиты; закончившие партии не оставляют ни одного токена.
+
+Проверяется, что число игр и токенов в хранилище ограничено лимитами, а память не растет.
+
+    python benchmarks/message_tokens_soak.py --games 10000
+"""
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from src.core.message_tokens import MessageTokenStore  # noqa: E402
+
+PHASES = ("presentation", "discussion", "voting")
+
+
+def play(store: MessageTokenStore, lobby_id: str, humans: list, message_ids) -> int:
+    misses = 0
+    for round_num in range(1, 4):
+        for phase in PHASES:
+            for turn in range(6):
+                token = f"turn_{round_num}_{phase}_{turn}"
+                for chat_id in humans:
+                    store.set(lobby_id, chat_id, token, next(message_ids))
+                    store.set(lobby_id, chat_id, f"dash_{chat_id}", next(message_ids))
+                    if store.get(lobby_id, chat_id, token) is None: misses += 1
+    return misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--abandon-every", type=int, default=20, help="каждая N-я партия не вызывает release")
+    parser.add_argument("--max-games", type=int, default=100)
+    parser.add_argument("--max-per-game", type=int, default=256)
+    args = parser.parse_args()
+
+    random.seed(0)
+    store = MessageTokenStore(max_per_game=args.max_per_game, max_games=args.max_games)
+    message_ids = iter(range(1, 10 ** 12))
+    tracemalloc.start()
+    heap_at_warmup = None
+    misses = 0
+
+    for i in range(1, args.games + 1):
+        lobby_id = f"G{i:05d}"
+        # Одни и те же люди играют много партий: chat_id пересекаются между играми
+        humans = random.sample(range(1000, 1100), random.randint(1, 4))
+        misses += play(store, lobby_id, humans, message_ids)
+        if i % args.abandon_every:
+            store.release(lobby_id)
+
+        if i % 1000 == 0:
+            heap = tracemalloc.get_traced_memory()[0] // 1024
+            # Прогрев — пока брошенные партии не заполнят лимит игр; дальше память расти не должна
+            if heap_at_warmup is None and store.games_count() >= args.max_games: heap_at_warmup = heap
+            print(f"games {i:>6}: live games {store.games_count():>4}, tokens {len(store):>6}, heap {heap} KiB")
+            assert store.games_count() <= args.max_games, f"too many games: {store.games_count()}"
+            assert len(store) <= args.max_games * args.max_per_game
+            if heap_at_warmup is not None:
+                assert heap <= heap_at_warmup * 1.2 + 256, f"heap grows: {heap_at_warmup} -> {heap} KiB"
+
+    assert misses == 0, f"{misses} fresh tokens were not found"
+    abandoned = args.games // args.abandon_every
+    print(f"✅ {args.games} games ({abandoned} abandoned): {store.games_count()} games / {len(store)} tokens left")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Бенчмарк воркеров игр: одни и те же партии в одном процессе (GAME_WORKERS=1) и в пуле из N процессов.
+
+LLM-провайдер подменен заглушкой: ответ приходит через --llm-latency секунд и перед этим занимает
+--llm-cpu-ms миллисекунд CPU (разбор ответа, токенизация — то, что в реальном клиенте держит GIL).
+Люди за столом не ходят — их ходы пропускаются, как по дедлайну хода.
+
+    python benchmarks/shard_bench.py --games 24 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from src.core.llm import LLMService  # noqa: E402
+
+# Параметры заглушки — через окружение: воркеры (spawn) заново импортируют этот модуль и читают их же
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", 0.05))
+LLM_CPU_MS = float(os.getenv("BENCH_LLM_CPU_MS", 5))
+FAKE_RESPONSE = json.dumps({"speech": "Я полезен бункеру.", "intent": "NONE", "vote": "", "violation_type": "none",
+                            "argument_quality": "weak", "comment": ""}, ensure_ascii=False)
+
+
+async def _fake_provider(self, provider, model_id, messages, temp, json_mode) -> str:
+    await asyncio.sleep(LLM_LATENCY)
+    deadline = time.perf_counter() + LLM_CPU_MS / 1000
+    while time.perf_counter() < deadline:
+        pass
+    return FAKE_RESPONSE
+
+
+LLMService._call_provider = _fake_provider
+
+
+async def play(game, human_id: int, max_steps: int, latencies: list) -> int:
+    """Прогон партии как в main.process_game_events: ходы ведущего/ботов по событиям, люди — пропуск"""
+    queue = list(await game.init_game([{"id": human_id, "name": f"Bench{human_id}"}]))
+    # Как start_solo_handler/start_lobby_game: после init ядро само запускает первый ход
+    queue.extend(await game.process_turn())
+    steps = 0
+    while steps < max_steps:
+        if not queue:
+            for pid in game.pending_humans():
+                queue.extend(await game.skip_turn(pid))
+            if not queue: break
+        event = queue.pop(0)
+        if event.type == "game_over": break
+        started = time.perf_counter()
+        if event.type == "switch_turn":
+            new_events = await game.process_turn()
+        elif event.type == "bot_think":
+            new_events = await game.execute_bot_turn(event.extra_data["bot_id"], event.token)
+        else:
+            continue
+        latencies.append(time.perf_counter() - started)
+        queue.extend(new_events)
+        steps += 1
+    game.release()
+    return steps
+
+
+async def run(game_type: str, games: int, workers: int, max_steps: int) -> dict:
+    from src.core.logger import log_writer
+    from src.core.registry import GameRegistry
+    from src.core.sharding import RemoteGame, ShardPool
+
+    GameRegistry.auto_discover()
+    game_cls = GameRegistry.get_game_class(game_type)
+    if not game_cls: raise SystemExit(f"Unknown game type: {game_type}")
+
+    pool = None
+    if workers > 1:
+        pool = ShardPool(workers)
+        pool.start()
+        watcher = asyncio.create_task(pool.watch())
+
+    def create(i: int):
+        lobby_id = f"BENCH{i:04d}"
+        if pool: return RemoteGame(pool, game_type, lobby_id=lobby_id, host_name="bench")
+        return game_cls(lobby_id=lobby_id, host_name="bench")
+
+    latencies = []
+    started = time.perf_counter()
+    try:
+        steps = await asyncio.gather(*[play(create(i), 10_000 + i, max_steps, latencies) for i in range(games)])
+    finally:
+        if pool:
+            watcher.cancel()
+            pool.stop()
+        # Логи дописываются до удаления временной папки
+        log_writer.flush()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "workers": workers,
+        "games": games,
+        "steps": sum(steps),
+        "seconds": round(elapsed, 2),
+        "steps_per_sec": round(sum(steps) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+    }
+
+
+def fmt(value) -> str:
+    return "-" if value is None else str(value)
+
+
+def main():
+    global LLM_LATENCY, LLM_CPU_MS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--game", default="bunker")
+    parser.add_argument("--games", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--max-steps", type=int, default=60, help="ходов ведущего/ботов на партию")
+    parser.add_argument("--llm-latency", type=float, default=LLM_LATENCY)
+    parser.add_argument("--llm-cpu-ms", type=float, default=LLM_CPU_MS)
+    args = parser.parse_args()
+
+    os.environ["BENCH_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ["BENCH_LLM_CPU_MS"] = str(args.llm_cpu_ms)
+    LLM_LATENCY, LLM_CPU_MS = args.llm_latency, args.llm_cpu_ms
+
+    # Логи сессий пишутся в ./Logs — уводим их во временную папку (воркеры наследуют cwd)
+    with tempfile.TemporaryDirectory(prefix="shard_bench_") as tmp:
+        os.chdir(tmp)
+        results = [asyncio.run(run(args.game, args.games, 1, args.max_steps))]
+        if args.workers > 1:
+            results.append(asyncio.run(run(args.game, args.games, args.workers, args.max_steps)))
+        os.chdir(ROOT)
+
+    print(f"\n{'workers':>8} {'games':>6} {'steps':>7} {'sec':>8} {'steps/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in results:
+        print(f"{r['workers']:>8} {r['games']:>6} {r['steps']:>7} {r['seconds']:>8} {r['steps_per_sec']:>9} "
+              f"{fmt(r['p50_ms']):>8} {fmt(r['p95_ms']):>8}")
+    if len(results) == 2 and results[0]["steps_per_sec"]:
+        print(f"\nspeedup x{results[1]['steps_per_sec'] / results[0]['steps_per_sec']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,51 @@
 import asyncio
+import hashlib
+import hmac
 import logging
 import os
 import sys
 import random
 import time
+from collections import OrderedDict
 from typing import Union
 
 print("🔍 DEBUG: SERVER STARTUP")
 
 from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher, Router, F
+from aiogram import Bot, Dispatcher, Router
 from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 
 from src.core.schemas import GameEvent
 from src.core.lobby import lobby_manager, Lobby
+from src.core.lobby_ui import LobbyUI, ROLE_HOST
+from src.core.logger import log_writer
 from src.core.s3 import s3_uploader
 from src.core.registry import GameRegistry
+from src.core.typing_indicator import TypingManager
+from src.core.message_tokens import MessageTokenStore
+from src.core.middlewares import ConcurrencyLimitMiddleware, UpdateDedupMiddleware, CallbackDedupMiddleware, \
+    RateLimitMiddleware
+from src.core.rate_limit import TokenBucket
+from src.core.timers import TimerWheel
+from src.core.turn_deadlines import TurnDeadlines
+from src.core.matchmaking import Matchmaker
+from src.core.sharding import ShardPool, RemoteGame
+from src.core.state_store import state_store, VersionConflict
+from src.core.snapshots import SnapshotManager
+from src.core.shutdown import ShutdownCoordinator
+from src.core.tasks import task_supervisor
+from src.core.metrics import metrics
+from src.core.outbox import Outbox
+from src.core.callbacks import CallbackRouter, callback_codec
+from src.core.sessions import SessionIndex
+from src.core.spectators import SpectatorFeed, parse_chat_id
 
 load_dotenv(os.path.join("Configs", ".env"))
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -32,14 +56,124 @@ if not BOT_TOKEN: sys.exit("Error: BOT_TOKEN is missing")
 raw_admin_id = os.getenv("ADMIN_ID")
 ADMIN_ID = int(raw_admin_id) if raw_admin_id else None
 
+# Webhook-режим включается, если задан публичный адрес (например https://app.koyeb.app)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет должен совпадать у всех реплик за балансировщиком, поэтому по умолчанию выводим его из токена
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32]
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", 32))
+# /metrics: токен для доступа через публичный порт и/или отдельный внутренний порт (без токена)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Сколько ходов ведущего/ботов (LLM-запросов) выполняется одновременно — отдельно от приема апдейтов
+GAME_WORK_CONCURRENCY = int(os.getenv("GAME_WORK_CONCURRENCY", 16))
+# Канал трансляции для зрителей по умолчанию (id или @username); хост может задать свой через /spectate
+SPECTATOR_CHANNEL_ID = parse_chat_id(os.getenv("SPECTATOR_CHANNEL_ID"))
+# Лимиты ввода людей: действий в минуту и "запас" подряд (на пользователя и на стол)
+RATE_USER_PER_MIN = float(os.getenv("RATE_USER_PER_MIN", 20))
+RATE_USER_BURST = int(os.getenv("RATE_USER_BURST", 5))
+RATE_LOBBY_PER_MIN = float(os.getenv("RATE_LOBBY_PER_MIN", 60))
+RATE_LOBBY_BURST = int(os.getenv("RATE_LOBBY_BURST", 15))
+if min(RATE_USER_PER_MIN, RATE_LOBBY_PER_MIN) <= 0 or min(RATE_USER_BURST, RATE_LOBBY_BURST) < 1:
+    sys.exit("Error: RATE_*_PER_MIN must be > 0 and RATE_*_BURST >= 1")
+# Сколько комнат на одной странице "Найти лобби"
+LOBBY_PAGE_SIZE = int(os.getenv("LOBBY_PAGE_SIZE", 8))
+# Лобби без активности закрывается через столько секунд
+LOBBY_TTL = float(os.getenv("LOBBY_TTL", 300))
+# Окно склейки обновлений меню лобби (секунд): пачка входов/выходов — одна правка на участника
+LOBBY_UI_DEBOUNCE = float(os.getenv("LOBBY_UI_DEBOUNCE", 0.5))
+# Коды лобби: освобожденный код не выдается повторно столько секунд; при заполнении кодов длины L
+# больше чем на LOBBY_ID_GROW_AT коды становятся на букву длиннее
+LOBBY_ID_QUARANTINE = float(os.getenv("LOBBY_ID_QUARANTINE", 600))
+LOBBY_ID_GROW_AT = float(os.getenv("LOBBY_ID_GROW_AT", 0.5))
+# Дедлайн хода человека (0 = ждать вечно), предупреждение за N секунд, замена на AI после N пропусков подряд
+TURN_TIMEOUT = float(os.getenv("TURN_TIMEOUT", 120))
+TURN_WARNING = float(os.getenv("TURN_WARNING", 30))
+AFK_SUBSTITUTE_AFTER = int(os.getenv("AFK_SUBSTITUTE_AFTER", 2))
+# Игра без прогресса и без ввода столько секунд закрывается
+GAME_IDLE_TIMEOUT = float(os.getenv("GAME_IDLE_TIMEOUT", 1800))
+# Быстрая игра: людей за столом и сколько максимум ждать набора (секунд)
+QUICK_MATCH_SIZE = int(os.getenv("QUICK_MATCH_SIZE", 4))
+QUICK_MATCH_WAIT = float(os.getenv("QUICK_MATCH_WAIT", 45))
+# Окно склейки записей игры в общий StateStore (сек.) и сколько помнить, что пользователь не в игре
+PERSIST_DELAY = float(os.getenv("PERSIST_DELAY", 0.2))
+GAME_MISS_TTL = float(os.getenv("GAME_MISS_TTL", 3))
+GAME_MISS_CACHE = int(os.getenv("GAME_MISS_CACHE", 10000))
+# Число процессов-воркеров с играми (0/1 = все игры в основном процессе)
+GAME_WORKERS = int(os.getenv("GAME_WORKERS", 0))
+# Сколько ждать ответа воркера на один вызов игры (секунд): ход с цепочкой LLM-запросов бывает долгим
+GAME_WORKER_TIMEOUT = float(os.getenv("GAME_WORKER_TIMEOUT", 300))
+
 bot = Bot(token=BOT_TOKEN, session=AiohttpSession(), default=DefaultBotProperties(parse_mode="HTML"))
 dp = Dispatcher()
+updates_limiter = ConcurrencyLimitMiddleware(UPDATES_CONCURRENCY)
+game_work = asyncio.Semaphore(GAME_WORK_CONCURRENCY)
+# Дубли отсекаются до лимитера, чтобы не занимать его слоты
+dp.update.outer_middleware(UpdateDedupMiddleware())
+dp.update.outer_middleware(updates_limiter)
 router = Router()
 dp.include_router(router)
+callbacks = CallbackRouter(callback_codec)
+pack = callback_codec.pack
 
 active_games = {}
 dashboard_map = {}
-message_tokens = {}
+# lobby_id -> id группового чата (групповой режим игры)
+group_chats = {}
+message_tokens = MessageTokenStore()
+sessions = SessionIndex()
+# Отложенная запись игр в общий StateStore и кэш промахов resolve_game (chat_id -> время промаха)
+_persist_dirty = set()
+_persist_tasks = {}
+_game_misses = OrderedDict()
+# Кэш страниц списка комнат: (game_type, cursor) -> (версия каталога, клавиатура)
+lobby_pages = {}
+
+
+# Команды, которые двигают игру (ход, LLM-вызов судьи): лимитируются наравне с вводом в игру
+GAME_COMMANDS = {"skip", "fake_say", "kick", "vote_as"}
+
+
+def is_game_input(event) -> bool:
+    """Ввод в игру — текст в чате, игровые команды и кнопки действий игр: только он лимитируется и склеивается"""
+    if isinstance(event, CallbackQuery):
+        return not callbacks.is_core(event.data)
+    text = event.text or ""
+    if not text.startswith("/"): return True
+    command = text[1:].split(maxsplit=1)[0].split("@")[0].lower() if len(text) > 1 else ""
+    return command in GAME_COMMANDS
+
+
+dp.callback_query.outer_middleware(CallbackDedupMiddleware(float(os.getenv("CALLBACK_DEDUP_TTL", 2)),
+                                                          applies=is_game_input))
+rate_limiter = RateLimitMiddleware(
+    user_bucket=TokenBucket(RATE_USER_PER_MIN / 60, RATE_USER_BURST),
+    lobby_bucket=TokenBucket(RATE_LOBBY_PER_MIN / 60, RATE_LOBBY_BURST),
+    resolve_lobby=sessions.get,
+    applies=is_game_input
+)
+router.message.middleware(rate_limiter)
+router.callback_query.middleware(rate_limiter)
+timer_wheel = TimerWheel()
+matchmaker = Matchmaker(timer_wheel, size=QUICK_MATCH_SIZE, max_wait=QUICK_MATCH_WAIT)
+turn_deadlines = TurnDeadlines(timer_wheel, timeout=TURN_TIMEOUT, warning=TURN_WARNING, idle_timeout=GAME_IDLE_TIMEOUT)
+typing_manager = TypingManager(bot.send_chat_action)
+shard_pool = ShardPool(GAME_WORKERS, timeout=GAME_WORKER_TIMEOUT) if GAME_WORKERS > 1 else None
+snapshot_manager = SnapshotManager(os.getenv("SNAPSHOT_DIR", "Snapshots"),
+                                   interval=float(os.getenv("SNAPSHOT_INTERVAL", 15)))
+spectator_feed = SpectatorFeed(bot.send_message, default_chat=SPECTATOR_CHANNEL_ID,
+                               window=float(os.getenv("SPECTATOR_WINDOW", 3)))
+shutdown = ShutdownCoordinator(task_supervisor, deadline=float(os.getenv("SHUTDOWN_DEADLINE", 20)))
+metrics.gauge("bot_active_games", lambda: len(active_games))
+metrics.gauge("bot_lobbies", lambda: len(lobby_manager.lobbies))
+metrics.gauge("bot_lobby_id_utilization", lambda: lobby_manager.ids.utilization())
+metrics.gauge("bot_typing_indicators", typing_manager.active_count)
+metrics.gauge("bot_sessions", lambda: len(sessions))
+metrics.gauge("bot_timers", lambda: len(timer_wheel))
+metrics.gauge("bot_quick_match_waiting", lambda: len(matchmaker))
+metrics.gauge("bot_session_log_files", log_writer.open_files)
+metrics.gauge("bot_session_log_queue", log_writer.pending)
 
 
 # === WEB SERVER ===
@@ -47,89 +181,348 @@ message_tokens = {}
 async def health_check(request): return web.Response(text="Bot is alive")
 
 
-async def start_web_server():
-    app = web.Application()
+async def metrics_handler(request):
+    """
+    /metrics не публичный: доступ по METRICS_TOKEN (Authorization: Bearer <токен> или ?token=)
+    или через внутренний порт METRICS_PORT. Без обоих настроек эндпоинт выключен.
+    """
+    sockname = request.transport.get_extra_info("sockname") if request.transport else None
+    internal = METRICS_PORT and sockname and sockname[1] == METRICS_PORT
+    if not internal:
+        if not METRICS_TOKEN:
+            raise web.HTTPNotFound()
+        auth = request.headers.get("Authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else request.query.get("token", "")
+        if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            raise web.HTTPUnauthorized(headers={"WWW-Authenticate": "Bearer"})
+    return web.Response(text=metrics.render())
+
+
+@web.middleware
+async def reject_when_stopping(request, handler):
+    # Во время остановки не берем новые апдейты: Telegram повторит доставку на живую реплику
+    if shutdown.stopping and request.path == WEBHOOK_PATH:
+        return web.Response(status=503, text="Shutting down")
+    return await handler(request)
+
+
+async def start_web_server() -> web.AppRunner:
+    app = web.Application(middlewares=[reject_when_stopping])
     app.router.add_get('/', health_check)
+    app.router.add_get('/metrics', metrics_handler)
+
+    if WEBHOOK_URL:
+        # Отвечаем Telegram сразу, апдейт обрабатывается в фоне (с лимитом UPDATES_CONCURRENCY)
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=WEBHOOK_SECRET,
+            handle_in_background=True
+        ).register(app, path=WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+
     runner = web.AppRunner(app)
     await runner.setup()
     port = int(os.getenv("PORT", 8000))
     site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
     print(f"🌍 Web server started on port {port}")
+    if METRICS_PORT:
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        print(f"📈 Metrics on {METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
+
+
+# === LOBBY EXPIRY ===
+
+def arm_lobby_expiry(lobby: Lobby):
+    """Таймер авто-закрытия лобби. touch() таймер не трогает: перенос делается лениво при срабатывании."""
+    delay = LOBBY_TTL - (time.time() - lobby.last_activity)
+    timer_wheel.schedule(("lobby", lobby.lobby_id), max(1.0, delay),
+                         lambda: expire_lobby(lobby.lobby_id), owner_key=lobby.lobby_id)
+
+
+async def expire_lobby(lobby_id: str):
+    lobby = lobby_manager.lobbies.get(lobby_id)
+    if not lobby or lobby.status != "waiting": return
+
+    if time.time() - lobby.last_activity < LOBBY_TTL:
+        # Была активность — переносим на остаток
+        arm_lobby_expiry(lobby)
+        return
+
+    logging.info(f"♻️ Cleaning up inactive lobby {lobby_id}")
+    metrics.inc("bot_lobbies_expired_total")
+    edits = [
+        bot.edit_message_text(chat_id=uid, message_id=msg_id, text="⌛ <b>Время истекло.</b> Лобби закрыто.",
+                              reply_markup=None)
+        for uid, msg_id in lobby.user_interfaces.items() if uid > 0
+    ]
+    await asyncio.gather(*edits, return_exceptions=True)
+    lobby_manager.delete_lobby(lobby_id)
+
+
+lobby_manager.on_cached = arm_lobby_expiry
+lobby_manager.ids.quarantine = LOBBY_ID_QUARANTINE
+lobby_manager.ids.grow_at = LOBBY_ID_GROW_AT
+
+
+# === GAME FACTORY ===
+
+def create_game(game_type: str, lobby_id: str, host_name: str):
+    """Создает игру локально или в процессе-воркере (режим GAME_WORKERS > 1)"""
+    game_cls = GameRegistry.get_game_class(game_type)
+    if not game_cls: return None
+    if shard_pool:
+        return RemoteGame(shard_pool, game_type, lobby_id=lobby_id, host_name=host_name)
+    return game_cls(lobby_id=lobby_id, host_name=host_name)
+
+
+def persist_game(game):
+    """
+    Помечает игру к сохранению в общий StateStore. Запись отложена на PERSIST_DELAY:
+    пачка событий вместе с вложенными ходами ботов — один dump и одна запись (в потоке, вне event loop).
+    Хранилище в памяти процесса общим не является — туда игры не пишутся вовсе.
+    """
+    if not state_store.shared: return
+    lid = game.lobby_id
+    _persist_dirty.add(lid)
+    if lid not in _persist_tasks:
+        _persist_tasks[lid] = task_supervisor.spawn(_persist_later(game), owner="game", key=lid, name="persist")
 
 
-async def cleanup_lobbies_task():
-    while True:
-        await asyncio.sleep(60)
+async def _persist_later(game):
+    lid = game.lobby_id
+    try:
+        while lid in _persist_dirty:
+            await asyncio.sleep(PERSIST_DELAY)
+            _persist_dirty.discard(lid)
+            if active_games.get(lid) is not game: return
+            record = {"game_type": game.game_type, "data": game.dump_state()}
+            try:
+                game.store_version = await asyncio.to_thread(state_store.put, "game", lid, record,
+                                                             expected_version=game.store_version)
+            except VersionConflict as e:
+                logging.warning(f"Game {lid} changed elsewhere ({e}). Dropping local copy.")
+                drop_stale_game(game)
+                return
+            if active_games.get(lid) is not game:
+                # game_over успел удалить запись, пока шла запись в потоке
+                state_store.delete("game", lid)
+                return
+    finally:
+        _persist_tasks.pop(lid, None)
+
+
+def forget_persist(lobby_id: str):
+    # Задачу не отменяем: запись в потоке не прервать, задача сама увидит, что игры больше нет, и уберет запись
+    _persist_dirty.discard(lobby_id)
+
+
+def drop_stale_game(game):
+    """Локальная копия отстала от общего StateStore: ее место займет свежая загрузка"""
+    if active_games.get(game.lobby_id) is game:
+        del active_games[game.lobby_id]
+        sessions.release(game.lobby_id)
+        turn_deadlines.release(game.lobby_id)
+        game.release()
+
+
+def fresh_game(game):
+    """
+    Проверка версии перед тем, как менять игру: если другая реплика уже записала новее,
+    действие применяется к свежей копии из StateStore (или игра закончилась там — None).
+    """
+    if not state_store.shared or game.lobby_id in _persist_tasks: return game
+    version = state_store.version("game", game.lobby_id)
+    if version == game.store_version: return game
+    metrics.inc("bot_stale_games_total")
+    drop_stale_game(game)
+    return load_game(game.lobby_id) if version else None
+
+
+def bind_session(game):
+    """Индексирует людей (и группу) игры: дальше сообщение находит игру одним поиском в словаре"""
+    chat_ids = [p.id for p in game.players if p.is_human and p.id > 0]
+    if game.lobby_id in group_chats: chat_ids.append(group_chats[game.lobby_id])
+    sessions.bind(game.lobby_id, chat_ids)
+    for chat_id in chat_ids:
+        _game_misses.pop(chat_id, None)
+
+
+def load_game(lobby_id: str):
+    """Поднимает игру из StateStore (например, созданную другой репликой)"""
+    record = state_store.get("game", lobby_id)
+    if not record: return None
+    data, version = record
+    game = create_game(data["game_type"], lobby_id=lobby_id, host_name=data["data"]["host_name"])
+    if not game: return None
+    game.load_state(data["data"])
+    game.store_version = version
+    active_games[lobby_id] = game
+    bind_session(game)
+    return game
+
+
+def resolve_lobby_id(chat_id: int):
+    """Соло-игра идет по id чата, сетевая — по привязке пользователя или группы"""
+    if str(chat_id) in active_games: return str(chat_id)
+    if chat_id < 0: return lobby_manager.find_chat_lobby(chat_id)
+    return lobby_manager.find_user_lobby(chat_id)
+
+
+def resolve_game(chat_id: int):
+    lid = sessions.get(chat_id)
+    game = active_games.get(lid) if lid else None
+    if game: return fresh_game(game)
+    # Недавний промах: пользователь не в игре — в StateStore не ходим до истечения GAME_MISS_TTL
+    missed_at = _game_misses.get(chat_id)
+    if missed_at and time.monotonic() - missed_at < GAME_MISS_TTL: return None
+    # Промах индекса: игра другой реплики (StateStore) или еще не проиндексированная
+    lid = resolve_lobby_id(chat_id) or str(chat_id)
+    game = active_games.get(lid) or load_game(lid)
+    if game: return fresh_game(game)
+    _game_misses[chat_id] = time.monotonic()
+    _game_misses.move_to_end(chat_id)
+    while len(_game_misses) > GAME_MISS_CACHE:
+        _game_misses.popitem(last=False)
+    return None
+
+
+async def restore_games():
+    """Warm restart: поднимаем игры из снапшотов и продолжаем текущие ходы"""
+    restored = []
+    for lid, record in snapshot_manager.load_all():
         try:
-            now = time.time()
-            for lid, lobby in list(lobby_manager.lobbies.items()):
-                if lobby.status == "waiting" and (now - lobby.last_activity > 300):
-                    logging.info(f"♻️ Cleaning up inactive lobby {lid}")
-                    for uid, msg_id in lobby.user_interfaces.items():
-                        try:
-                            await bot.edit_message_text(
-                                chat_id=uid,
-                                message_id=msg_id,
-                                text="⌛ <b>Время истекло.</b> Лобби закрыто.",
-                                reply_markup=None
-                            )
-                        except:
-                            pass
-                    lobby_manager.delete_lobby(lid)
+            data = record["data"]
+            game = create_game(record["game_type"], lobby_id=lid, host_name=data["host_name"])
+            if not game: continue
+            # Персистентный store пишется после каждой пачки событий, снапшот — раз в интервал:
+            # если запись игры пережила рестарт, она свежее снапшота, и версия берется из нее
+            stored = state_store.get("game", lid)
+            if stored:
+                game.load_state(stored[0]["data"])
+                game.store_version = stored[1]
+            else:
+                game.load_state(data)
+                game.store_version = state_store.put("game", lid, {"game_type": record["game_type"], "data": data})
+            active_games[lid] = game
+            if record["extra"].get("dashboard"):
+                dashboard_map[lid] = dict(record["extra"]["dashboard"])
+            if record["extra"].get("group_chat"):
+                group_chats[lid] = record["extra"]["group_chat"]
+            spectator_feed.attach(lid, record["extra"].get("spectators"), title=record["extra"].get("spectators_title", ""))
+            bind_session(game)
+            # Для сетевых игр восстанавливаем привязку людей (и группы) к лобби
+            if not lid.lstrip("-").isdigit():
+                humans = [p.id for p in game.players if p.is_human and p.id > 0]
+                lobby_manager.rebind(lid, humans, group_chats.get(lid))
+            game.logger.log_event("RESTORED", f"Game restored from snapshot (round {game.state.round}, {game.state.phase})")
+            restored.append(game)
         except Exception as e:
-            logging.error(f"Cleanup error: {e}")
+            logging.error(f"Restore failed for {lid}: {e}")
+
+    for game in restored:
+        task_supervisor.spawn(resume_game(game), owner="game", key=game.lobby_id, name="resume")
+    if restored:
+        print(f"♻️ Restored {len(restored)} games from snapshots")
+
+
+async def resume_game(game):
+    notice = GameEvent(type="message", content="♻️ <b>Сервер перезапущен.</b> Игра продолжается.")
+    await process_game_events(game.lobby_id, [notice])
+    await process_game_events(game.lobby_id, await game.resume())
 
 
 # === UI HELPERS ===
 
-async def broadcast_lobby_ui(lobby: Lobby):
+def render_lobby_text(lobby: Lobby) -> str:
     game_name = GameRegistry.get_all_games().get(lobby.game_type, lobby.game_type)
-    current_humans = len(lobby.players)
-
     text = (
         f"🚪 <b>ЛОББИ: {lobby.lobby_id}</b>\n"
         f"Игра: <b>{game_name}</b>\n"
         f"Статус: Ожидание игроков...\n\n"
-        f"👥 <b>Игроки ({current_humans}):</b>\n"
+        f"👥 <b>Игроки ({len(lobby.players)}):</b>\n"
         f"{lobby.get_players_list_text()}\n"
         f"<i>Недостающие места займет AI</i>"
     )
+    if lobby.spectator_chat:
+        text += f"\n🎥 Трансляция для зрителей: {lobby.spectator_chat}"
+    if lobby.group_chat_id:
+        text += "\n\n💬 Общие события игры пойдут в привязанную группу, личное — сюда."
+    else:
+        text += f"\n\n💬 Играть в группе: добавьте бота в чат и отправьте там <code>/bind {lobby.lobby_id}</code>"
+    return text
 
-    dead_users = []
-    for user_id, message_id in lobby.user_interfaces.items():
-        if user_id < 0: continue
 
-        kb = InlineKeyboardBuilder()
-        if user_id == lobby.host_id:
-            kb.add(InlineKeyboardButton(text="🚀 СТАРТ", callback_data=f"lobby_start_{lobby.lobby_id}"))
-            kb.add(InlineKeyboardButton(text="🚪 Закрыть лобби", callback_data="lobby_leave"))
-            kb.adjust(1)
-        else:
-            kb.add(InlineKeyboardButton(text="🚪 Выйти", callback_data="lobby_leave"))
+def render_lobby_keyboard(lobby: Lobby, role: str):
+    kb = InlineKeyboardBuilder()
+    if role == ROLE_HOST:
+        kb.add(InlineKeyboardButton(text="🚀 СТАРТ", callback_data=pack("lobby_start", lobby.lobby_id)))
+        kb.add(InlineKeyboardButton(text="🚪 Закрыть лобби", callback_data=pack("lobby_leave")))
+        kb.adjust(1)
+    else:
+        kb.add(InlineKeyboardButton(text="🚪 Выйти", callback_data=pack("lobby_leave")))
+    return kb.as_markup()
+
+
+def drop_dead_lobby_users(lobby: Lobby, user_ids: list):
+    """Участники, заблокировавшие бота, выходят из лобби"""
+    for uid in user_ids:
+        lobby_manager.leave_lobby(uid)
+    return lobby_manager.lobbies.get(lobby.lobby_id)
 
-        try:
-            await bot.edit_message_text(chat_id=user_id, message_id=message_id, text=text, reply_markup=kb.as_markup())
-        except TelegramForbiddenError:
-            dead_users.append(user_id)
-        except Exception:
-            pass
 
-    if dead_users:
-        for uid in dead_users:
-            lobby_manager.leave_lobby(uid)
-        if len(lobby.players) > 0:
-            asyncio.create_task(broadcast_lobby_ui(lobby))
+lobby_ui = LobbyUI(bot.edit_message_text, lobby_manager.get_lobby, render_lobby_text, render_lobby_keyboard,
+                   delay=LOBBY_UI_DEBOUNCE)
+lobby_ui.on_dead = drop_dead_lobby_users
+lobby_manager.on_deleted = lobby_ui.forget
 
 
 # === EVENT PROCESSOR (ROUTING) ===
 
+def delivery_targets(game, event: GameEvent) -> list:
+    """
+    Получатели события. В групповом режиме публичное (без target_ids или с extra_data["public"])
+    уходит одним сообщением в группу, адресное (досье, инвентарь, голосование) — в ЛС.
+    """
+    group_id = group_chats.get(game.lobby_id)
+    if group_id and (not event.target_ids or event.extra_data.get("public")):
+        return [group_id]
+    return event.target_ids if event.target_ids else [p.id for p in game.players if p.is_human]
+
+
+def is_plain_message(event: GameEvent) -> bool:
+    """Текст без токена, клавиатуры и дашборда — такие можно склеивать"""
+    return (event.type == "message" and not event.token and not event.reply_markup
+            and not event.extra_data.get("is_dashboard"))
+
+
+def mirror_to_spectators(game, event: GameEvent):
+    """
+    Публичное — в трансляцию. Заглушки "печатает..." (с токеном) пропускаем:
+    зрители получат уже готовую реплику из edit_message.
+    """
+    if event.type == "message":
+        is_public = not event.target_ids or event.extra_data.get("public")
+        if is_public and not event.token and not event.extra_data.get("is_dashboard"):
+            spectator_feed.publish(game.lobby_id, event.content)
+    elif event.type == "edit_message" and not event.target_ids:
+        spectator_feed.publish(game.lobby_id, event.content)
+    elif event.type == "game_over":
+        spectator_feed.publish(game.lobby_id, f"🏁 <b>GAME OVER</b>\n{event.content}")
+
+
 async def process_game_events(context_id: str, events: list[GameEvent]):
     if not events: return
     game = active_games.get(context_id)
     if not game: return
 
     should_delete_game = False
+    group_id = group_chats.get(game.lobby_id)
+    outbox = Outbox()
+    # Ходы ведущего и ботов (LLM) — после пачки, отдельной задачей (см. run_turn_chain)
+    chained = []
 
     # Хелпер для логирования в игру
     def log_net(event_type: str, msg: str, details: dict = None):
@@ -138,23 +531,35 @@ async def process_game_events(context_id: str, events: list[GameEvent]):
         else:
             print(f"[{event_type}] {msg}")
 
+    async def flush_outbox():
+        for tid, text in outbox.drain():
+            try:
+                await bot.send_message(chat_id=tid, text=text)
+            except TelegramForbiddenError:
+                log_net("NET_BLOCK", f"User {tid} blocked bot. Marking as dead.")
+            except Exception as e:
+                log_net("NET_ERROR", f"Send to {tid} failed: {e}")
+
     for event in events:
         try:
             if event.type == "game_over":
                 should_delete_game = True
+            mirror_to_spectators(game, event)
 
-            if event.type in ["message", "bot_think"]:
-                targets = [p.id for p in game.players if p.is_human and p.is_alive]
-                for tid in targets:
-                    if tid > 0:
-                        try:
-                            await bot.send_chat_action(tid, "typing")
-                        except:
-                            pass
+            # Простой текст копим: подряд идущие сообщения одному получателю уйдут одним
+            if is_plain_message(event):
+                for tid in delivery_targets(game, event):
+                    if tid > 0 or tid == group_id:
+                        outbox.add(tid, event.content)
+                    elif tid <= -50000 and ADMIN_ID:
+                        outbox.add(ADMIN_ID, f"🔧 <b>[To Fake {tid}]</b>:\n{event.content}")
+                continue
+            if outbox and event.type != "callback_answer":
+                await flush_outbox()
 
             # --- ОТПРАВКА СООБЩЕНИЙ ---
             if event.type == "message":
-                targets = event.target_ids if event.target_ids else [p.id for p in game.players if p.is_human]
+                targets = delivery_targets(game, event)
                 kb = None
                 if event.reply_markup:
                     builder = InlineKeyboardBuilder()
@@ -164,7 +569,7 @@ async def process_game_events(context_id: str, events: list[GameEvent]):
                     kb = builder.as_markup()
 
                 for tid in targets:
-                    if tid > 0:
+                    if tid > 0 or tid == group_id:
                         try:
                             sent_msg = await bot.send_message(chat_id=tid, text=event.content, reply_markup=kb)
 
@@ -180,7 +585,7 @@ async def process_game_events(context_id: str, events: list[GameEvent]):
                                     pass
 
                             if event.token:
-                                message_tokens[f"{tid}:{event.token}"] = sent_msg.message_id
+                                message_tokens.set(game.lobby_id, tid, event.token, sent_msg.message_id)
 
                         except TelegramForbiddenError:
                             log_net("NET_BLOCK", f"User {tid} blocked bot. Marking as dead.")
@@ -198,10 +603,10 @@ async def process_game_events(context_id: str, events: list[GameEvent]):
 
             # --- РЕДАКТИРОВАНИЕ СООБЩЕНИЙ ---
             elif event.type == "edit_message":
-                targets = event.target_ids if event.target_ids else [p.id for p in game.players if p.is_human]
+                targets = delivery_targets(game, event)
                 for tid in targets:
-                    if tid < 0: continue
-                    msg_id = message_tokens.get(f"{tid}:{event.token}")
+                    if tid < 0 and tid != group_id: continue
+                    msg_id = message_tokens.get(game.lobby_id, tid, event.token) if event.token else None
 
                     if msg_id:
                         try:
@@ -216,7 +621,7 @@ async def process_game_events(context_id: str, events: list[GameEvent]):
                                 # FALLBACK: Отправляем новое, если старое нельзя редактировать
                                 try:
                                     sent_msg = await bot.send_message(chat_id=tid, text=event.content)
-                                    message_tokens[f"{tid}:{event.token}"] = sent_msg.message_id  # Обновляем токен
+                                    message_tokens.set(game.lobby_id, tid, event.token, sent_msg.message_id)  # Обновляем токен
                                 except Exception as e2:
                                     log_net("NET_FALLBACK_FAIL", f"Fallback send failed for {tid}: {e2}")
                         except Exception as e:
@@ -226,7 +631,7 @@ async def process_game_events(context_id: str, events: list[GameEvent]):
                         try:
                             sent_msg = await bot.send_message(chat_id=tid, text=event.content)
                             if event.token:
-                                message_tokens[f"{tid}:{event.token}"] = sent_msg.message_id
+                                message_tokens.set(game.lobby_id, tid, event.token, sent_msg.message_id)
                         except Exception as e:
                             log_net("NET_ERROR", f"Send (no token) failed for {tid}: {e}")
 
@@ -247,36 +652,128 @@ async def process_game_events(context_id: str, events: list[GameEvent]):
                         pass
 
             elif event.type == "game_over":
-                targets = [p.id for p in game.players if p.is_human]
+                targets = [group_id] if group_id else [p.id for p in game.players if p.is_human]
                 for tid in targets:
-                    if tid > 0:
+                    if tid > 0 or tid == group_id:
                         try:
                             await bot.send_message(tid, f"🏁 <b>GAME OVER</b>\n{event.content}")
                         except:
                             pass
 
                 if hasattr(game, "logger") and game.logger:
-                    local_path = game.logger.get_session_path()
-                    s3_path = game.logger.get_s3_target_path()
-                    asyncio.create_task(asyncio.to_thread(s3_uploader.upload_session_folder, local_path, s3_path, True))
-
-            elif event.type == "switch_turn":
-                await asyncio.sleep(0.5)
-                new_events = await game.process_turn()
-                await process_game_events(game.lobby_id, new_events)
+                    task_supervisor.spawn(upload_session_logs(game.logger, delete_after=True),
+                                          owner="game", key=game.lobby_id, name="s3_upload")
 
-            elif event.type == "bot_think":
-                bot_events = await game.execute_bot_turn(event.extra_data["bot_id"], event.token)
-                await process_game_events(game.lobby_id, bot_events)
+            elif event.type in ("switch_turn", "bot_think"):
+                # При остановке новые ходы не начинаем: снапшот продолжит игру после рестарта
+                if shutdown.stopping: continue
+                chained.append(event)
 
         except Exception as e:
             logging.error(f"Global Event Error ({event.type}): {e}")
             log_net("CRITICAL", f"Event processing crashed: {e}")
 
+    if outbox:
+        await flush_outbox()
+    if outbox.merged:
+        metrics.inc("bot_messages_merged_total", outbox.merged)
+
     if should_delete_game:
         if game.lobby_id in active_games: del active_games[game.lobby_id]
+        sessions.release(game.lobby_id)
+        turn_deadlines.release(game.lobby_id)
+        forget_persist(game.lobby_id)
+        state_store.delete("game", game.lobby_id)
+        snapshot_manager.remove(game.lobby_id)
+        game.release()
         if game.lobby_id in dashboard_map: del dashboard_map[game.lobby_id]
+        group_chats.pop(game.lobby_id, None)
+        spectator_feed.close(game.lobby_id)
+        message_tokens.release(game.lobby_id)
         lobby_manager.delete_lobby(game.lobby_id)
+    elif active_games.get(game.lobby_id) is game:
+        if chained:
+            task_supervisor.spawn(run_turn_chain(game, chained), owner="turns", key=game.lobby_id, name="turn_chain")
+        persist_game(game)
+        turn_deadlines.arm(game)
+        snapshot_manager.mark_dirty(game, extra={"dashboard": dict(dashboard_map.get(game.lobby_id, {})),
+                                                 "group_chat": group_id,
+                                                 "spectators": spectator_feed.channel(game.lobby_id),
+                                                 "spectators_title": spectator_feed.title(game.lobby_id)})
+
+
+async def run_turn_chain(game, events: list[GameEvent]):
+    """
+    Цепочка ходов ведущего и ботов вне обработки апдейта: слот UPDATES_CONCURRENCY освобождается сразу,
+    а сами LLM-вызовы ограничены своим лимитом GAME_WORK_CONCURRENCY. Цепочки одной игры идут по очереди.
+    """
+    for event in events:
+        if shutdown.stopping or active_games.get(game.lobby_id) is not game: return
+        try:
+            if event.type == "switch_turn":
+                await asyncio.sleep(0.5)
+                async with game_work:
+                    new_events = await game.process_turn()
+            else:
+                # Индикатор "печатает..." держится всю генерацию, а не гаснет через 5 секунд
+                group_id = group_chats.get(game.lobby_id)
+                if group_id:
+                    watchers = [group_id]
+                else:
+                    watchers = [p.id for p in game.players if p.is_human and p.is_alive and p.id > 0]
+                typing_manager.start(watchers)
+                try:
+                    async with game_work:
+                        new_events = await game.execute_bot_turn(event.extra_data["bot_id"], event.token)
+                finally:
+                    typing_manager.stop(watchers)
+        except Exception as e:
+            logging.error(f"Turn chain error ({event.type}) in {game.lobby_id}: {e}")
+            continue
+        await process_game_events(game.lobby_id, new_events)
+
+
+# === TURN DEADLINES ===
+
+async def on_turn_warning(lobby_id: str, player_ids: list):
+    if shutdown.stopping or lobby_id not in active_games: return
+    notice = GameEvent(type="message", target_ids=player_ids,
+                       content=f"⏰ Осталось {int(TURN_WARNING)} сек. — потом ход будет пропущен.")
+    await process_game_events(lobby_id, [notice])
+
+
+async def on_turn_expired(lobby_id: str, player_ids: list):
+    """Дедлайн хода: пропуск (или голос за игрока), после AFK_SUBSTITUTE_AFTER пропусков подряд — замена на AI"""
+    game = active_games.get(lobby_id)
+    if shutdown.stopping or not game: return
+    game = fresh_game(game)
+    if not game: return
+
+    events = []
+    for pid in player_ids:
+        if pid not in game.pending_humans(): continue
+        metrics.inc("bot_turn_timeouts_total")
+        events.extend(await game.skip_turn(pid))
+        if turn_deadlines.miss(lobby_id, pid) >= AFK_SUBSTITUTE_AFTER:
+            events.extend(await game.substitute_bot(pid))
+            sessions.unbind(pid)
+            metrics.inc("bot_afk_substitutions_total")
+
+    if not any(p.is_human for p in game.players):
+        events.append(GameEvent(type="game_over", content="💤 Все игроки ушли в AFK. Игра окончена."))
+    await process_game_events(lobby_id, events)
+
+
+async def on_game_idle(lobby_id: str):
+    if shutdown.stopping or lobby_id not in active_games: return
+    logging.info(f"♻️ Reaping idle game {lobby_id}")
+    metrics.inc("bot_idle_games_reaped_total")
+    await process_game_events(lobby_id, [GameEvent(type="game_over", content="⌛ Игра закрыта: слишком долго не было активности.")])
+
+
+turn_deadlines.on_warning = on_turn_warning
+turn_deadlines.on_expire = on_turn_expired
+turn_deadlines.on_idle = on_game_idle
 
 
 # === COMMANDS ===
@@ -287,24 +784,19 @@ async def cmd_send_logs(message: Message):
     user_id = message.from_user.id
     if not ADMIN_ID or user_id != ADMIN_ID: return
 
-    lid = lobby_manager.user_to_lobby.get(user_id)
-    if not lid and str(user_id) in active_games:
-        lid = str(user_id)
-
-    if not lid or lid not in active_games:
+    game = resolve_game(user_id)
+    if not game:
         await message.reply("⚠️ Нет активной игры.")
         return
 
-    game = active_games[lid]
     if not hasattr(game, "logger") or not game.logger:
         await message.reply("⚠️ Нет логгера.")
         return
 
-    local_path = game.logger.get_session_path()
     s3_path = game.logger.get_s3_target_path()
 
     await message.reply("⏳ Выгрузка...")
-    await asyncio.to_thread(s3_uploader.upload_session_folder, local_path, s3_path, delete_after=False)
+    await upload_session_logs(game.logger, delete_after=False)
     await message.reply(f"✅ Логи выгружены!\nS3: <code>{s3_path}</code>")
 
 
@@ -312,24 +804,24 @@ async def cmd_send_logs(message: Message):
 async def cmd_fake_join(message: Message, command: CommandObject):
     user_id = message.from_user.id
     if not ADMIN_ID or user_id != ADMIN_ID: return
-    lid = lobby_manager.user_to_lobby.get(user_id)
+    lid = lobby_manager.find_user_lobby(user_id)
     if not lid: return
     lobby = lobby_manager.get_lobby(lid)
     if not lobby or lobby.status != "waiting": return
     fake_name = command.args if command.args else f"Fake_{random.choice(['Bob', 'Alice', 'John'])}"
     fake_id = -random.randint(50000, 99999)
     lobby.add_player(fake_id, fake_name)
+    lobby_manager.save(lobby)
     await message.reply(f"🤖 Фейк <b>{fake_name}</b> добавлен.")
-    await broadcast_lobby_ui(lobby)
+    lobby_ui.refresh(lobby)
 
 
 @router.message(Command("fake_say"))
 async def cmd_fake_say(message: Message, command: CommandObject):
     user_id = message.from_user.id
     if not ADMIN_ID or user_id != ADMIN_ID: return
-    lid = lobby_manager.user_to_lobby.get(user_id)
-    if not lid or lid not in active_games: return
-    game = active_games[lid]
+    game = resolve_game(user_id)
+    if not game: return
     text = command.args
     if not text: return
     active_list = [p for p in game.players if p.is_alive]
@@ -347,12 +839,9 @@ async def cmd_fake_say(message: Message, command: CommandObject):
 
 @router.message(Command("kick"))
 async def cmd_kick(message: Message, command: CommandObject):
-    chat_id = message.chat.id
-    lid = lobby_manager.user_to_lobby.get(chat_id)
-    if not lid and str(chat_id) in active_games: lid = str(chat_id)
-    if not lid or lid not in active_games: return
-    game = active_games[lid]
-    lobby = lobby_manager.get_lobby(lid)
+    game = resolve_game(message.chat.id)
+    if not game: return
+    lobby = lobby_manager.get_lobby(game.lobby_id)
     if lobby and lobby.host_id != message.from_user.id:
         await message.reply("⛔ Только хост может кикать.")
         return
@@ -362,27 +851,30 @@ async def cmd_kick(message: Message, command: CommandObject):
     if target_player:
         events = await game.player_leave(target_player.id)
         lobby_manager.leave_lobby(target_player.id)
+        sessions.unbind(target_player.id)
         await message.reply(f"🥾 Игрок {target_player.name} кикнут.")
         await process_game_events(game.lobby_id, events)
 
 
 @router.message(Command("skip"))
 async def cmd_skip(message: Message):
-    chat_id = message.chat.id
-    lid = lobby_manager.user_to_lobby.get(chat_id)
-    if not lid and str(chat_id) in active_games: lid = str(chat_id)
-    if lid and lid in active_games:
-        await process_game_events(lid, [GameEvent(type="switch_turn")])
-        await message.reply("⏩ Ход пропущен.")
+    game = resolve_game(message.chat.id)
+    if not game: return
+    user_id = message.from_user.id
+    lobby = lobby_manager.get_lobby(game.lobby_id)
+    # Пропуск хода — право хоста (в соло — владельца игры) или админа
+    is_host = lobby.host_id == user_id if lobby else game.lobby_id == str(user_id)
+    if not is_host and not (ADMIN_ID and user_id == ADMIN_ID):
+        await message.reply("⛔ Только хост может пропускать ход.")
+        return
+    await process_game_events(game.lobby_id, [GameEvent(type="switch_turn")])
+    await message.reply("⏩ Ход пропущен.")
 
 
 @router.message(Command("vote_as"))
 async def cmd_vote_as(message: Message, command: CommandObject):
-    chat_id = message.chat.id
-    lid = lobby_manager.user_to_lobby.get(chat_id)
-    if not lid and str(chat_id) in active_games: lid = str(chat_id)
-    if not lid or lid not in active_games: return
-    game = active_games[lid]
+    game = resolve_game(message.chat.id)
+    if not game: return
     is_admin = ADMIN_ID and message.from_user.id == ADMIN_ID
     if not is_admin: return
     args = command.args.split(maxsplit=1) if command.args else []
@@ -390,14 +882,61 @@ async def cmd_vote_as(message: Message, command: CommandObject):
     voter_name = args[0]
     target_name = args[1]
     voter = next((p for p in game.players if voter_name.lower() in p.name.lower()), None)
-    if not voter: return
-    action_data = f"vote_{target_name}"
+    target = next((p for p in game.players if target_name.lower() in p.name.lower()), None)
+    if not voter or not target: return
+    action_data = pack("vote", target.id)
     events = await game.handle_action(player_id=voter.id, action_data=action_data)
     if events:
         await message.reply(f"✅ Голос: {voter.name} -> {target_name}")
         await process_game_events(game.lobby_id, events)
 
 
+@router.message(Command("bind"))
+async def cmd_bind_group(message: Message, command: CommandObject):
+    """Привязка группы к лобби: /bind CODE в групповом чате (только хост)"""
+    if message.chat.type not in ("group", "supergroup"):
+        await message.reply("⚠️ Команду нужно отправить в групповом чате, куда добавлен бот.")
+        return
+    lobby_id = (command.args or "").strip().upper()
+    lobby = lobby_manager.get_lobby(lobby_id) if lobby_id else None
+    if not lobby or lobby.status != "waiting":
+        await message.reply("❌ Лобби не найдено.")
+        return
+    if message.from_user.id != lobby.host_id:
+        await message.reply("⛔ Привязать группу может только хост.")
+        return
+    if not lobby_manager.bind_group(lobby, message.chat.id):
+        await message.reply("⚠️ К этой группе уже привязано другое лобби.")
+        return
+    await message.reply(f"✅ Группа привязана к лобби <b>{lobby.lobby_id}</b>.\n"
+                        f"Общие события игры будут здесь, личное (досье, голосование) — в ЛС с ботом.")
+    lobby_ui.refresh(lobby)
+
+
+@router.message(Command("spectate"))
+async def cmd_spectate(message: Message, command: CommandObject):
+    """Канал трансляции для лобби: /spectate @channel (бот должен быть админом канала)"""
+    lid = lobby_manager.find_user_lobby(message.from_user.id)
+    lobby = lobby_manager.get_lobby(lid) if lid else None
+    if not lobby or lobby.status != "waiting" or lobby.host_id != message.from_user.id:
+        await message.reply("⛔ Команда доступна хосту лобби до старта игры.")
+        return
+    chat = parse_chat_id(command.args)
+    if not chat:
+        await message.reply("Использование: <code>/spectate @channel</code>")
+        return
+    try:
+        await bot.send_message(chat, f"🎥 Здесь будет трансляция лобби <b>{lobby.lobby_id}</b>.")
+    except Exception as e:
+        await message.reply(f"❌ Не получается писать в {chat}: {e}")
+        return
+    lobby.spectator_chat = chat
+    lobby.touch()
+    lobby_manager.save(lobby)
+    await message.reply(f"✅ Трансляция подключена: {chat}")
+    lobby_ui.refresh(lobby)
+
+
 # === UI HANDLERS ===
 
 @router.message(CommandStart())
@@ -415,52 +954,54 @@ async def cmd_start(message: Message, command: CommandObject):
         return
 
     for game_id, name in games.items():
-        kb.add(InlineKeyboardButton(text=name, callback_data=f"select_game_{game_id}"))
+        kb.add(InlineKeyboardButton(text=name, callback_data=pack("select_game", game_id)))
 
     kb.adjust(1)
     await message.answer("<b>🎮 GAME HUB</b>\nВыберите игру:", reply_markup=kb.as_markup())
 
 
-@router.callback_query(F.data.startswith("select_game_"))
-async def game_select_handler(callback: CallbackQuery):
-    game_id = callback.data.split("_")[2]
+@callbacks.on("select_game")
+async def game_select_handler(callback: CallbackQuery, game_id: str):
     game_name = GameRegistry.get_all_games().get(game_id, "Игра")
 
     kb = InlineKeyboardBuilder()
-    kb.add(InlineKeyboardButton(text="👤 Соло (с ботами)", callback_data=f"solo_{game_id}"))
-    kb.add(InlineKeyboardButton(text="🆕 Создать лобби", callback_data=f"lobby_create_{game_id}"))
-    kb.add(InlineKeyboardButton(text="🔍 Найти лобби", callback_data=f"lobby_list_{game_id}"))
-    kb.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_root"))
+    kb.add(InlineKeyboardButton(text="⚡ Быстрая игра", callback_data=pack("quick", game_id)))
+    kb.add(InlineKeyboardButton(text="👤 Соло (с ботами)", callback_data=pack("solo", game_id)))
+    kb.add(InlineKeyboardButton(text="🆕 Создать лобби", callback_data=pack("lobby_create", game_id)))
+    kb.add(InlineKeyboardButton(text="🔍 Найти лобби", callback_data=pack("lobby_list", game_id)))
+    kb.add(InlineKeyboardButton(text="🔙 Назад", callback_data=pack("back_to_root")))
     kb.adjust(1)
 
     await callback.message.edit_text(f"🎮 <b>{game_name}</b>\nВыберите режим:", reply_markup=kb.as_markup())
 
 
-@router.callback_query(F.data == "back_to_root")
+@callbacks.on("back_to_root")
 async def back_to_root_handler(callback: CallbackQuery):
     games = GameRegistry.get_all_games()
     kb = InlineKeyboardBuilder()
     for game_id, name in games.items():
-        kb.add(InlineKeyboardButton(text=name, callback_data=f"select_game_{game_id}"))
+        kb.add(InlineKeyboardButton(text=name, callback_data=pack("select_game", game_id)))
     kb.adjust(1)
     await callback.message.edit_text("<b>🎮 GAME HUB</b>\nВыберите игру:", reply_markup=kb.as_markup())
 
 
-@router.callback_query(F.data.startswith("solo_"))
-async def start_solo_handler(callback: CallbackQuery):
-    game_id = callback.data.split("_")[1]
-    game_cls = GameRegistry.get_game_class(game_id)
-    if not game_cls:
-        await callback.answer("Ошибка: игра не найдена", show_alert=True)
-        return
+@callbacks.on("solo")
+async def start_solo_handler(callback: CallbackQuery, game_id: str):
     user = callback.from_user
     lid = str(callback.message.chat.id)
+    game = create_game(game_id, lobby_id=lid, host_name=user.first_name)
+    if not game:
+        await callback.answer("Ошибка: игра не найдена", show_alert=True)
+        return
     lobby_manager.leave_lobby(user.id)
-    game = game_cls(lobby_id=lid, host_name=user.first_name)
+    matchmaker.leave(user.id)
     active_games[lid] = game
+    # id чата соло-игры в публичный канал не светим
+    spectator_feed.attach(lid, title=f"{game_id} · {user.first_name}")
     await callback.message.edit_text(f"🚀 Запуск симуляции ({game_id})...")
 
     events = await game.init_game([{"id": user.id, "name": user.first_name}])
+    bind_session(game)
 
     is_failed = False
     for e in events:
@@ -478,38 +1019,62 @@ async def start_solo_handler(callback: CallbackQuery):
         await process_game_events(lid, turn_events)
 
 
-@router.callback_query(F.data.startswith("lobby_create_"))
-async def lobby_create_handler(callback: CallbackQuery):
-    game_id = callback.data.split("_")[2]
+@callbacks.on("lobby_create")
+async def lobby_create_handler(callback: CallbackQuery, game_id: str):
     user = callback.from_user
     lobby_manager.leave_lobby(user.id)
+    matchmaker.leave(user.id)
     lobby = lobby_manager.create_lobby(user.id, user.first_name, game_type=game_id)
     lobby.user_interfaces[user.id] = callback.message.message_id
-    await broadcast_lobby_ui(lobby)
+    lobby_manager.save(lobby)
+    lobby_ui.refresh(lobby)
 
 
-@router.callback_query(F.data.startswith("lobby_list_"))
-async def lobby_list_handler(callback: CallbackQuery):
-    game_id = callback.data.split("_")[2]
-    game_name = GameRegistry.get_all_games().get(game_id, "Игра")
-    lobbies = lobby_manager.get_all_waiting(game_type=game_id)
+def render_lobby_page(game_id: str, cursor: str):
+    """Страница списка комнат; кэшируется до изменения каталога этого типа игры"""
+    version = lobby_manager.directory_version(game_id)
+    cached = lobby_pages.get((game_id, cursor))
+    if cached and cached[0] == version:
+        metrics.inc("bot_lobby_page_cache_total", result="hit")
+        return cached[1]
+    metrics.inc("bot_lobby_page_cache_total", result="miss")
+
+    lobbies, next_cursor = lobby_manager.list_waiting(game_id, after=cursor, limit=LOBBY_PAGE_SIZE)
     kb = InlineKeyboardBuilder()
     if not lobbies:
-        kb.add(InlineKeyboardButton(text="Нет активных комнат 🤷‍♂️", callback_data="dummy"))
+        kb.add(InlineKeyboardButton(text="Нет активных комнат 🤷‍♂️", callback_data=pack("noop")))
     else:
         for l in lobbies:
             count = len(l.players)
             host_name = l.players[l.host_id]['name']
             btn_text = f"🚪 {l.lobby_id} | {host_name} ({count})"
-            kb.add(InlineKeyboardButton(text=btn_text, callback_data=f"lobby_join_{l.lobby_id}"))
-    kb.add(InlineKeyboardButton(text="🔙 Назад", callback_data=f"select_game_{game_id}"))
+            kb.add(InlineKeyboardButton(text=btn_text, callback_data=pack("lobby_join", l.lobby_id)))
+    if next_cursor:
+        kb.add(InlineKeyboardButton(text="Дальше ▶️", callback_data=pack("lobby_list", game_id, next_cursor)))
+    if cursor:
+        kb.add(InlineKeyboardButton(text="⏮ В начало", callback_data=pack("lobby_list", game_id)))
+    kb.add(InlineKeyboardButton(text="🔙 Назад", callback_data=pack("select_game", game_id)))
     kb.adjust(1)
-    await callback.message.edit_text(f"<b>Список комнат ({game_name}):</b>", reply_markup=kb.as_markup())
 
+    markup = kb.as_markup()
+    if len(lobby_pages) >= 1000: lobby_pages.clear()
+    lobby_pages[(game_id, cursor)] = (version, markup)
+    return markup
+
+
+@callbacks.on("lobby_list")
+async def lobby_list_handler(callback: CallbackQuery, game_id: str, cursor: str = ""):
+    game_name = GameRegistry.get_all_games().get(game_id, "Игра")
+    markup = render_lobby_page(game_id, cursor)
+    try:
+        await callback.message.edit_text(f"<b>Список комнат ({game_name}):</b>", reply_markup=markup)
+    except TelegramBadRequest:
+        # Страница не изменилась — Telegram отвечает "message is not modified"
+        await callback.answer()
 
-@router.callback_query(F.data.startswith("lobby_join_"))
-async def lobby_join_btn_handler(callback: CallbackQuery):
-    lobby_id = callback.data.split("_")[2]
+
+@callbacks.on("lobby_join")
+async def lobby_join_btn_handler(callback: CallbackQuery, lobby_id: str):
     await join_lobby_logic(callback, lobby_id)
 
 
@@ -523,6 +1088,7 @@ async def join_lobby_logic(event: Union[Message, CallbackQuery], lobby_id: str):
         chat_id = event.chat.id
         message_id = 0
     lobby_manager.leave_lobby(user.id)
+    matchmaker.leave(user.id)
     success = lobby_manager.join_lobby(lobby_id, user.id, user.first_name)
     if success:
         lobby = lobby_manager.get_lobby(lobby_id)
@@ -530,7 +1096,8 @@ async def join_lobby_logic(event: Union[Message, CallbackQuery], lobby_id: str):
             msg = await bot.send_message(chat_id, "Подключение...")
             message_id = msg.message_id
         lobby.user_interfaces[user.id] = message_id
-        await broadcast_lobby_ui(lobby)
+        lobby_manager.save(lobby)
+        lobby_ui.refresh(lobby)
     else:
         text = "❌ Лобби не найдено."
         if is_callback:
@@ -539,13 +1106,14 @@ async def join_lobby_logic(event: Union[Message, CallbackQuery], lobby_id: str):
             await event.answer(text)
 
 
-@router.callback_query(F.data == "lobby_leave")
+@callbacks.on("lobby_leave")
 async def lobby_leave_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
-    lid = lobby_manager.user_to_lobby.get(user_id)
+    lid = lobby_manager.find_user_lobby(user_id)
     if lid and lid in active_games:
         game = active_games[lid]
         game_events = await game.player_leave(user_id)
+        sessions.unbind(user_id)
         await process_game_events(lid, game_events)
     lobby = lobby_manager.leave_lobby(user_id)
     if lobby:
@@ -555,30 +1123,25 @@ async def lobby_leave_handler(callback: CallbackQuery):
         else:
             await callback.answer("Вы вышли.")
             current_lobby = lobby_manager.get_lobby(lobby.lobby_id)
-            if current_lobby: await broadcast_lobby_ui(current_lobby)
+            if current_lobby: lobby_ui.refresh(current_lobby)
     await cmd_start(callback.message, CommandObject())
 
 
-@router.callback_query(F.data.startswith("lobby_start_"))
-async def lobby_start_handler(callback: CallbackQuery):
-    lobby_id = callback.data.split("_")[2]
-    lobby = lobby_manager.get_lobby(lobby_id)
-    if not lobby: return
-    if callback.from_user.id != lobby.host_id:
-        await callback.answer("Ждите лидера!", show_alert=True)
-        return
-    game_cls = GameRegistry.get_game_class(lobby.game_type)
-    if not game_cls:
-        await callback.answer("Ошибка: класс игры не найден!", show_alert=True)
-        return
-    lobby.status = "playing"
-    await callback.message.edit_text(f"🚀 <b>ИГРА ЗАПУЩЕНА!</b>")
+async def start_lobby_game(lobby: Lobby) -> bool:
+    """Запуск игры лобби (кнопка хоста или быстрая игра)"""
+    lobby_id = lobby.lobby_id
     host_name = lobby.players[lobby.host_id]['name']
-    game = game_cls(lobby_id=lobby_id, host_name=host_name)
+    game = create_game(lobby.game_type, lobby_id=lobby_id, host_name=host_name)
+    if not game: return False
+    lobby_manager.set_status(lobby, "playing")
+    lobby_ui.forget(lobby_id)
     active_games[lobby_id] = game
+    if lobby.group_chat_id: group_chats[lobby_id] = lobby.group_chat_id
+    spectator_feed.attach(lobby_id, lobby.spectator_chat)
     users_data = lobby.to_game_users_list()
 
     events = await game.init_game(users_data)
+    bind_session(game)
 
     is_failed = False
     for e in events:
@@ -594,51 +1157,192 @@ async def lobby_start_handler(callback: CallbackQuery):
                 e.extra_data["is_dashboard"] = True
         turn_events = await game.process_turn()
         await process_game_events(lobby_id, turn_events)
+    return True
+
+
+@callbacks.on("lobby_start")
+async def lobby_start_handler(callback: CallbackQuery, lobby_id: str):
+    lobby = lobby_manager.get_lobby(lobby_id)
+    if not lobby: return
+    if callback.from_user.id != lobby.host_id:
+        await callback.answer("Ждите лидера!", show_alert=True)
+        return
+    if not GameRegistry.get_game_class(lobby.game_type):
+        await callback.answer("Ошибка: класс игры не найден!", show_alert=True)
+        return
+    await callback.message.edit_text(f"🚀 <b>ИГРА ЗАПУЩЕНА!</b>")
+    await start_lobby_game(lobby)
+
+
+# === QUICK MATCH ===
+
+def quick_match_markup():
+    kb = InlineKeyboardBuilder()
+    kb.add(InlineKeyboardButton(text="❌ Отмена", callback_data=pack("quick_cancel")))
+    return kb.as_markup()
+
+
+async def refresh_quick_match_ui(game_type: str):
+    waiting = matchmaker.waiting(game_type)
+    text = (f"⚡ <b>Быстрая игра</b>\n"
+            f"⏳ Ищем игроков: {len(waiting)} из {matchmaker.size}\n"
+            f"<i>Игра начнется, как только наберется стол, или не позже чем через {int(matchmaker.max_wait)} сек. "
+            f"(свободные места займет AI)</i>")
+    edits = [bot.edit_message_text(chat_id=e["chat_id"], message_id=e["message_id"], text=text,
+                                   reply_markup=quick_match_markup()) for e in waiting]
+    await asyncio.gather(*edits, return_exceptions=True)
+
+
+@callbacks.on("quick")
+async def quick_match_handler(callback: CallbackQuery, game_id: str):
+    if not GameRegistry.get_game_class(game_id):
+        await callback.answer("Ошибка: игра не найдена", show_alert=True)
+        return
+    user = callback.from_user
+    lobby_manager.leave_lobby(user.id)
+    matchmaker.join(game_id, user.id, user.first_name, callback.message.chat.id, callback.message.message_id)
+    await callback.answer()
+    await refresh_quick_match_ui(game_id)
+
+
+@callbacks.on("quick_cancel")
+async def quick_cancel_handler(callback: CallbackQuery):
+    game_type = matchmaker.queued_game(callback.from_user.id)
+    matchmaker.leave(callback.from_user.id)
+    await callback.answer("Поиск отменен")
+    await cmd_start(callback.message, CommandObject())
+    if game_type: await refresh_quick_match_ui(game_type)
+
+
+async def start_quick_match(game_type: str, entries: list):
+    """Матч найден: лобби с первым в очереди как хостом, остальные присоединяются, старт сразу"""
+    host = entries[0]
+    lobby = lobby_manager.create_lobby(host["id"], host["name"], game_type=game_type)
+    for e in entries[1:]:
+        lobby_manager.leave_lobby(e["id"])
+        lobby_manager.join_lobby(lobby.lobby_id, e["id"], e["name"])
+    lobby = lobby_manager.get_lobby(lobby.lobby_id)
+    if not lobby: return
+    for e in entries:
+        lobby.user_interfaces[e["id"]] = e["message_id"]
+    lobby_manager.save(lobby)
+
+    metrics.inc("bot_quick_matches_total", game_type=game_type)
+    metrics.inc("bot_quick_match_humans_total", len(entries), game_type=game_type)
+    text = f"🚀 <b>ИГРА НАЙДЕНА!</b> Людей за столом: {len(entries)}"
+    await asyncio.gather(*[bot.edit_message_text(chat_id=e["chat_id"], message_id=e["message_id"], text=text)
+                           for e in entries], return_exceptions=True)
+    await start_lobby_game(lobby)
+
+
+matchmaker.on_match = start_quick_match
 
 
 @router.message()
 async def chat_message_handler(message: Message):
-    chat_id = message.chat.id
-    game = None
-    if str(chat_id) in active_games:
-        game = active_games[str(chat_id)]
-    else:
-        lid = lobby_manager.user_to_lobby.get(chat_id)
-        if lid: game = active_games.get(lid)
+    game = resolve_game(message.chat.id)
     if not game: return
     lobby = lobby_manager.get_lobby(game.lobby_id)
     if lobby: lobby.touch()
+    turn_deadlines.touch(game.lobby_id, message.from_user.id)
     events = await game.process_message(player_id=message.from_user.id, text=message.text)
     await process_game_events(game.lobby_id, events)
 
 
-@router.callback_query(
-    F.data.func(lambda data: any(data.startswith(p) for p in ["vote_", "preview_", "reveal_", "refresh_"])))
+@callbacks.on("noop")
+async def noop_handler(callback: CallbackQuery):
+    await callback.answer()
+
+
+@callbacks.fallback
 async def game_action_handler(callback: CallbackQuery):
-    chat_id = callback.message.chat.id
-    game = None
-    if str(chat_id) in active_games:
-        game = active_games[str(chat_id)]
-    else:
-        lid = lobby_manager.user_to_lobby.get(chat_id)
-        if lid: game = active_games.get(lid)
+    game = resolve_game(callback.message.chat.id)
     if not game: return
     lobby = lobby_manager.get_lobby(game.lobby_id)
     if lobby: lobby.touch()
+    turn_deadlines.touch(game.lobby_id, callback.from_user.id)
     events = await game.handle_action(player_id=callback.from_user.id, action_data=callback.data)
     if events: events[0].extra_data["query_id"] = callback.id
     await process_game_events(game.lobby_id, events)
 
 
+@router.callback_query()
+async def callback_dispatcher(callback: CallbackQuery):
+    """Единая точка входа для кнопок: action -> обработчик за один поиск в словаре"""
+    await callbacks.dispatch(callback)
+
+
+async def upload_session_logs(logger, delete_after: bool):
+    """Дожидается записи лога сессии на диск (в потоке, не блокируя event loop) и выгружает папку в S3"""
+    local_path = logger.get_session_path()
+    if not local_path: return
+    # Папка будет удалена — лог закрываем до выгрузки, чтобы запоздалые записи не создали файл заново
+    if delete_after and hasattr(logger, "close"): logger.close()
+    if hasattr(logger, "flush"): await asyncio.to_thread(logger.flush)
+    await asyncio.to_thread(s3_uploader.upload_session_folder, local_path, logger.get_s3_target_path(), delete_after)
+
+
+async def upload_active_logs():
+    """Сброс и выгрузка логов незавершенных игр (без удаления — игра продолжится после рестарта)"""
+    uploads = []
+    for game in list(active_games.values()):
+        logger = getattr(game, "logger", None)
+        if not logger: continue
+        uploads.append(upload_session_logs(logger, delete_after=False))
+    await asyncio.gather(*uploads, return_exceptions=True)
+
+
+async def graceful_shutdown(runner: web.AppRunner):
+    shutdown.request_stop()
+    typing_manager.stop_all()
+    abandoned = await shutdown.drain([
+        ("updates", updates_limiter.wait_idle),
+        ("snapshots", snapshot_manager.flush),
+        ("spectators", spectator_feed.flush_all),
+        ("logs", upload_active_logs),
+    ])
+    if updates_limiter.in_flight:
+        logging.warning(f"🛑 {updates_limiter.in_flight} updates were still in flight")
+    if snapshot_manager.pending_count():
+        logging.warning(f"🛑 {snapshot_manager.pending_count()} snapshot writes were not finished")
+    print(f"🛑 Shutdown complete. Abandoned: {abandoned or 'nothing'}")
+    await runner.cleanup()
+
+
 async def main():
-    await start_web_server()
-    asyncio.create_task(cleanup_lobbies_task())
+    runner = await start_web_server()
+    shutdown.install_signal_handlers()
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
         GameRegistry.auto_discover()
         print("✅ Core System Online. Games loaded: " + ", ".join(GameRegistry.get_all_games().keys()))
-        await dp.start_polling(bot)
+        if shard_pool: shard_pool.start()
+        await restore_games()
+        task_supervisor.supervise(snapshot_manager.run_periodic, "snapshots")
+        task_supervisor.supervise(timer_wheel.run, "timers")
+        if shard_pool: task_supervisor.supervise(shard_pool.watch, "game_workers")
+        if WEBHOOK_URL:
+            url = f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}"
+            await bot.set_webhook(
+                url=url,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=UPDATES_CONCURRENCY,
+                drop_pending_updates=True
+            )
+            print(f"🪝 Webhook mode: {url}")
+            await shutdown.wait()
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            # Сигналы обрабатывает ShutdownCoordinator, а не aiogram
+            polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+            stop_wait = asyncio.create_task(shutdown.wait())
+            await asyncio.wait([polling, stop_wait], return_when=asyncio.FIRST_COMPLETED)
+            if not polling.done():
+                await dp.stop_polling()
+            stop_wait.cancel()
     finally:
+        await graceful_shutdown(runner)
+        if shard_pool: shard_pool.stop()
         await bot.session.close()
 
 
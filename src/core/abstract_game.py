@@ -1,14 +1,25 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Any, Optional
 from src.core.schemas import BasePlayer, BaseGameState, GameEvent
 
 
 class GameEngine(ABC):
+    # Проставляется GameRegistry.register
+    game_type: str = ""
+
     def __init__(self, lobby_id: str, host_name: str):
         self.lobby_id = lobby_id
         self.host_name = host_name
         self.players: List[BasePlayer] = []
         self.state: BaseGameState = None
+        # Версия записи игры в StateStore
+        self.store_version = 0
+        # Индекс игроков по id: пересобирается, если список заменили, изменили его длину
+        # или игра сообщила об изменении состава через players_changed()
+        self._player_index: Dict[int, BasePlayer] = {}
+        self._indexed_players: Optional[List[BasePlayer]] = None
+        self._players_version = 0
+        self._indexed_version = -1
 
     @abstractmethod
     async def init_game(self, users_data: List[Dict]) -> List[GameEvent]:
@@ -37,4 +48,79 @@ class GameEngine(ABC):
 
     @abstractmethod
     def get_player_view(self, viewer_id: int) -> str:
-        pass
\ No newline at end of file
+        pass
+
+    def get_player(self, player_id: Any) -> Optional[BasePlayer]:
+        """Игрок по id за O(1) вместо перебора self.players"""
+        try:
+            player_id = int(player_id)
+        except (TypeError, ValueError):
+            return None
+        if (self._indexed_players is not self.players or self._indexed_version != self._players_version
+                or len(self._player_index) != len(self.players)):
+            self._reindex_players()
+        player = self._player_index.get(player_id)
+        if player is not None and player.id != player_id:
+            # Объект игрока заменили на месте без players_changed()
+            self._reindex_players()
+            player = self._player_index.get(player_id)
+        return player
+
+    def players_changed(self):
+        """Состав или объекты игроков изменились на месте (замена, перестановка) — индекс устарел"""
+        self._players_version += 1
+
+    def _reindex_players(self):
+        self._player_index = {p.id: p for p in self.players}
+        self._indexed_players = self.players
+        self._indexed_version = self._players_version
+
+    def pending_humans(self) -> List[int]:
+        """Люди, от которых игра сейчас ждет ввода (ход или голос) — для дедлайнов хода"""
+        return []
+
+    async def skip_turn(self, player_id: int) -> List[GameEvent]:
+        """Игрок не уложился в дедлайн: пропустить его ход или проголосовать за него"""
+        return []
+
+    async def substitute_bot(self, player_id: int) -> List[GameEvent]:
+        """AFK-игрок переходит под управление AI"""
+        player = self.get_player(player_id)
+        if not player or not player.is_human: return []
+        player.is_human = False
+        self.players_changed()
+        return [GameEvent(type="message", content=f"🤖 <b>{player.name}</b> не отвечает — за него играет AI.")]
+
+    async def resume(self) -> List[GameEvent]:
+        """Продолжение игры после warm restart (по умолчанию — переобъявить текущий ход)"""
+        return await self.process_turn()
+
+    def log_context(self) -> Dict[str, Any]:
+        """Поля, которые лог сессии добавляет к каждой записи"""
+        if not self.state: return {}
+        return {"round": self.state.round, "phase": self.state.phase}
+
+    def release(self):
+        """Освобождение ресурсов игры после game_over (по умолчанию — закрыть лог сессии)"""
+        logger = getattr(self, "logger", None)
+        if logger and hasattr(logger, "close"):
+            logger.close()
+
+    def dump_state(self) -> Dict[str, Any]:
+        """JSON-совместимый снимок игры. Наследники дополняют своими полями."""
+        return {
+            "lobby_id": self.lobby_id,
+            "host_name": self.host_name,
+            "players": [p.model_dump(mode="json") for p in self.players],
+            "state": self.state.model_dump(mode="json") if self.state else None,
+            # Папка лога сессии: восстановленная игра (рестарт, новый воркер) пишет в ту же
+            "log_session": getattr(getattr(self, "logger", None), "session_folder", None),
+        }
+
+    def load_state(self, data: Dict[str, Any]):
+        self.players = [BasePlayer(**p) for p in data["players"]]
+        self.players_changed()
+        logger = getattr(self, "logger", None)
+        if data.get("log_session") and hasattr(logger, "resume"):
+            logger.resume(data["log_session"])
+        self.state = BaseGameState(**data["state"]) if data["state"] else None
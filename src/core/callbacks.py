@@ -0,0 +1,98 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Лимит Telegram на callback_data (в байтах UTF-8)
+CALLBACK_DATA_LIMIT = 64
+SEPARATOR = ":"
+# Префикс длинных payload'ов, которые хранятся на сервере и передаются по хэшу
+OVERFLOW_PREFIX = "~"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("%", "%25").replace(SEPARATOR, "%3A")
+
+
+def _unescape(value: str) -> str:
+    return value.replace("%3A", SEPARATOR).replace("%25", "%")
+
+
+class CallbackCodec:
+    """
+    Кодирование кнопок: "action:arg1:arg2".
+    - аргументы экранируются, поэтому в них допустимы ':' и '_' (имена игроков, id улик)
+    - если payload не влезает в 64 байта, на кнопку уходит короткий хэш,
+      а сам payload лежит в ограниченном LRU-словаре процесса
+    """
+
+    def __init__(self, overflow_capacity: int = 10000):
+        self.overflow_capacity = overflow_capacity
+        self._overflow: "OrderedDict[str, str]" = OrderedDict()
+
+    def pack(self, action: str, *args: Any) -> str:
+        data = SEPARATOR.join([action, *(_escape(a) for a in args)])
+        if len(data.encode("utf-8")) <= CALLBACK_DATA_LIMIT:
+            return data
+
+        key = OVERFLOW_PREFIX + hashlib.blake2b(data.encode("utf-8"), digest_size=12).hexdigest()
+        self._overflow[key] = data
+        self._overflow.move_to_end(key)
+        while len(self._overflow) > self.overflow_capacity:
+            self._overflow.popitem(last=False)
+        return key
+
+    def unpack(self, data: Optional[str]) -> Tuple[str, List[str]]:
+        """("action", [args]); неизвестный/просроченный payload -> ("", [])"""
+        if not data: return "", []
+        if data.startswith(OVERFLOW_PREFIX):
+            data = self._overflow.get(data)
+            if data is None: return "", []
+        action, *args = data.split(SEPARATOR)
+        return action, [_unescape(a) for a in args]
+
+
+class CallbackRouter:
+    """
+    Один обработчик на все callback-кнопки: разбор payload и поиск обработчика
+    по action в словаре, вместо перебора фильтров startswith.
+    Всё, что не зарегистрировано в ядре, уходит в fallback (действия игр) как есть.
+    """
+
+    def __init__(self, codec: CallbackCodec):
+        self.codec = codec
+        self._handlers: Dict[str, Callable[..., Awaitable]] = {}
+        self._fallback: Optional[Callable[..., Awaitable]] = None
+
+    def on(self, action: str):
+        def decorator(handler):
+            if action in self._handlers:
+                raise ValueError(f"Callback action '{action}' already registered")
+            self._handlers[action] = handler
+            return handler
+        return decorator
+
+    def fallback(self, handler):
+        self._fallback = handler
+        return handler
+
+    def is_core(self, data: Optional[str]) -> bool:
+        """Кнопка ядра (меню, лобби) — в отличие от действий игр, которые уходят в fallback"""
+        return self.codec.unpack(data or "")[0] in self._handlers
+
+    async def dispatch(self, callback) -> bool:
+        action, args = self.codec.unpack(callback.data)
+        handler = self._handlers.get(action)
+        if handler:
+            await handler(callback, *args)
+            return True
+        # Игра разбирает payload сама: он мог быть упакован в процессе-воркере (GAME_WORKERS)
+        if self._fallback:
+            await self._fallback(callback)
+            return True
+        logging.debug(f"Unhandled callback: {callback.data!r}")
+        return False
+
+
+# Глобальный инстанс: игры кодируют кнопки через него же
+callback_codec = CallbackCodec()
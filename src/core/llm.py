@@ -4,6 +4,7 @@ import logging
 import asyncio
 import random
 import re
+import time
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 from groq import AsyncGroq
@@ -31,7 +32,8 @@ class LLMService:
                        messages: List[Dict],
                        temperature: float = 0.7,
                        json_mode: bool = False,
-                       logger=None) -> str:
+                       logger=None,
+                       actor: str = None) -> str:
 
         current_messages = [m.copy() for m in messages]
 
@@ -53,12 +55,15 @@ class LLMService:
             model_id = config.get("model_id")
 
             try:
+                started = time.monotonic()
                 response = await asyncio.wait_for(
                     self._call_provider(provider, model_id, current_messages, temperature, json_mode),
                     timeout=20.0
                 )
                 if response:
-                    if logger: logger.log_llm(model_id, current_messages, response)
+                    if logger:
+                        latency_ms = round((time.monotonic() - started) * 1000, 1)
+                        logger.log_llm(model_id, current_messages, response, latency_ms=latency_ms, actor=actor)
                     return response
 
             except Exception as e:
@@ -1,7 +1,10 @@
-import random
-import string
+import logging
+from bisect import bisect_left, bisect_right, insort
 import time
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from src.core.lobby_ids import LobbyIdAllocator
+from src.core.state_store import StateStore, VersionConflict, state_store
 
 
 class Lobby:
@@ -23,6 +26,14 @@ class Lobby:
 
         self.players: Dict[int, dict] = {}
 
+        # Групповой чат: публичные события игры идут туда одним сообщением, личное — в ЛС
+        self.group_chat_id: Optional[int] = None
+        # Канал для зрителей (id или @username); None — канал по умолчанию из конфига
+        self.spectator_chat: Optional[Union[int, str]] = None
+
+        # Версия записи в StateStore (оптимистичная блокировка)
+        self.version = 0
+
         # Добавляем хоста сразу
         self.add_player(host_id, host_name)
 
@@ -52,65 +63,249 @@ class Lobby:
     def to_game_users_list(self) -> List[dict]:
         return [{"id": p["id"], "name": p["name"]} for p in self.players.values()]
 
+    def to_record(self) -> dict:
+        return {
+            "lobby_id": self.lobby_id,
+            "host_id": self.host_id,
+            "host_name": self.host_name,
+            "status": self.status,
+            "game_type": self.game_type,
+            "last_activity": self.last_activity,
+            "user_interfaces": {str(uid): mid for uid, mid in self.user_interfaces.items()},
+            "players": list(self.players.values()),
+            "group_chat_id": self.group_chat_id,
+            "spectator_chat": self.spectator_chat,
+        }
+
+    @classmethod
+    def from_record(cls, data: dict, version: int) -> "Lobby":
+        lobby = cls.__new__(cls)
+        lobby.lobby_id = data["lobby_id"]
+        lobby.host_id = data["host_id"]
+        lobby.host_name = data["host_name"]
+        lobby.status = data["status"]
+        lobby.game_type = data["game_type"]
+        lobby.last_activity = data["last_activity"]
+        lobby.user_interfaces = {int(uid): mid for uid, mid in data["user_interfaces"].items()}
+        lobby.players = {p["id"]: p for p in data["players"]}
+        lobby.group_chat_id = data.get("group_chat_id")
+        lobby.spectator_chat = data.get("spectator_chat")
+        lobby.version = version
+        return lobby
+
 
 class LobbyManager:
-    def __init__(self):
+    def __init__(self, store: StateStore):
+        # Локальный кэш; источник правды для нескольких реплик — store
         self.lobbies: Dict[str, Lobby] = {}
         self.user_to_lobby: Dict[int, str] = {}
+        self.chat_to_lobby: Dict[int, str] = {}
+        self.store = store
+        # Вызывается, когда лобби появляется в кэше (создано здесь или поднято из store) — ядро ставит таймер
+        self.on_cached: Optional[Callable[[Lobby], None]] = None
+        # Вызывается при любом удалении лобби (выход хоста, истечение, конец игры) — ядро чистит состояние UI
+        self.on_deleted: Optional[Callable[[str], None]] = None
+        # Выдача кодов лобби (перестановка с курсором в store, карантин освобожденных кодов)
+        self.ids = LobbyIdAllocator(store)
+
+        # Каталог: (status, game_type) -> отсортированные lobby_id (для постраничного списка по курсору)
+        self._directory: Dict[Tuple[str, str], List[str]] = {}
+        self._indexed: Dict[str, Tuple[str, str]] = {}
+        # Версия каталога по типу игры: меняется при любом изменении лобби этого типа (инвалидация кэша страниц)
+        self._versions: Dict[str, int] = {}
+
+    # --- DIRECTORY INDEX ---
+
+    def _reindex(self, lobby: Lobby):
+        key = (lobby.status, lobby.game_type)
+        old = self._indexed.get(lobby.lobby_id)
+        if old != key:
+            if old: self._index_remove(lobby.lobby_id, old)
+            insort(self._directory.setdefault(key, []), lobby.lobby_id)
+            self._indexed[lobby.lobby_id] = key
+        self._bump(lobby.game_type)
+
+    def _unindex(self, lobby_id: str):
+        old = self._indexed.pop(lobby_id, None)
+        if old:
+            self._index_remove(lobby_id, old)
+            self._bump(old[1])
+
+    def _index_remove(self, lobby_id: str, key: Tuple[str, str]):
+        ids = self._directory.get(key, [])
+        i = bisect_left(ids, lobby_id)
+        if i < len(ids) and ids[i] == lobby_id:
+            del ids[i]
+
+    def _bump(self, game_type: str):
+        self._versions[game_type] = self._versions.get(game_type, 0) + 1
+
+    def directory_version(self, game_type: str) -> int:
+        return self._versions.get(game_type, 0)
+
+    def list_waiting(self, game_type: str, after: str = "", limit: int = 8) -> Tuple[List[Lobby], str]:
+        """Страница ожидающих лобби после курсора after; возвращает (лобби, курсор следующей страницы или "")"""
+        ids = self._directory.get(("waiting", game_type), [])
+        start = bisect_right(ids, after) if after else 0
+        page = ids[start:start + limit]
+        next_cursor = page[-1] if start + limit < len(ids) else ""
+        return [self.lobbies[lid] for lid in page if lid in self.lobbies], next_cursor
+
+    # --- PERSISTENCE ---
+
+    def save(self, lobby: Lobby) -> bool:
+        """Пишет лобби в store; при конфликте версий сбрасывает кэш и возвращает False"""
+        try:
+            lobby.version = self.store.put("lobby", lobby.lobby_id, lobby.to_record(), expected_version=lobby.version)
+            if self.lobbies.get(lobby.lobby_id) is lobby: self._reindex(lobby)
+            return True
+        except VersionConflict as e:
+            logging.warning(f"Lobby version conflict: {e}. Reloading.")
+            self.lobbies.pop(lobby.lobby_id, None)
+            self._unindex(lobby.lobby_id)
+            return False
+
+    def _update(self, lobby_id: str, mutate, attempts: int = 3) -> Optional[Lobby]:
+        """Read-modify-write с повтором: mutate применяется к свежей версии лобби"""
+        for _ in range(attempts):
+            lobby = self.get_lobby(lobby_id)
+            if not lobby or mutate(lobby) is False: return None
+            if self.save(lobby): return lobby
+        return None
+
+    def _bind_user(self, user_id: int, lobby_id: str):
+        self.user_to_lobby[user_id] = lobby_id
+        self.store.put("user", str(user_id), {"lobby_id": lobby_id})
+
+    def _unbind_user(self, user_id: int):
+        self.user_to_lobby.pop(user_id, None)
+        self.store.delete("user", str(user_id))
+
+    def _lookup(self, kind: str, cache: Dict[int, str], key: int) -> Optional[str]:
+        lid = cache.get(key)
+        if lid: return lid
+        record = self.store.get(kind, str(key))
+        if not record: return None
+        lid = record[0]["lobby_id"]
+        cache[key] = lid
+        return lid
+
+    def find_user_lobby(self, user_id: int) -> Optional[str]:
+        """lobby_id пользователя: из кэша, либо из store (если лобби создано другой репликой)"""
+        return self._lookup("user", self.user_to_lobby, user_id)
+
+    def find_chat_lobby(self, chat_id: int) -> Optional[str]:
+        """lobby_id, к которому привязан групповой чат"""
+        return self._lookup("chat", self.chat_to_lobby, chat_id)
+
+    def bind_group(self, lobby: Lobby, chat_id: int) -> bool:
+        """Привязка группового чата к лобби. Одна группа — одно живое лобби."""
+        owner = self.find_chat_lobby(chat_id)
+        if owner and owner != lobby.lobby_id and self.get_lobby(owner):
+            return False
+
+        if lobby.group_chat_id and lobby.group_chat_id != chat_id:
+            self._unbind_chat(lobby.group_chat_id)
+        lobby.group_chat_id = chat_id
+        lobby.touch()
+        if not self.save(lobby): return False
+
+        self._bind_chat(chat_id, lobby.lobby_id)
+        return True
+
+    def rebind(self, lobby_id: str, user_ids: List[int], chat_id: Optional[int] = None):
+        """Восстановление привязок идущей игры (warm restart): кэш и store остаются согласованными"""
+        for uid in user_ids:
+            if self.find_user_lobby(uid) != lobby_id:
+                self._bind_user(uid, lobby_id)
+        if chat_id and self.find_chat_lobby(chat_id) != lobby_id:
+            self._bind_chat(chat_id, lobby_id)
+
+    def _bind_chat(self, chat_id: int, lobby_id: str):
+        self.chat_to_lobby[chat_id] = lobby_id
+        self.store.put("chat", str(chat_id), {"lobby_id": lobby_id})
+
+    def _unbind_chat(self, chat_id: int):
+        self.chat_to_lobby.pop(chat_id, None)
+        self.store.delete("chat", str(chat_id))
 
     # ДОБАВЛЕН АРГУМЕНТ game_type
     def create_lobby(self, host_id: int, host_name: str, game_type: str) -> Lobby:
-        # Генерируем ID
-        lid = ''.join(random.choices(string.ascii_uppercase, k=4))
-        while lid in self.lobbies:
-            lid = ''.join(random.choices(string.ascii_uppercase, k=4))
+        lid = self.ids.allocate(lambda code: code in self.lobbies or self.store.get("lobby", code) is not None)
 
         lobby = Lobby(lid, host_id, host_name, game_type)
         self.lobbies[lid] = lobby
-        self.user_to_lobby[host_id] = lid
+        self.save(lobby)
+        if self.on_cached: self.on_cached(lobby)
+        self._bind_user(host_id, lid)
         return lobby
 
     def get_lobby(self, lobby_id: str) -> Optional[Lobby]:
-        return self.lobbies.get(lobby_id)
+        lobby = self.lobbies.get(lobby_id)
+        if lobby: return lobby
+        record = self.store.get("lobby", lobby_id)
+        if not record: return None
+        lobby = Lobby.from_record(*record)
+        self.lobbies[lobby_id] = lobby
+        self._reindex(lobby)
+        if self.on_cached: self.on_cached(lobby)
+        return lobby
 
-    # ДОБАВЛЕН ФИЛЬТР ПО game_type
-    def get_all_waiting(self, game_type: Optional[str] = None) -> List[Lobby]:
-        result = [l for l in self.lobbies.values() if l.status == "waiting"]
-        if game_type:
-            result = [l for l in result if l.game_type == game_type]
-        return result
+    def set_status(self, lobby: Lobby, status: str):
+        lobby.status = status
+        self.save(lobby)
 
+    # ДОБАВЛЕН ФИЛЬТР ПО game_type
     def join_lobby(self, lobby_id: str, user_id: int, user_name: str) -> bool:
-        lobby = self.get_lobby(lobby_id)
-        if not lobby or lobby.status != "waiting":
-            return False
+        def mutate(lobby: Lobby):
+            if lobby.status != "waiting": return False
+            lobby.add_player(user_id, user_name)
 
-        lobby.add_player(user_id, user_name)
-        self.user_to_lobby[user_id] = lobby_id
+        if not self._update(lobby_id, mutate):
+            return False
+        self._bind_user(user_id, lobby_id)
         return True
 
     def leave_lobby(self, user_id: int) -> Optional[Lobby]:
-        lid = self.user_to_lobby.get(user_id)
+        lid = self.find_user_lobby(user_id)
         if not lid: return None
 
         lobby = self.get_lobby(lid)
         if lobby:
-            lobby.remove_player(user_id)
-            if user_id == lobby.host_id or len(lobby.players) == 0:
+            if user_id == lobby.host_id or len(lobby.players) <= 1:
+                lobby.remove_player(user_id)
                 self.delete_lobby(lid)
+            else:
+                lobby = self._update(lid, lambda l: l.remove_player(user_id)) or lobby
 
-        if user_id in self.user_to_lobby:
-            del self.user_to_lobby[user_id]
+        self._unbind_user(user_id)
 
         return lobby
 
     def delete_lobby(self, lobby_id: str):
-        if lobby_id in self.lobbies:
-            lobby = self.lobbies[lobby_id]
-            for uid in list(lobby.players.keys()):
-                if uid in self.user_to_lobby:
-                    del self.user_to_lobby[uid]
-            del self.lobbies[lobby_id]
+        # Участники из кэша и из store: другая реплика могла добавить игроков
+        uids, chats = set(), set()
+        lobby = self.lobbies.pop(lobby_id, None)
+        self._unindex(lobby_id)
+        if lobby:
+            uids.update(lobby.players.keys())
+            if lobby.group_chat_id: chats.add(lobby.group_chat_id)
+        record = self.store.get("lobby", lobby_id)
+        if record:
+            uids.update(p["id"] for p in record[0]["players"])
+            if record[0].get("group_chat_id"): chats.add(record[0]["group_chat_id"])
+
+        for uid in uids:
+            if self.find_user_lobby(uid) == lobby_id:
+                self._unbind_user(uid)
+        for chat_id in chats:
+            if self.find_chat_lobby(chat_id) == lobby_id:
+                self._unbind_chat(chat_id)
+        self.store.delete("lobby", lobby_id)
+        # Код возвращается в карантин, только если лобби правда было (повторный delete и соло-игры — мимо)
+        if (lobby or record) and self.ids.owns(lobby_id):
+            self.ids.release(lobby_id)
+        if self.on_deleted: self.on_deleted(lobby_id)
 
 
-lobby_manager = LobbyManager()
\ No newline at end of file
+lobby_manager = LobbyManager(state_store)
\ No newline at end of file
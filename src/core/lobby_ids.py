@@ -0,0 +1,123 @@
+import math
+import random
+import string
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+from src.core.metrics import metrics
+from src.core.state_store import StateStore, VersionConflict
+
+ALPHABET = string.ascii_uppercase
+
+
+class LobbyIdAllocator:
+    """
+    Коды лобби без цикла "случайный код -> занят? -> еще раз".
+    - коды длины L — перестановка чисел 0..26^L-1: i -> (a*i + b) mod 26^L, a взаимно просто с 26.
+      Курсор i только растет, поэтому до полного оборота коды не повторяются и выдаются за O(1)
+    - параметры перестановки и курсор лежат в StateStore: после рестарта выдача продолжается с того же места,
+      реплики забирают курсор блоками по block через версию записи
+    - освобожденный код стоит на карантине quarantine секунд: после оборота курсора он не выдается сразу
+    - когда живых лобби больше grow_at от емкости длины L, коды становятся на букву длиннее (до max_length)
+    """
+
+    def __init__(self, store: StateStore, length: int = 4, max_length: int = 6, grow_at: float = 0.5,
+                 quarantine: float = 600.0, block: int = 32):
+        self.store = store
+        self.length = length
+        self.max_length = max_length
+        self.grow_at = grow_at
+        self.quarantine = quarantine
+        self.block = block
+
+        # length -> (a, b, следующий курсор, конец зарезервированного блока)
+        self._ranges: Dict[int, List[int]] = {}
+        self._freed: "OrderedDict[str, float]" = OrderedDict()
+        self._live = -1
+
+    def allocate(self, taken: Callable[[str], bool]) -> str:
+        """Следующий свободный код; taken — проверка, что код занят (лобби от старой схемы или другой реплики)"""
+        if self._live < 0:
+            self._live = len(self.store.keys("lobby"))
+        self._expire_quarantine()
+
+        length = self.current_length()
+        skips = 0
+        while True:
+            lid = self._encode(self._next(length), length)
+            if lid not in self._freed and not taken(lid):
+                self._live += 1
+                return lid
+            metrics.inc("bot_lobby_id_skips_total")
+            skips += 1
+            # Оценка живых лобби занижена (другие реплики) — переходим на коды длиннее
+            if skips % 64 == 0 and length < self.max_length:
+                length += 1
+
+    def release(self, lobby_id: str):
+        self._freed[lobby_id] = time.monotonic()
+        self._freed.move_to_end(lobby_id)
+        if self._live > 0: self._live -= 1
+
+    def owns(self, lobby_id: str) -> bool:
+        """Код в формате аллокатора (соло-игры идут по id чата — их коды сюда не относятся)"""
+        return self.length <= len(lobby_id) <= self.max_length and all(c in ALPHABET for c in lobby_id)
+
+    def current_length(self) -> int:
+        length = self.length
+        while length < self.max_length and self._live >= self.grow_at * len(ALPHABET) ** length:
+            length += 1
+        return length
+
+    def utilization(self) -> float:
+        return max(self._live, 0) / len(ALPHABET) ** self.current_length()
+
+    def _next(self, length: int) -> int:
+        state = self._ranges.get(length)
+        if not state or state[2] >= state[3]:
+            state = self._ranges[length] = self._reserve(length)
+        a, b, cursor, _ = state
+        state[2] += 1
+        return (a * cursor + b) % len(ALPHABET) ** length
+
+    def _reserve(self, length: int) -> List[int]:
+        size = len(ALPHABET) ** length
+        key = str(length)
+        while True:
+            record = self.store.get("lobby_ids", key)
+            if record:
+                data, version = record
+            else:
+                data, version = {"a": self._pick_multiplier(size), "b": random.randrange(size), "next": 0}, 0
+            start = data["next"]
+            data["next"] = start + self.block
+            try:
+                self.store.put("lobby_ids", key, data, expected_version=version)
+            except VersionConflict:
+                continue
+            if start // size != (start + self.block - 1) // size:
+                metrics.inc("bot_lobby_id_wraps_total", length=str(length))
+            return [data["a"], data["b"], start, start + self.block]
+
+    @staticmethod
+    def _pick_multiplier(size: int) -> int:
+        # Большой множитель, взаимно простой с 26^L: соседние коды не похожи друг на друга
+        while True:
+            a = random.randrange(size // 3, size)
+            if math.gcd(a, size) == 1: return a
+
+    @staticmethod
+    def _encode(n: int, length: int) -> str:
+        chars = []
+        for _ in range(length):
+            n, digit = divmod(n, len(ALPHABET))
+            chars.append(ALPHABET[digit])
+        return "".join(reversed(chars))
+
+    def _expire_quarantine(self):
+        deadline = time.monotonic() - self.quarantine
+        while self._freed:
+            lid, freed_at = next(iter(self._freed.items()))
+            if freed_at > deadline: break
+            del self._freed[lid]
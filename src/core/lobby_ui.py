@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from src.core.lobby import Lobby
+from src.core.metrics import metrics
+from src.core.tasks import task_supervisor
+
+ROLE_HOST = "host"
+ROLE_GUEST = "guest"
+
+
+class LobbyUI:
+    """
+    Меню лобби у участников.
+    - refresh() ничего не рисует сразу: лобби помечается "грязным" и перерисовывается через delay секунд,
+      так что пачка входов/выходов — одна правка на участника
+    - на отрисовке лобби берется заново через resolve (актуальное состояние, в т.ч. с другой реплики)
+    - клавиатуры кэшируются по роли (хост/гость), правки уходят параллельно
+    - участнику, у которого вид не изменился (то же сообщение, та же роль, тот же текст), ничего не отправляется
+    - заблокировавшие бота отдаются on_dead; лобби перерисовывается в том же цикле, без новых задач
+    """
+
+    def __init__(self, edit: Callable[..., Awaitable], resolve: Callable[[str], Optional[Lobby]],
+                 render_text: Callable[[Lobby], str], render_keyboard: Callable[[Lobby, str], Any],
+                 delay: float = 0.5):
+        self.edit = edit
+        self.resolve = resolve
+        self.render_text = render_text
+        self.render_keyboard = render_keyboard
+        self.delay = delay
+        # Убирает мертвых участников, возвращает лобби для перерисовки (None — лобби закрыто)
+        self.on_dead: Optional[Callable[[Lobby, List[int]], Optional[Lobby]]] = None
+
+        self._dirty: Set[str] = set()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # lobby_id -> {user_id: (message_id, role, hash текста)}
+        self._views: Dict[str, Dict[int, Tuple[int, str, int]]] = {}
+        self._keyboards: Dict[Tuple[str, str], Any] = {}
+
+    def refresh(self, lobby: Union[Lobby, str]):
+        lobby_id = lobby if isinstance(lobby, str) else lobby.lobby_id
+        self._dirty.add(lobby_id)
+        if lobby_id not in self._tasks:
+            self._tasks[lobby_id] = task_supervisor.spawn(self._run(lobby_id), owner="lobby", key=lobby_id,
+                                                          name="lobby_ui")
+
+    def forget(self, lobby_id: str):
+        """Лобби закрыто или игра началась: отложенная перерисовка не нужна"""
+        self._dirty.discard(lobby_id)
+        self._views.pop(lobby_id, None)
+        for role in (ROLE_HOST, ROLE_GUEST):
+            self._keyboards.pop((lobby_id, role), None)
+
+    def keyboard(self, lobby: Lobby, role: str):
+        key = (lobby.lobby_id, role)
+        markup = self._keyboards.get(key)
+        if markup is None:
+            markup = self._keyboards[key] = self.render_keyboard(lobby, role)
+        return markup
+
+    def __len__(self) -> int:
+        return len(self._views)
+
+    async def _run(self, lobby_id: str):
+        try:
+            delay = self.delay
+            while lobby_id in self._dirty:
+                if delay > 0: await asyncio.sleep(delay)
+                delay = self.delay
+                if lobby_id not in self._dirty: break
+                self._dirty.discard(lobby_id)
+
+                lobby = self.resolve(lobby_id)
+                if not lobby or lobby.status != "waiting":
+                    self.forget(lobby_id)
+                    break
+                dead = await self._render(lobby)
+                if dead and self.on_dead:
+                    lobby = self.on_dead(lobby, dead)
+                    if lobby and lobby.players:
+                        # Список игроков поменялся — перерисовываем сразу, без ожидания окна
+                        self._dirty.add(lobby_id)
+                        delay = 0
+        except Exception as e:
+            logging.error(f"Lobby UI {lobby_id} failed: {e}")
+        finally:
+            self._tasks.pop(lobby_id, None)
+
+    async def _render(self, lobby: Lobby) -> List[int]:
+        text = self.render_text(lobby)
+        digest = hash(text)
+        views = self._views.setdefault(lobby.lobby_id, {})
+        for uid in [uid for uid in views if uid not in lobby.user_interfaces]:
+            del views[uid]
+
+        targets = []
+        for user_id, message_id in lobby.user_interfaces.items():
+            if user_id < 0 or not message_id: continue
+            role = ROLE_HOST if user_id == lobby.host_id else ROLE_GUEST
+            view = (message_id, role, digest)
+            if views.get(user_id) == view:
+                metrics.inc("bot_lobby_ui_edits_total", result="skipped")
+                continue
+            targets.append((user_id, view))
+
+        results = await asyncio.gather(*[self._edit(uid, view, text, self.keyboard(lobby, view[1]))
+                                         for uid, view in targets])
+        dead = []
+        for (user_id, view), result in zip(targets, results):
+            metrics.inc("bot_lobby_ui_edits_total", result=result)
+            if result == "sent":
+                views[user_id] = view
+            elif result == "dead":
+                views.pop(user_id, None)
+                dead.append(user_id)
+        return dead
+
+    async def _edit(self, user_id: int, view: Tuple[int, str, int], text: str, markup) -> str:
+        for _ in range(2):
+            try:
+                await self.edit(chat_id=user_id, message_id=view[0], text=text, reply_markup=markup)
+                return "sent"
+            except TelegramForbiddenError:
+                return "dead"
+            except TelegramBadRequest as e:
+                # "message is not modified": у участника уже этот вид
+                return "sent" if "not modified" in str(e) else "failed"
+            except Exception as e:
+                retry_after = getattr(e, "retry_after", None)
+                if not retry_after: return "failed"
+                await asyncio.sleep(retry_after)
+        return "failed"
@@ -0,0 +1,108 @@
+import datetime
+import gzip
+import json
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Union
+
+from src.core.logger import PROMPT_LINE_SEP
+
+# Записи, с которых начинается ход игрока (Бункер / Детектив)
+TURN_EVENTS = ("TURN_START", "TURN")
+
+
+def _read_jsonl(path: str) -> Iterator[dict]:
+    if not os.path.exists(path): return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+        except EOFError:
+            # Лог живой игры или оборванный процесс: последний gzip-member без хвоста — читаем, что успело записаться
+            return
+
+
+def load_blobs(session_dir: str) -> Dict[int, Union[str, list]]:
+    """hash -> текст строки или части сообщения из prompt_blobs.jsonl.gz сессии"""
+    return {record["h"]: record["text"] if "text" in record else record["parts"]
+            for record in _read_jsonl(os.path.join(session_dir, "prompt_blobs.jsonl.gz"))}
+
+
+def rehydrate_text(h: int, blobs: Dict[int, Union[str, list]]) -> str:
+    blob = blobs.get(h)
+    if blob is None: return f"<missing blob {h}>"
+    if isinstance(blob, str): return blob
+    return PROMPT_LINE_SEP.join(part if isinstance(part, str) else rehydrate_text(part, blobs) for part in blob)
+
+
+def rehydrate_prompt(prompt: list, blobs: Dict[int, Union[str, list]]) -> list:
+    """Сообщения записи LLM со ссылками на блобы -> исходные {"role", "content"}"""
+    return [{"role": m["role"], "content": rehydrate_text(m["h"], blobs)} if "h" in m else m for m in prompt]
+
+
+def iter_records(session_dir: str, rehydrate: bool = True) -> Iterator[dict]:
+    """Записи events.jsonl.gz по порядку; в записях LLM промпты собраны обратно из блобов"""
+    blobs = load_blobs(session_dir) if rehydrate else {}
+    for record in _read_jsonl(os.path.join(session_dir, "events.jsonl.gz")):
+        if rehydrate and record.get("type") == "LLM":
+            record["prompt"] = rehydrate_prompt(record.get("prompt", []), blobs)
+        yield record
+
+
+def format_record(record: dict) -> str:
+    """Запись -> строка в духе старого game_events.log"""
+    clock = datetime.datetime.fromtimestamp(record["ts"]).strftime("%H:%M:%S")
+    where = f"R{record['round']} {record.get('phase', '')} " if "round" in record else ""
+    latency = f" ({record['latency_ms']} ms)" if "latency_ms" in record else ""
+    if record["type"] == "LLM":
+        body = f"{record.get('actor', '?')} via {record.get('model')}: {record.get('response', '')}"
+    else:
+        body = record.get("msg", "")
+        if record.get("details"): body += f"\nDETAILS: {json.dumps(record['details'], ensure_ascii=False)}"
+    return f"{clock} | {where}[{record['type']}] {body}{latency}"
+
+
+def turn_timeline(records: Iterable[dict], turn_events: Iterable[str] = TURN_EVENTS) -> List[dict]:
+    """
+    Ходы по порядку: кто ходил, сколько длился ход (до начала следующего) и сколько из этого заняли LLM.
+    Время — по monotonic-меткам t одного процесса, без разбора текста.
+    """
+    turn_events = set(turn_events)
+    turns, current = [], None
+    for record in records:
+        if record["type"] in turn_events:
+            if current:
+                current["end_t"] = record["t"]
+                turns.append(current)
+            current = {"round": record.get("round"), "phase": record.get("phase"), "actor": record.get("actor"),
+                       "start_t": record["t"], "end_t": record["t"], "llm_calls": 0, "llm_ms": 0.0}
+            continue
+        if not current: continue
+        # Последний ход — до последней записи лога
+        current["end_t"] = record["t"]
+        if record["type"] == "LLM":
+            current["llm_calls"] += 1
+            current["llm_ms"] += record.get("latency_ms", 0.0)
+    if current: turns.append(current)
+    for turn in turns:
+        turn["duration_ms"] = round((turn["end_t"] - turn["start_t"]) / 1e6, 1)
+        turn["llm_ms"] = round(turn["llm_ms"], 1)
+    return turns
+
+
+if __name__ == "__main__":
+    # python -m src.core.log_reader Logs/Bunker/Host/2026-01-01_12-00-00_ABCD [--json | --timeline]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(args) != 1:
+        sys.exit("Usage: python -m src.core.log_reader <session_dir> [--json | --timeline]")
+    if "--timeline" in sys.argv:
+        for row in turn_timeline(iter_records(args[0], rehydrate=False)):
+            print(f"R{row['round']} {row['phase']:<12} {str(row['actor']):<20} "
+                  f"{row['duration_ms']:>9.1f} ms  llm {row['llm_calls']} x {row['llm_ms']:.1f} ms")
+    elif "--json" in sys.argv:
+        for rec in iter_records(args[0]):
+            print(json.dumps(rec, ensure_ascii=False))
+    else:
+        for rec in iter_records(args[0]):
+            print(format_record(rec))
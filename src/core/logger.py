@@ -1,39 +1,268 @@
+import atexit
 import datetime
+import gzip
+import hashlib
 import json
-import os
 import logging
+import os
+import queue
 import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, IO, Optional
+
+
+class LogWriter:
+    """
+    Один фоновый поток пишет логи всех сессий.
+    - вызывающий код (event loop) только кладет запись в очередь: ни файлового I/O, ни json.dumps
+    - запись = (path, render, args): строка собирается уже в потоке (ленивая сериализация);
+      render может вернуть и список (path, строка) — запись сразу в несколько файлов сессии
+    - поток забирает записи пачками, пишет их и делает flush; fsync — не чаще раза в fsync_every секунд
+    - открытые файлы — LRU-пул на max_open дескрипторов: давно молчащий лог закрывается и при следующей
+      записи открывается заново (append); close(path) в конце сессии закрывает файл сразу
+    - файлы *.gz пишутся потоковым gzip: flush пачки — Z_SYNC_FLUSH (прочитать можно и недописанный лог),
+      переоткрытие после вытеснения из пула добавляет новый gzip-member (gzip читает их подряд)
+    Поток стартует лениво (в т.ч. заново в процессе-воркере после fork).
+    """
+
+    def __init__(self, batch: int = 512, fsync_every: float = 2.0, max_open: int = 64):
+        self.batch = batch
+        self.fsync_every = fsync_every
+        self.max_open = max_open
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._files: "OrderedDict[str, IO]" = OrderedDict()
+        self._dirty = set()
+        self._last_sync = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+
+    def write(self, path: str, render: Callable[..., str], *args):
+        self._ensure_thread()
+        self._queue.put((path, render, args))
+
+    def close(self, path: str):
+        """Конец сессии: дописать очередь и закрыть файл (запись после close снова откроет его)"""
+        if self._thread and self._thread.is_alive():
+            self._queue.put((path, None, None))
+
+    def open_files(self) -> int:
+        return len(self._files)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Ждет, пока поток допишет (с fsync) все, что было в очереди на момент вызова"""
+        if not self._thread or not self._thread.is_alive(): return True
+        done = threading.Event()
+        self._queue.put((None, done, None))
+        return done.wait(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_thread(self):
+        if self._thread and self._pid == os.getpid(): return
+        with self._lock:
+            if self._thread and self._pid == os.getpid(): return
+            self._pid = os.getpid()
+            self._files = OrderedDict()
+            self._dirty = set()
+            self._thread = threading.Thread(target=self._run, name="session-log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush, 2.0)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logging.error(f"Session log writer failed: {e}")
+
+    def _write_batch(self, batch: list):
+        lines: Dict[str, list] = {}
+        markers = []
+        closing = []
+        for path, render, args in batch:
+            if path is None:
+                markers.append(render)
+                continue
+            if render is None:
+                closing.append(path)
+                continue
+            try:
+                out = render(*args)
+                for target, line in ([(path, out)] if isinstance(out, str) else out):
+                    lines.setdefault(target, []).append(line)
+            except Exception as e:
+                logging.error(f"Session log record dropped ({path}): {e}")
+
+        for path, chunk in lines.items():
+            f = self._file(path)
+            if not f: continue
+            f.write("\n".join(chunk) + "\n")
+            f.flush()
+            self._dirty.add(path)
+
+        for path in closing:
+            self._close(path)
+        if markers or time.monotonic() - self._last_sync >= self.fsync_every:
+            self._sync()
+        for done in markers:
+            done.set()
+
+    def _file(self, path: str) -> Optional[IO]:
+        f = self._files.get(path)
+        if f is not None:
+            self._files.move_to_end(path)
+            return f
+        while len(self._files) >= self.max_open:
+            self._close(next(iter(self._files)))
+        try:
+            if path.endswith(".gz"):
+                f = gzip.open(path, "at", encoding="utf-8", compresslevel=6)
+            else:
+                f = open(path, "a", encoding="utf-8")
+            self._files[path] = f
+        except OSError as e:
+            logging.error(f"Cannot open session log {path}: {e}")
+            return None
+        return f
+
+    def _close(self, path: str):
+        f = self._files.pop(path, None)
+        if f is None: return
+        try:
+            f.flush()
+            if path in self._dirty: os.fsync(f.fileno())
+            f.close()
+        except OSError as e:
+            logging.error(f"Cannot close session log {path}: {e}")
+        self._dirty.discard(path)
+
+    def _sync(self):
+        for path in self._dirty:
+            f = self._files.get(path)
+            if not f: continue
+            try:
+                os.fsync(f.fileno())
+            except OSError:
+                pass
+        self._dirty.clear()
+        self._last_sync = time.monotonic()
+
+
+log_writer = LogWriter()
+
+
+def _record(t: int, ts: float, event_type: str, lobby_id: str, context: Optional[dict], **fields) -> dict:
+    """Общие поля записи лога сессии; пустые поля не пишутся"""
+    record = {"t": t, "ts": round(ts, 3), "type": event_type, "lobby": lobby_id}
+    if context: record.update(context)
+    record.update((k, v) for k, v in fields.items() if v is not None and v != "")
+    return record
+
+
+def _render_event(t: int, ts: float, event_type: str, lobby_id: str, context: Optional[dict], message: str,
+                  details: Optional[dict], actor: Optional[str], latency_ms: Optional[float]) -> str:
+    record = _record(t, ts, event_type, lobby_id, context, actor=actor, latency_ms=latency_ms, msg=message,
+                     details=details or None)
+    return json.dumps(record, ensure_ascii=False)
+
+
+PROMPT_LINE_SEP = "\n"
+
+
+def blob_hash(text: str) -> int:
+    """48-битный хэш блоба: ссылка — JSON-число, короче hex-строки и не путается с текстом"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=6).digest(), "big")
+
+
+def split_prompt(content: str, min_blob: int) -> list:
+    """Текст сообщения -> части: строки от min_blob символов становятся блобами (hash, text), короткие — текстом"""
+    parts = []
+    for line in content.split(PROMPT_LINE_SEP):
+        if len(line) >= min_blob:
+            parts.append((blob_hash(line), line))
+        elif parts and isinstance(parts[-1], str):
+            parts[-1] += PROMPT_LINE_SEP + line
+        else:
+            parts.append(line)
+    return parts
 
 
 class SessionLogger:
-    def __init__(self, game_name: str, lobby_id: str, host_name: str):
+    # Строки промптов короче этого хранятся в сообщении как есть, длиннее — блобом
+    MIN_BLOB = 20
+
+    def __init__(self, game_name: str, lobby_id: str, host_name: str, writer: LogWriter = log_writer):
         """
         game_name: Название игры (Bunker, Detective) - будет папкой верхнего уровня.
         host_name: Имя создателя - будет подпапкой.
         """
         self.base_log_dir = "Logs"
+        self.writer = writer
+        self.closed = False
+        self.lobby_id = lobby_id
+        # Текущие round/phase игры для каждой записи; задает игра (GameEngine.log_context)
+        self.context: Optional[Callable[[], dict]] = None
 
         # 1. Санитизация (Очистка от смайликов и пробелов)
-        safe_game = self._sanitize_name(game_name)
-        safe_host = self._sanitize_name(host_name)
+        self._safe_game = self._sanitize_name(game_name)
+        self._safe_host = self._sanitize_name(host_name)
 
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        session_folder_name = f"{timestamp}_{lobby_id}"
+        self._set_folder(f"{timestamp}_{lobby_id}")
+        self._blobs = set()
+
+        # Папка и запись о начале сессии создаются при первой записи: игра, поднятая из снимка,
+        # успевает переключиться на свою прежнюю папку (resume) и не оставляет пустых сессий
+        self._start_msg: Optional[str] = \
+            f"=== SESSION START: {game_name} | Lobby: {lobby_id} | Host: {host_name} ==="
+
+    def _set_folder(self, session_folder_name: str):
+        self.session_folder = session_folder_name
 
         # 2. Локальный путь: Logs / Detective / Alexey / 2026-01-01_LobbyID
-        self.session_dir = os.path.join(self.base_log_dir, safe_game, safe_host, session_folder_name)
+        self.session_dir = os.path.join(self.base_log_dir, self._safe_game, self._safe_host, session_folder_name)
 
         # 3. Путь для S3: Detective/Alexey/2026-01-01_LobbyID
         # (Всегда используем прямые слеши для облака)
-        self.s3_path = f"{safe_game}/{safe_host}/{session_folder_name}"
+        self.s3_path = f"{self._safe_game}/{self._safe_host}/{session_folder_name}"
 
-        # Создаем полную структуру папок
-        os.makedirs(self.session_dir, exist_ok=True)
+        # Лог событий — JSONL в gzip, запись на строку:
+        # {"t": monotonic_ns, "ts": unix, "type", "lobby", "round", "phase", "actor", "latency_ms", "msg", "details"}
+        # У записей "LLM" вместо msg/details — model, prompt, response.
+        # Чтение, промпты целиком и таймлайн ходов: python -m src.core.log_reader
+        self.events_path = os.path.join(self.session_dir, "events.jsonl.gz")
+        # Блобы промптов, каждый уникальный пишется один раз за сессию:
+        # - строка (куски шаблонов, реплики истории): {"h": hash, "text": ...}
+        # - сообщение целиком: {"h": hash, "parts": [текст | hash строки, ...]}
+        # Сообщения в записи LLM — {"role", "h"}
+        self.blobs_path = os.path.join(self.session_dir, "prompt_blobs.jsonl.gz")
 
-        self.main_logger = self._create_file_logger("game", "game_events.log")
+    def resume(self, session_folder_name: str):
+        """Игра восстановлена (рестарт, новый воркер): логи продолжаются в прежней папке сессии"""
+        if session_folder_name == self.session_folder: return
+        if not self._start_msg:
+            # В новую папку уже писали — закрываем ее файлы
+            self.writer.close(self.events_path)
+            self.writer.close(self.blobs_path)
+        self._set_folder(session_folder_name)
+        self._start_msg = f"=== SESSION RESUMED: Lobby: {self.lobby_id} ==="
 
-        start_msg = f"=== SESSION START: {game_name} | Lobby: {lobby_id} | Host: {host_name} ==="
-        self.log_event("SYSTEM", start_msg)
+    def _ensure_started(self):
+        start_msg, self._start_msg = self._start_msg, None
+        # Создаем полную структуру папок
+        os.makedirs(self.session_dir, exist_ok=True)
+        self.writer.write(self.events_path, _render_event, time.monotonic_ns(), time.time(), "SYSTEM",
+                          self.lobby_id, None, start_msg, None, None, None)
 
     def _sanitize_name(self, text: str) -> str:
         """Убирает все кроме букв, цифр и нижнего подчеркивания"""
@@ -43,35 +272,74 @@ class SessionLogger:
         clean = re.sub(r'[^\w\-_]', '', text)
         return clean if clean else "Unknown"
 
-    def _create_file_logger(self, name_suffix: str, filename: str):
-        logger = logging.getLogger(f"{name_suffix}_{id(self)}")
-        logger.setLevel(logging.INFO)
-        # Удаляем старые хендлеры
-        if logger.hasHandlers():
-            logger.handlers.clear()
-
-        fh = logging.FileHandler(os.path.join(self.session_dir, filename), encoding='utf-8')
-        fh.setFormatter(logging.Formatter("%(asctime)s | %(message)s", datefmt="%H:%M:%S"))
-        logger.addHandler(fh)
-        return logger
-
-    def log_event(self, event_type: str, message: str, details: dict = None):
-        msg = f"[{event_type}] {message}"
-        if details:
-            msg += f"\nDETAILS: {json.dumps(details, ensure_ascii=False)}"
-        self.main_logger.info(msg)
-        print(f"📝 {msg[:100]}...")
-
-    def log_llm(self, model: str, prompt: list, response: str):
-        entry = {
-            "model": model,
-            "prompt": prompt,
-            "response": response
-        }
-        self.main_logger.info(f"[LLM] {json.dumps(entry, ensure_ascii=False)}")
+    def _context(self) -> Optional[dict]:
+        if not self.context: return None
+        try:
+            return self.context()
+        except Exception:
+            return None
+
+    # details/prompt сериализуются в потоке записи: после вызова их не изменяют (вызывающие передают свежие объекты)
+    def log_event(self, event_type: str, message: str, details: dict = None, actor: str = None,
+                  latency_ms: float = None):
+        if self.closed: return
+        if self._start_msg: self._ensure_started()
+        self.writer.write(self.events_path, _render_event, time.monotonic_ns(), time.time(), event_type,
+                          self.lobby_id, self._context(), message, details, actor, latency_ms)
+
+    def log_llm(self, model: str, prompt: list, response: str, latency_ms: float = None, actor: str = None):
+        if self.closed: return
+        if self._start_msg: self._ensure_started()
+        self.writer.write(self.events_path, self._render_llm, time.monotonic_ns(), time.time(), self._context(),
+                          model, prompt, response, latency_ms, actor)
+
+    def _render_llm(self, t: int, ts: float, context: Optional[dict], model: str, prompt: list, response: str,
+                    latency_ms: Optional[float], actor: Optional[str]) -> list:
+        # Выполняется в потоке записи: _blobs трогает только он
+        out = []
+        messages = []
+        for message in prompt:
+            content = message.get("content")
+            if not isinstance(content, str):
+                messages.append(message)
+                continue
+            message_hash = blob_hash(content)
+            if message_hash not in self._blobs:
+                # Повторный промпт (шаблон судьи/режиссера) — одна ссылка; новый — строки блобами
+                parts = []
+                for part in split_prompt(content, self.MIN_BLOB):
+                    if isinstance(part, str):
+                        parts.append(part)
+                        continue
+                    h, text = part
+                    if h not in self._blobs:
+                        self._blobs.add(h)
+                        out.append((self.blobs_path, json.dumps({"h": h, "text": text}, ensure_ascii=False)))
+                    parts.append(h)
+                # Сообщение из одной длинной строки уже записано блобом-строкой с тем же хэшем
+                if message_hash not in self._blobs:
+                    self._blobs.add(message_hash)
+                    out.append((self.blobs_path, json.dumps({"h": message_hash, "parts": parts}, ensure_ascii=False)))
+            messages.append({"role": message.get("role"), "h": message_hash})
+
+        record = _record(t, ts, "LLM", self.lobby_id, context, actor=actor, latency_ms=latency_ms, model=model,
+                         prompt=messages, response=response)
+        out.append((self.events_path, json.dumps(record, ensure_ascii=False)))
+        return out
+
+    def flush(self):
+        """Блокирует до записи на диск — вызывать вне event loop (asyncio.to_thread)"""
+        self.writer.flush()
+
+    def close(self):
+        """Конец сессии: дальнейшие записи игнорируются, файл закрывается после записи очереди"""
+        if self.closed: return
+        self.closed = True
+        self.writer.close(self.events_path)
+        self.writer.close(self.blobs_path)
 
     def get_session_path(self) -> str:
         return self.session_dir
 
     def get_s3_target_path(self) -> str:
-        return self.s3_path
\ No newline at end of file
+        return self.s3_path
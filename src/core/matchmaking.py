@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src.core.tasks import task_supervisor
+from src.core.timers import TimerWheel
+
+
+class Matchmaker:
+    """
+    Очередь "Быстрой игры" по типу игры.
+    - набралось size человек — сразу матч
+    - самый старый в очереди ждет max_wait секунд — матч из тех, кто есть (недостающих добьют боты)
+    Запись очереди: {"id", "name", "chat_id", "message_id", "enqueued_at"}.
+    Старт лобби делает ядро в on_match(game_type, entries).
+    """
+
+    def __init__(self, wheel: TimerWheel, size: int = 4, max_wait: float = 45.0):
+        self.wheel = wheel
+        self.size = size
+        self.max_wait = max_wait
+        self.on_match: Optional[Callable[[str, List[dict]], Awaitable]] = None
+
+        self._queues: Dict[str, "OrderedDict[int, dict]"] = {}
+        self._user_queue: Dict[int, str] = {}
+
+    def join(self, game_type: str, user_id: int, name: str, chat_id: int, message_id: int) -> int:
+        """Ставит в очередь (повторный вход — в конец); возвращает длину очереди"""
+        self.leave(user_id)
+        queue = self._queues.setdefault(game_type, OrderedDict())
+        queue[user_id] = {"id": user_id, "name": name, "chat_id": chat_id, "message_id": message_id,
+                          "enqueued_at": time.monotonic()}
+        self._user_queue[user_id] = game_type
+
+        if len(queue) >= self.size:
+            self._dispatch(game_type, self._take(game_type))
+        elif len(queue) == 1:
+            self._arm(game_type, self.max_wait)
+        return len(queue)
+
+    def leave(self, user_id: int) -> bool:
+        game_type = self._user_queue.pop(user_id, None)
+        if not game_type: return False
+        queue = self._queues.get(game_type)
+        if queue: queue.pop(user_id, None)
+        return True
+
+    def queued_game(self, user_id: int) -> Optional[str]:
+        return self._user_queue.get(user_id)
+
+    def waiting(self, game_type: str) -> List[dict]:
+        return list(self._queues.get(game_type, {}).values())
+
+    def __len__(self) -> int:
+        return len(self._user_queue)
+
+    def _take(self, game_type: str) -> List[dict]:
+        queue = self._queues.get(game_type, OrderedDict())
+        batch = []
+        while queue and len(batch) < self.size:
+            _, entry = queue.popitem(last=False)
+            self._user_queue.pop(entry["id"], None)
+            batch.append(entry)
+        if queue:
+            self._arm_for_oldest(game_type)
+        return batch
+
+    def _dispatch(self, game_type: str, batch: List[dict]):
+        if batch and self.on_match:
+            task_supervisor.spawn(self.on_match(game_type, batch), owner="lobby", key=f"mm:{game_type}",
+                                  name="quick_match")
+
+    def _arm(self, game_type: str, delay: float):
+        self.wheel.schedule(("mm", game_type), max(self.wheel.tick, delay), lambda: self._on_timeout(game_type),
+                            owner_key=f"mm:{game_type}")
+
+    def _arm_for_oldest(self, game_type: str):
+        oldest = next(iter(self._queues[game_type].values()))
+        self._arm(game_type, oldest["enqueued_at"] + self.max_wait - time.monotonic())
+
+    async def _on_timeout(self, game_type: str):
+        queue = self._queues.get(game_type)
+        if not queue: return
+        oldest = next(iter(queue.values()))
+        if time.monotonic() - oldest["enqueued_at"] < self.max_wait:
+            # Старый игрок ушел из очереди — ждем следующего по старшинству
+            self._arm_for_oldest(game_type)
+            return
+        self._dispatch(game_type, self._take(game_type))
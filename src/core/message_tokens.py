@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class MessageTokenStore:
+    """
+    Хранилище токенов сообщений (token -> message_id) с разбивкой по играм.
+    Токены вроде "turn_1_presentation_0" или "dash_{id}" не уникальны между играми,
+    поэтому ключ всегда (lobby_id, chat_id, token).
+    - release(lobby_id) освобождает все токены игры (вызывается на game_over)
+    - LRU-лимиты: старые токены внутри игры и самые давние игры вытесняются
+    - TTL от последнего обращения: протухшие токены и брошенные игры чистятся
+      каждые sweep_every записей
+    """
+
+    def __init__(self, max_per_game: int = 256, max_games: int = 5000, ttl: float = 6 * 3600,
+                 sweep_every: int = 1000):
+        self.max_per_game = max_per_game
+        self.max_games = max_games
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+
+        # {lobby_id: OrderedDict{(chat_id, token): (message_id, ts)}}
+        self._games: "OrderedDict[str, OrderedDict[Tuple[int, str], Tuple[int, float]]]" = OrderedDict()
+        self._writes = 0
+
+    def set(self, lobby_id: str, chat_id: int, token: str, message_id: int):
+        bucket = self._games.get(lobby_id)
+        if bucket is None:
+            bucket = self._games[lobby_id] = OrderedDict()
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+        self._games.move_to_end(lobby_id)
+
+        key = (chat_id, token)
+        bucket[key] = (message_id, time.monotonic())
+        bucket.move_to_end(key)
+        while len(bucket) > self.max_per_game:
+            bucket.popitem(last=False)
+
+        self._writes += 1
+        if self._writes % self.sweep_every == 0:
+            self.sweep()
+
+    def get(self, lobby_id: str, chat_id: int, token: str) -> Optional[int]:
+        bucket = self._games.get(lobby_id)
+        if not bucket: return None
+
+        key = (chat_id, token)
+        item = bucket.get(key)
+        if not item: return None
+
+        message_id, ts = item
+        now = time.monotonic()
+        if now - ts > self.ttl:
+            del bucket[key]
+            return None
+        # Обращение продлевает жизнь токена и сохраняет порядок по времени
+        bucket[key] = (message_id, now)
+        bucket.move_to_end(key)
+        return message_id
+
+    def release(self, lobby_id: str):
+        self._games.pop(lobby_id, None)
+
+    def sweep(self):
+        """Удаляет протухшие токены и пустые игры"""
+        deadline = time.monotonic() - self.ttl
+        for lid in list(self._games.keys()):
+            bucket = self._games[lid]
+            # OrderedDict упорядочен по времени последнего доступа
+            while bucket:
+                key, (_, ts) = next(iter(bucket.items()))
+                if ts >= deadline: break
+                bucket.popitem(last=False)
+            if not bucket:
+                del self._games[lid]
+
+    def games_count(self) -> int:
+        return len(self._games)
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self._games.values())
@@ -0,0 +1,54 @@
+import threading
+from typing import Callable, Dict, Tuple, Union
+
+Number = Union[int, float]
+
+
+class Metrics:
+    """
+    Минимальный реестр метрик для /metrics (текстовый формат Prometheus).
+    - inc(): счетчики с метками
+    - gauge(): функция, которая при рендере возвращает число или {метка: число}
+    """
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Number] = {}
+        self._gauges: Dict[str, Tuple[Callable[[], Union[Number, Dict[str, Number]]], str]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: Number = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name: str, fn: Callable[[], Union[Number, Dict[str, Number]]], label: str = "kind"):
+        self._gauges[name] = (fn, label)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = list(self._counters.items())
+        for (name, labels), value in sorted(counters):
+            lines.append(f"{name}{self._labels(labels)} {value}")
+
+        for name, (fn, label) in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if isinstance(value, dict):
+                for k, v in sorted(value.items()):
+                    lines.append(f"{name}{self._labels(((label, str(k)),))} {v}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels) -> str:
+        if not labels: return ""
+        inner = ",".join(f'{k}="{v}"' for k, v in labels)
+        return "{" + inner + "}"
+
+
+# Глобальный инстанс
+metrics = Metrics()
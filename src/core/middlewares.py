@@ -0,0 +1,192 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from src.core.metrics import metrics
+from src.core.rate_limit import TokenBucket
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """
+    Ограничивает число апдейтов, которые обрабатываются одновременно.
+    В webhook-режиме каждый апдейт уходит в фоновую задачу сразу после ответа Telegram.
+    Слот держится только на время обработчика: долгие ходы ботов (LLM) ядро выносит в отдельные задачи
+    со своим лимитом, иначе несколько игр с ботами занимают все слоты и прием апдейтов встает.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(limit)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            async with self._semaphore:
+                return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0: self._idle.set()
+
+    async def wait_idle(self):
+        """Ждет, пока не останется апдейтов в обработке (для мягкой остановки)"""
+        await self._idle.wait()
+
+
+class TTLSet:
+    """Множество ключей с одинаковым временем жизни (порядок вставки = порядок истечения)"""
+
+    def __init__(self, ttl: float, max_size: int = 100_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._sweep()
+        return key in self._items
+
+    def add(self, key: Hashable):
+        self._items[key] = time.monotonic() + self.ttl
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _sweep(self):
+        now = time.monotonic()
+        while self._items:
+            key, expires = next(iter(self._items.items()))
+            if expires > now: break
+            self._items.popitem(last=False)
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """Повторная доставка того же update_id (ретрай webhook, рестарт polling) отбрасывается"""
+
+    def __init__(self, ttl: float = 600.0):
+        self._seen = TTLSet(ttl)
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        update_id = getattr(event, "update_id", None)
+        if update_id is not None:
+            if update_id in self._seen:
+                metrics.inc("bot_duplicate_updates_total", kind="update")
+                return None
+            self._seen.add(update_id)
+        return await handler(event, data)
+
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    """
+    Повторы нажатий.
+    - тот же callback.id (повторная доставка) не обрабатывается дважды никогда
+    - двойное нажатие на действие игры (applies): (user, callback_data, message_id) пропускается один раз —
+      дубль блокируется, пока первое нажатие обрабатывается, и еще ttl секунд после.
+      Меню и лобби (листание, "назад") так не склеиваются: там повтор — осознанное действие
+    Ответ на дубль — сразу answer_callback_query, без работы игры.
+    """
+
+    def __init__(self, ttl: float = 2.0, applies: Optional[Callable[[TelegramObject], bool]] = None):
+        self.applies = applies
+        self._recent = TTLSet(ttl)
+        self._seen_ids = TTLSet(max(ttl, 60.0))
+        self._in_flight = set()
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if event.id in self._seen_ids:
+            metrics.inc("bot_duplicate_updates_total", kind="callback")
+            return None
+        self._seen_ids.add(event.id)
+        if self.applies and not self.applies(event):
+            return await handler(event, data)
+
+        message_id = event.message.message_id if getattr(event, "message", None) else event.inline_message_id
+        key = (event.from_user.id, event.data, message_id)
+        if key in self._in_flight or key in self._recent:
+            metrics.inc("bot_duplicate_updates_total", kind="callback")
+            try:
+                await event.answer("⏳ Уже обрабатывается")
+            except Exception:
+                pass
+            return None
+
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
+            self._recent.add(key)
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """
+    Лимит ввода людей (сообщения и кнопки) до игровой логики: каждое сообщение в бункере — это LLM-вызов судьи.
+    Два уровня token bucket: на пользователя и на лобби (весь стол вместе).
+    applies отбирает, что считается вводом в игру: меню, команды и /start лимит не тратят.
+    Отказ дешевый: на кнопку — answer_callback_query, на сообщение — одно предупреждение раз в warn_every секунд;
+    в ответе — через сколько секунд можно снова.
+    """
+
+    def __init__(self, user_bucket: TokenBucket, lobby_bucket: TokenBucket,
+                 resolve_lobby: Callable[[int], Optional[str]], warn_every: float = 10.0,
+                 applies: Optional[Callable[[TelegramObject], bool]] = None):
+        self.user_bucket = user_bucket
+        self.lobby_bucket = lobby_bucket
+        self.resolve_lobby = resolve_lobby
+        self.warn_every = warn_every
+        self.applies = applies
+        self._warned = TTLSet(warn_every)
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        user = getattr(event, "from_user", None)
+        if not user or (self.applies and not self.applies(event)):
+            return await handler(event, data)
+
+        scope = None
+        if not self.user_bucket.allow(user.id):
+            scope, wait = "user", self.user_bucket.retry_after(user.id)
+        else:
+            message = event if isinstance(event, Message) else getattr(event, "message", None)
+            lobby_id = self.resolve_lobby(message.chat.id) if message else None
+            if lobby_id and not self.lobby_bucket.allow(lobby_id):
+                scope, wait = "lobby", self.lobby_bucket.retry_after(lobby_id)
+
+        if not scope:
+            return await handler(event, data)
+
+        metrics.inc("bot_rate_limited_total", scope=scope)
+        text = "🐢 Слишком часто." if scope == "user" else "🐢 Стол перегружен."
+        # Нулевая скорость ведра — ждать бесполезно
+        if math.isfinite(wait):
+            text += f" Попробуйте через {max(1, math.ceil(wait))} сек."
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(text)
+            elif user.id not in self._warned:
+                self._warned.add(user.id)
+                await event.answer(text)
+        except Exception:
+            pass
+        return None
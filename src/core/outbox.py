@@ -0,0 +1,108 @@
+import re
+from typing import Dict, List, Tuple, Union
+
+TELEGRAM_TEXT_LIMIT = 4096
+
+ChatId = Union[int, str]
+
+# Токены HTML-текста: тег, сущность, перевод строки, пробелы, слово, одиночные < и &
+_HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;|\n|[^\S\n]+|[^<&\s]+|[<&]")
+_HTML_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)")
+
+Tags = Tuple[Tuple[str, str], ...]
+
+
+def _apply_tag(stack: Tags, token: str) -> Tags:
+    """Стек открытых тегов (имя, открывающий тег) после токена"""
+    match = _HTML_TAG.match(token)
+    if not match: return stack
+    closing, name = match.group(1), match.group(2).lower()
+    if not closing: return stack + ((name, token),)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] == name: return stack[:i] + stack[i + 1:]
+    return stack
+
+
+def _close(stack: Tags) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def split_html(text: str, limit: int = TELEGRAM_TEXT_LIMIT) -> List[str]:
+    """
+    Режет HTML-текст (parse_mode=HTML) на части не длиннее limit.
+    Разрез — по последнему переводу строки, иначе по пробелу; теги и сущности не разрываются,
+    открытые на разрезе теги закрываются в конце части и открываются заново в начале следующей.
+    """
+    if len(text) <= limit: return [text]
+    tokens = []
+    for token in _HTML_TOKEN.findall(text):
+        # Слово длиннее половины лимита режем как есть (внутри слова тегов и сущностей нет)
+        step = max(1, limit // 2)
+        tokens.extend([token[i:i + step] for i in range(0, len(token), step)] if len(token) > step else [token])
+
+    parts = []
+    head: Tags = ()
+    # (токен, открытые теги после него)
+    chunk: List[Tuple[str, Tags]] = []
+    size = 0
+    for token in tokens:
+        stack = _apply_tag(chunk[-1][1] if chunk else head, token)
+        while chunk and size + len(token) + len(_close(stack)) > limit:
+            cut = next((i for i in range(len(chunk) - 1, 0, -1) if chunk[i][0] == "\n"), None)
+            if cut is None:
+                cut = next((i for i in range(len(chunk) - 1, 0, -1) if chunk[i][0].isspace()), len(chunk))
+            opened = chunk[cut - 1][1]
+            parts.append("".join(t for _, t in head) + "".join(t for t, _ in chunk[:cut]) + _close(opened))
+            head, chunk = opened, chunk[cut + 1:]
+            size = sum(len(t) for _, t in head) + sum(len(t) for t, _ in chunk)
+            stack = _apply_tag(chunk[-1][1] if chunk else head, token)
+        if not chunk:
+            size = sum(len(t) for _, t in head)
+        chunk.append((token, stack))
+        size += len(token)
+    if chunk:
+        parts.append("".join(t for _, t in head) + "".join(t for t, _ in chunk) + _close(chunk[-1][1]))
+    return [part for part in parts if part.strip()]
+
+
+def pack_texts(texts: List[str], limit: int = TELEGRAM_TEXT_LIMIT, sep: str = "\n\n") -> List[str]:
+    """Склеивает тексты по порядку в сообщения не длиннее limit (слишком длинный текст идет отдельно)"""
+    packed, current = [], ""
+    for text in texts:
+        if current and len(current) + len(sep) + len(text) > limit:
+            packed.append(current)
+            current = ""
+        current = f"{current}{sep}{text}" if current else text
+    if current:
+        packed.append(current)
+    return packed
+
+
+class Outbox:
+    """
+    Буфер простых сообщений в рамках одной пачки событий.
+    Подряд идущие тексты одному получателю уходят одним send_message вместо нескольких.
+    Порядок по каждому получателю сохраняется; ядро сбрасывает буфер перед любым
+    "непростым" событием (токен, клавиатура, редактирование, смена хода).
+    """
+
+    def __init__(self, limit: int = TELEGRAM_TEXT_LIMIT):
+        self.limit = limit
+        self._queues: Dict[ChatId, List[str]] = {}
+        self.merged = 0
+
+    def add(self, chat_id: ChatId, text: str):
+        self._queues.setdefault(chat_id, []).append(text)
+
+    def __bool__(self) -> bool:
+        return bool(self._queues)
+
+    def drain(self) -> List[Tuple[ChatId, str]]:
+        """Забирает буфер: [(получатель, склеенный текст)]. merged — сколько отправок сэкономлено."""
+        result = []
+        for chat_id, texts in self._queues.items():
+            packed = pack_texts(texts, self.limit)
+            self.merged += len(texts) - len(packed)
+            result.extend((chat_id, text) for text in packed)
+        self._queues.clear()
+        return result
@@ -0,0 +1,47 @@
+import time
+from typing import Dict, Hashable, Tuple
+
+
+class TokenBucket:
+    """
+    Набор token bucket'ов по ключу (пользователь, лобби).
+    rate — токенов в секунду, burst — емкость ведра (сколько действий можно сделать подряд).
+    Полностью восстановившиеся ведра периодически удаляются: память растет только с числом активных.
+    """
+
+    def __init__(self, rate: float, burst: int, sweep_every: int = 5000):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_every = sweep_every
+        self._buckets: Dict[Hashable, Tuple[float, float]] = {}
+        self._calls = 0
+
+    def allow(self, key: Hashable, cost: float = 1.0) -> bool:
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        allowed = tokens >= cost
+        if allowed: tokens -= cost
+        self._buckets[key] = (tokens, now)
+
+        self._calls += 1
+        if self._calls >= self.sweep_every:
+            self._calls = 0
+            self._sweep(now)
+        return allowed
+
+    def retry_after(self, key: Hashable, cost: float = 1.0) -> float:
+        """Через сколько секунд у ключа появится cost токенов"""
+        tokens, last = self._buckets.get(key, (self.burst, time.monotonic()))
+        tokens = min(self.burst, tokens + (time.monotonic() - last) * self.rate)
+        return max(0.0, (cost - tokens) / self.rate) if self.rate > 0 else float("inf")
+
+    def _sweep(self, now: float):
+        full = [k for k, (tokens, last) in self._buckets.items()
+                if tokens + (now - last) * self.rate >= self.burst]
+        for k in full:
+            del self._buckets[k]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
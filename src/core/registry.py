@@ -17,6 +17,7 @@ class GameRegistry:
         :param game_cls: Класс игры (наследник GameEngine)
         :param display_name: Красивое имя для кнопок (например, '☢️ Бункер')
         """
+        game_cls.game_type = game_id
         cls._games[game_id] = game_cls
         cls._display_names[game_id] = display_name
         print(f"🎮 Game registered: {display_name} ({game_id})")
@@ -11,7 +11,7 @@ class GameEvent(BaseModel):
 
     content: str = ""
     reply_markup: Optional[Any] = None
-    extra_data: Dict[str, Any] = {}
+    extra_data: Dict[str, Any] = {}  # "public": True — адресное, но общее (в групповом режиме уйдет в группу)
 
     # НОВОЕ ПОЛЕ: Уникальная метка сообщения (например "turn_bot_1")
     # Если указано, main.py запомнит ID сообщения под этим именем.
@@ -0,0 +1,37 @@
+from typing import Dict, Iterable, Optional, Set
+
+
+class SessionIndex:
+    """
+    chat_id/user_id -> lobby_id идущей игры: один поиск в словаре вместо цепочки
+    active_games[str(chat_id)] -> группа -> user_to_lobby -> StateStore.
+    Ведется ядром: старт игры, загрузка/восстановление, выход и кик, game_over.
+    """
+
+    def __init__(self):
+        self._by_chat: Dict[int, str] = {}
+        self._by_game: Dict[str, Set[int]] = {}
+
+    def bind(self, lobby_id: str, chat_ids: Iterable[int]):
+        for chat_id in chat_ids:
+            old = self._by_chat.get(chat_id)
+            if old and old != lobby_id:
+                self._by_game.get(old, set()).discard(chat_id)
+            self._by_chat[chat_id] = lobby_id
+            self._by_game.setdefault(lobby_id, set()).add(chat_id)
+
+    def unbind(self, chat_id: int):
+        lobby_id = self._by_chat.pop(chat_id, None)
+        if lobby_id:
+            self._by_game.get(lobby_id, set()).discard(chat_id)
+
+    def release(self, lobby_id: str):
+        for chat_id in self._by_game.pop(lobby_id, set()):
+            if self._by_chat.get(chat_id) == lobby_id:
+                del self._by_chat[chat_id]
+
+    def get(self, chat_id: int) -> Optional[str]:
+        return self._by_chat.get(chat_id)
+
+    def __len__(self) -> int:
+        return len(self._by_chat)
@@ -0,0 +1,319 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import traceback
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.abstract_game import GameEngine
+from src.core.metrics import metrics
+from src.core.schemas import GameEvent
+
+# Методы движка, которые можно вызвать удаленно
+REMOTE_METHODS = {"init_game", "process_turn", "execute_bot_turn", "process_message", "handle_action", "player_leave",
+                  "skip_turn", "substitute_bot", "resume"}
+
+
+def shard_for(lobby_id: str, shards: int) -> int:
+    """Стабильный (не зависящий от PYTHONHASHSEED) выбор воркера по lobby_id"""
+    return zlib.crc32(lobby_id.encode("utf-8")) % shards
+
+
+# === WORKER SIDE ===
+
+def _game_view(game: GameEngine) -> Dict[str, Any]:
+    """Снимок движка для прокси: dump_state() + пути логов"""
+    logger = getattr(game, "logger", None)
+    return {
+        "dump": game.dump_state(),
+        "pending": game.pending_humans(),
+        "session_path": logger.get_session_path() if logger else None,
+        "s3_path": logger.get_s3_target_path() if logger else None,
+    }
+
+
+async def _worker_loop(shard_id: int, requests, responses):
+    from src.core.registry import GameRegistry
+
+    GameRegistry.auto_discover()
+    games: Dict[str, GameEngine] = {}
+    loop = asyncio.get_running_loop()
+    running = set()
+
+    async def handle(req_id: int, lobby_id: str, op: str, payload: Dict[str, Any]):
+        try:
+            result = None
+            if op == "create":
+                game_cls = GameRegistry.get_game_class(payload["game_type"])
+                if not game_cls: raise ValueError(f"Unknown game type: {payload['game_type']}")
+                game = game_cls(lobby_id=lobby_id, host_name=payload["host_name"])
+                if payload.get("state"): game.load_state(payload["state"])
+                games[lobby_id] = game
+            elif op == "call":
+                method = payload["method"]
+                if method not in REMOTE_METHODS: raise ValueError(f"Method not allowed: {method}")
+                game = games[lobby_id]
+                events = await getattr(game, method)(**payload["kwargs"])
+                result = [e.model_dump() for e in (events or [])]
+            elif op == "log":
+                game = games.get(lobby_id)
+                if game and getattr(game, "logger", None):
+                    game.logger.log_event(*payload["args"])
+                return
+            elif op == "release":
+                game = games.pop(lobby_id, None)
+                if game: game.release()
+                return
+
+            game = games.get(lobby_id)
+            responses.put((req_id, True, result, _game_view(game) if game else None))
+        except Exception as e:
+            traceback.print_exc()
+            responses.put((req_id, False, f"{type(e).__name__}: {e}", None))
+
+    print(f"🧩 Game worker #{shard_id} online")
+    while True:
+        msg = await loop.run_in_executor(None, requests.get)
+        if msg is None: break
+        task = asyncio.create_task(handle(*msg))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    for game in games.values():
+        game.release()
+    # Дописываем логи сессий до выхода процесса (поток записи — daemon)
+    from src.core.logger import log_writer
+    await loop.run_in_executor(None, log_writer.flush)
+
+
+def _worker_main(shard_id: int, requests, responses):
+    try:
+        asyncio.run(_worker_loop(shard_id, requests, responses))
+    except KeyboardInterrupt:
+        pass
+
+
+# === FRONT SIDE ===
+
+class ShardPool:
+    """
+    Пул процессов-воркеров. Каждый воркер владеет своими экземплярами GameEngine,
+    апдейт уходит в воркер по хэшу lobby_id, так что все события одной игры
+    обрабатываются в одном процессе и разные игры не делят GIL.
+    - вызов ждет ответа не дольше timeout секунд (зависший воркер не вешает обработчик навсегда)
+    - watch() раз в check_every секунд проверяет процессы: упавший воркер перезапускается,
+      ожидающие его вызовы сразу получают ошибку, а игры шарда пересоздаются из последнего снимка
+      при следующем вызове (поколение шарда сменилось)
+    """
+
+    def __init__(self, workers: int, timeout: float = 300.0, check_every: float = 1.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.check_every = check_every
+        self._ctx = multiprocessing.get_context("spawn")
+        self._requests = []
+        self._responses = None
+        self._procs = []
+        self._generations: List[int] = []
+        # req_id -> (шард, future)
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._responses = self._ctx.Queue()
+        for i in range(self.workers):
+            self._requests.append(None)
+            self._procs.append(None)
+            self._generations.append(0)
+            self._spawn(i)
+
+        self._reader = threading.Thread(target=self._read_responses, daemon=True, name="shard-responses")
+        self._reader.start()
+        print(f"🧩 Shard pool started: {self.workers} workers")
+
+    def _spawn(self, shard: int):
+        q = self._ctx.Queue()
+        proc = self._ctx.Process(target=_worker_main, args=(shard, q, self._responses), daemon=True,
+                                 name=f"game-worker-{shard}")
+        proc.start()
+        self._requests[shard] = q
+        self._procs[shard] = proc
+        self._generations[shard] += 1
+
+    def generation(self, lobby_id: str) -> int:
+        """Поколение воркера игры: меняется при перезапуске (игры шарда надо создать заново)"""
+        return self._generations[shard_for(lobby_id, self.workers)]
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.check_every)
+            if self._stopping: return
+            for shard, proc in enumerate(self._procs):
+                if proc.is_alive(): continue
+                logging.error(f"🧩 Game worker #{shard} died (exit code {proc.exitcode}). Restarting.")
+                metrics.inc("bot_game_worker_restarts_total")
+                self._fail_pending(shard, f"game worker #{shard} died")
+                self._spawn(shard)
+
+    def _fail_pending(self, shard: int, reason: str):
+        for req_id, (owner, fut) in list(self._pending.items()):
+            if owner != shard: continue
+            del self._pending[req_id]
+            if not fut.done(): fut.set_exception(RuntimeError(f"Game worker error: {reason}"))
+
+    def stop(self):
+        self._stopping = True
+        for q in self._requests:
+            q.put(None)
+        for proc in self._procs:
+            proc.join(timeout=5)
+        if self._responses:
+            self._responses.put(None)
+
+    def _read_responses(self):
+        while True:
+            msg = self._responses.get()
+            if msg is None: break
+            self._loop.call_soon_threadsafe(self._resolve, msg)
+
+    def _resolve(self, msg):
+        req_id, ok, payload, view = msg
+        _, fut = self._pending.pop(req_id, (None, None))
+        if not fut or fut.done(): return
+        if ok:
+            fut.set_result((payload, view))
+        else:
+            fut.set_exception(RuntimeError(f"Game worker error: {payload}"))
+
+    def send(self, lobby_id: str, op: str, payload: Dict[str, Any]):
+        """Отправка без ожидания ответа (логи, освобождение игры)"""
+        shard = shard_for(lobby_id, self.workers)
+        self._requests[shard].put((0, lobby_id, op, payload))
+
+    async def call(self, lobby_id: str, op: str, payload: Dict[str, Any]):
+        req_id = next(self._ids)
+        fut = self._loop.create_future()
+        shard = shard_for(lobby_id, self.workers)
+        self._pending[req_id] = (shard, fut)
+        self._requests[shard].put((req_id, lobby_id, op, payload))
+        try:
+            return await asyncio.wait_for(fut, self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("bot_game_worker_timeouts_total")
+            raise RuntimeError(f"Game worker #{shard} did not answer {op} for {lobby_id} in {self.timeout:.0f}s")
+        finally:
+            self._pending.pop(req_id, None)
+
+
+class RemoteLogger:
+    """Прокси SessionLogger: запись уходит в воркер, пути берутся из последнего снимка"""
+
+    def __init__(self, game: "RemoteGame"):
+        self._game = game
+
+    def log_event(self, event_type: str, message: str, details: dict = None, actor: str = None,
+                  latency_ms: float = None):
+        self._game.pool.send(self._game.lobby_id, "log", {"args": (event_type, message, details, actor, latency_ms)})
+
+    def get_session_path(self) -> Optional[str]:
+        return self._game.session_path
+
+    def get_s3_target_path(self) -> Optional[str]:
+        return self._game.s3_path
+
+
+class RemoteGame(GameEngine):
+    """
+    Прокси игры, живущей в процессе-воркере. Для main.py выглядит как обычный GameEngine:
+    players/state/current_turn_index обновляются снимком после каждого вызова.
+    """
+
+    def __init__(self, pool: ShardPool, game_type: str, lobby_id: str, host_name: str):
+        super().__init__(lobby_id, host_name)
+        self.pool = pool
+        self.game_type = game_type
+        self.current_turn_index = 0
+        self.session_path = None
+        self.s3_path = None
+        self.logger = RemoteLogger(self)
+        # Поколение воркера, в котором создана игра (0 — еще не создана)
+        self._generation = 0
+        self._dump: Optional[Dict[str, Any]] = None
+        self._pending: List[int] = []
+
+    async def _call(self, method: str, **kwargs) -> List[GameEvent]:
+        generation = self.pool.generation(self.lobby_id)
+        if self._generation != generation:
+            # Первый вызов или воркер перезапущен: поднимаем игру из последнего снимка
+            _, view = await self.pool.call(self.lobby_id, "create", {
+                "game_type": self.game_type,
+                "host_name": self.host_name,
+                "state": self._dump
+            })
+            self._apply_view(view)
+            self._generation = generation
+
+        events, view = await self.pool.call(self.lobby_id, "call", {"method": method, "kwargs": kwargs})
+        self._apply_view(view)
+        return [GameEvent(**e) for e in events]
+
+    def _apply_view(self, view: Optional[Dict[str, Any]]):
+        if not view: return
+        self._dump = view["dump"]
+        super().load_state(self._dump)
+        self.current_turn_index = self._dump.get("current_turn_index", 0)
+        self.session_path = view["session_path"]
+        self.s3_path = view["s3_path"]
+        self._pending = view.get("pending", [])
+
+    async def init_game(self, users_data: List[Dict]) -> List[GameEvent]:
+        return await self._call("init_game", users_data=users_data)
+
+    async def process_turn(self) -> List[GameEvent]:
+        return await self._call("process_turn")
+
+    async def execute_bot_turn(self, bot_id: int, token: str) -> List[GameEvent]:
+        return await self._call("execute_bot_turn", bot_id=bot_id, token=token)
+
+    async def process_message(self, player_id: int, text: str) -> List[GameEvent]:
+        return await self._call("process_message", player_id=player_id, text=text)
+
+    async def handle_action(self, player_id: int, action_data: str) -> List[GameEvent]:
+        return await self._call("handle_action", player_id=player_id, action_data=action_data)
+
+    async def player_leave(self, player_id: int) -> List[GameEvent]:
+        return await self._call("player_leave", player_id=player_id)
+
+    async def skip_turn(self, player_id: int) -> List[GameEvent]:
+        return await self._call("skip_turn", player_id=player_id)
+
+    async def substitute_bot(self, player_id: int) -> List[GameEvent]:
+        return await self._call("substitute_bot", player_id=player_id)
+
+    async def resume(self) -> List[GameEvent]:
+        return await self._call("resume")
+
+    def pending_humans(self) -> List[int]:
+        return list(self._pending)
+
+    def get_player_view(self, viewer_id: int) -> str:
+        return ""
+
+    def dump_state(self) -> Dict[str, Any]:
+        return self._dump if self._dump else super().dump_state()
+
+    def load_state(self, data: Dict[str, Any]):
+        # Состояние уедет в воркер вместе с первой командой create
+        self._dump = data
+        super().load_state(data)
+        self.current_turn_index = data.get("current_turn_index", 0)
+
+    def release(self):
+        if self._generation == self.pool.generation(self.lobby_id):
+            self.pool.send(self.lobby_id, "release", {})
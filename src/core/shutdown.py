@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import signal
+from typing import Awaitable, Callable, List, Tuple
+
+from src.core.tasks import TaskSupervisor
+
+
+class ShutdownCoordinator:
+    """
+    Мягкая остановка по SIGTERM/SIGINT:
+    1. stopping = True — новые апдейты не принимаются, игры не начинают новые ходы
+    2. drain(): по очереди выполняет шаги (дождаться апдейтов, снапшоты, логи),
+       затем ждет фоновые задачи супервизора (S3 и т.п.) — всё в пределах общего дедлайна
+    3. возвращает список брошенного (не успело к дедлайну)
+    """
+
+    def __init__(self, supervisor: TaskSupervisor, deadline: float = 20.0):
+        self.supervisor = supervisor
+        self.deadline = deadline
+        self._stop_event = asyncio.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_event.is_set()
+
+    def request_stop(self):
+        if not self.stopping:
+            logging.info("🛑 Shutdown requested")
+        self._stop_event.set()
+
+    async def wait(self):
+        await self._stop_event.wait()
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows: обработчики сигналов в loop не поддерживаются
+                pass
+
+    async def drain(self, steps: List[Tuple[str, Callable[[], Awaitable]]]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        abandoned = []
+
+        for label, step in steps:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                abandoned.append(label)
+                continue
+            try:
+                await asyncio.wait_for(step(), timeout=remaining)
+            except asyncio.TimeoutError:
+                abandoned.append(label)
+            except Exception as e:
+                logging.error(f"Shutdown step '{label}' failed: {e}")
+                abandoned.append(label)
+
+        self.supervisor.stop_loops()
+        tracked = dict(self.supervisor.pending())
+        if tracked:
+            remaining = max(0.0, deadline - loop.time())
+            _, pending = await asyncio.wait(list(tracked.keys()), timeout=remaining)
+            for task in pending:
+                abandoned.append(tracked[task])
+                task.cancel()
+
+        if abandoned:
+            logging.warning(f"🛑 Shutdown deadline: abandoned {len(abandoned)}: {', '.join(abandoned)}")
+        else:
+            logging.info("🛑 Shutdown drained cleanly")
+        return abandoned
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.abstract_game import GameEngine
+
+SNAPSHOT_MAGIC = b"BKS1"
+
+
+class SnapshotManager:
+    """
+    Снапшоты идущих игр для warm restart.
+    - mark_dirty() после каждой пачки событий: игра попадает в очередь на запись
+    - смена раунда/фазы пишется сразу, остальное — раз в interval секунд
+    - формат: MAGIC + zlib(pickle(dict)), запись атомарная (tmp + fsync + replace)
+    - сериализация и IO идут в одном фоновом потоке, неизменившиеся игры не перезаписываются
+    """
+
+    def __init__(self, folder: str = "Snapshots", interval: float = 15.0):
+        self.folder = folder
+        self.interval = interval
+        os.makedirs(folder, exist_ok=True)
+
+        self._dirty: Dict[str, Tuple[GameEngine, Dict[str, Any]]] = {}
+        self._phases: Dict[str, tuple] = {}
+        # Доступ только из потока записи
+        self._digests: Dict[str, bytes] = {}
+        self._pending = set()
+        # Один поток = запись и удаление одной игры всегда идут по порядку
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshots")
+
+    def _path(self, lobby_id: str) -> str:
+        return os.path.join(self.folder, f"{lobby_id}.snap")
+
+    # --- EVENT LOOP SIDE ---
+
+    def mark_dirty(self, game: GameEngine, extra: Optional[Dict[str, Any]] = None):
+        if not game.state: return  # Игра еще не инициализирована
+        lid = game.lobby_id
+        self._dirty[lid] = (game, extra or {})
+
+        phase_key = (game.state.round, game.state.phase)
+        if self._phases.get(lid) != phase_key:
+            self._phases[lid] = phase_key
+            self._submit(lid)
+
+    def remove(self, lobby_id: str):
+        self._dirty.pop(lobby_id, None)
+        self._phases.pop(lobby_id, None)
+        self._run(self._delete, lobby_id)
+
+    async def flush(self):
+        """Пишет все грязные игры и ждет завершения записи"""
+        for lid in list(self._dirty.keys()):
+            self._submit(lid)
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    async def run_periodic(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Snapshot flush error: {e}")
+
+    def pending_count(self) -> int:
+        return len(self._pending) + len(self._dirty)
+
+    def _submit(self, lobby_id: str):
+        item = self._dirty.pop(lobby_id, None)
+        if not item: return
+        game, extra = item
+        # Снимок берется на event loop, чтобы состояние было консистентным
+        record = {"game_type": game.game_type, "data": game.dump_state(), "extra": extra}
+        self._run(self._write, lobby_id, record)
+
+    def _run(self, fn, *args):
+        fut = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        self._pending.add(fut)
+        fut.add_done_callback(self._on_done)
+
+    def _on_done(self, fut):
+        self._pending.discard(fut)
+        if not fut.cancelled() and fut.exception():
+            print(f"⚠️ Snapshot write failed: {fut.exception()}")
+
+    # --- WRITER THREAD SIDE ---
+
+    def _write(self, lobby_id: str, record: Dict[str, Any]):
+        blob = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), 3)
+        digest = hashlib.blake2b(blob, digest_size=16).digest()
+        if self._digests.get(lobby_id) == digest: return
+
+        path = self._path(lobby_id)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._digests[lobby_id] = digest
+
+    def _delete(self, lobby_id: str):
+        self._digests.pop(lobby_id, None)
+        try:
+            os.remove(self._path(lobby_id))
+        except FileNotFoundError:
+            pass
+
+    # --- STARTUP ---
+
+    def load_all(self) -> List[Tuple[str, Dict[str, Any]]]:
+        result = []
+        for filename in os.listdir(self.folder):
+            if not filename.endswith(".snap"): continue
+            lobby_id = filename[:-len(".snap")]
+            path = os.path.join(self.folder, filename)
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+                if not raw.startswith(SNAPSHOT_MAGIC):
+                    raise ValueError("bad magic")
+                record = pickle.loads(zlib.decompress(raw[len(SNAPSHOT_MAGIC):]))
+                self._digests[lobby_id] = hashlib.blake2b(raw[len(SNAPSHOT_MAGIC):], digest_size=16).digest()
+                result.append((lobby_id, record))
+            except Exception as e:
+                print(f"⚠️ Broken snapshot {filename}: {e}")
+        return result
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src.core.metrics import metrics
+from src.core.outbox import TELEGRAM_TEXT_LIMIT, ChatId, pack_texts, split_html
+from src.core.tasks import task_supervisor
+
+
+def parse_chat_id(raw: Optional[str]) -> Optional[ChatId]:
+    """'-100123' -> int, '@channel' -> str, пусто -> None"""
+    if not raw: return None
+    raw = raw.strip()
+    return int(raw) if raw.lstrip("-").isdigit() else raw
+
+
+class SpectatorFeed:
+    """
+    Трансляция публичных событий игры в Telegram-канал.
+    - зрители не являются игроками: подписчиков канала рассылает сам Telegram,
+      поэтому стоимость для бота — один пост на пачку событий, сколько бы зрителей ни было
+    - события копятся в буфере игры и уходят дайджестом раз в window секунд
+      (или сразу, если набрался лимит сообщения Telegram)
+    - посты одной игры отправляет одна задача, порядок сохраняется
+    """
+
+    def __init__(self, send: Callable[..., Awaitable], default_chat: Optional[ChatId] = None,
+                 window: float = 3.0, limit: int = TELEGRAM_TEXT_LIMIT):
+        self.send = send
+        self.default_chat = default_chat
+        self.window = window
+        self.limit = limit
+
+        self._channels: Dict[str, ChatId] = {}
+        self._titles: Dict[str, str] = {}
+        self._buffers: Dict[str, List[str]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._drains: Dict[str, asyncio.Task] = {}
+        self._closing = set()
+
+        metrics.gauge("bot_spectator_feeds", lambda: len(self._channels))
+
+    def attach(self, lobby_id: str, chat: Optional[ChatId] = None, title: str = "") -> Optional[ChatId]:
+        """Включает трансляцию игры в chat (или в канал по умолчанию); title — заголовок постов"""
+        chat = chat or self.default_chat
+        if chat:
+            self._channels[lobby_id] = chat
+            self._titles[lobby_id] = title or lobby_id
+            self._closing.discard(lobby_id)
+        return chat
+
+    def channel(self, lobby_id: str) -> Optional[ChatId]:
+        return self._channels.get(lobby_id)
+
+    def title(self, lobby_id: str) -> str:
+        return self._titles.get(lobby_id, "")
+
+    def publish(self, lobby_id: str, text: str):
+        if lobby_id not in self._channels or not text: return
+        self._buffers.setdefault(lobby_id, []).append(text)
+        self._sizes[lobby_id] = self._sizes.get(lobby_id, 0) + len(text) + 2
+        metrics.inc("bot_spectator_events_total")
+
+        if self._sizes[lobby_id] >= self.limit:
+            self._wakeup(lobby_id).set()
+        if lobby_id not in self._drains:
+            self._drains[lobby_id] = task_supervisor.spawn(
+                self._drain(lobby_id), owner="spectators", key=lobby_id, name="spectator_feed"
+            )
+
+    def close(self, lobby_id: str):
+        """Конец игры: досылаем остаток буфера и отключаем трансляцию"""
+        if lobby_id in self._drains:
+            self._closing.add(lobby_id)
+            self._wakeup(lobby_id).set()
+        else:
+            self._forget(lobby_id)
+
+    async def flush_all(self):
+        """Для мягкой остановки: отправить всё накопленное без ожидания окна"""
+        for lobby_id in list(self._drains):
+            self._wakeup(lobby_id).set()
+        if self._drains:
+            await asyncio.gather(*list(self._drains.values()), return_exceptions=True)
+
+    def _wakeup(self, lobby_id: str) -> asyncio.Event:
+        event = self._wakeups.get(lobby_id)
+        if event is None:
+            event = self._wakeups[lobby_id] = asyncio.Event()
+        return event
+
+    def _forget(self, lobby_id: str):
+        self._channels.pop(lobby_id, None)
+        self._titles.pop(lobby_id, None)
+        self._buffers.pop(lobby_id, None)
+        self._sizes.pop(lobby_id, None)
+        self._wakeups.pop(lobby_id, None)
+        self._closing.discard(lobby_id)
+
+    async def _drain(self, lobby_id: str):
+        wakeup = self._wakeup(lobby_id)
+        try:
+            while self._buffers.get(lobby_id):
+                if not wakeup.is_set():
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout=self.window)
+                    except asyncio.TimeoutError:
+                        pass
+                wakeup.clear()
+
+                batch = self._buffers.pop(lobby_id, [])
+                self._sizes.pop(lobby_id, None)
+                chat = self._channels.get(lobby_id)
+                if not chat: break
+                for post in self._pack(lobby_id, batch):
+                    await self._send(chat, post)
+        finally:
+            self._drains.pop(lobby_id, None)
+            if lobby_id in self._closing:
+                self._forget(lobby_id)
+
+    def _pack(self, lobby_id: str, batch: List[str]) -> List[str]:
+        """Склеивает события в посты не длиннее лимита Telegram"""
+        header = f"🎥 <b>{self._titles.get(lobby_id, lobby_id)}</b>\n\n"
+        room = self.limit - len(header)
+        # Длинное событие делится по строкам с закрытием тегов: обрезка посреди тега ломает parse_mode=HTML
+        batch = [part for text in batch for part in split_html(text, room)]
+        return [header + post for post in pack_texts(batch, room)]
+
+    async def _send(self, chat: ChatId, text: str):
+        for _ in range(2):
+            try:
+                await self.send(chat_id=chat, text=text, disable_notification=True)
+                metrics.inc("bot_spectator_posts_total")
+                return
+            except Exception as e:
+                # TelegramRetryAfter: ждем сколько просят и пробуем еще раз
+                retry_after = getattr(e, "retry_after", None)
+                if not retry_after:
+                    logging.warning(f"Spectator post to {chat} failed: {e}")
+                    metrics.inc("bot_spectator_post_failures_total")
+                    return
+                await asyncio.sleep(retry_after)
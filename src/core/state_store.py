@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join("Configs", ".env"))
+
+
+class VersionConflict(Exception):
+    """Запись успела измениться (другой репликой) с момента чтения"""
+
+    def __init__(self, kind: str, key: str, expected: Optional[int], actual: Optional[int]):
+        super().__init__(f"{kind}/{key}: expected v{expected}, found v{actual}")
+        self.kind = kind
+        self.key = key
+        self.expected = expected
+        self.actual = actual
+
+
+class StateStore(ABC):
+    """
+    Хранилище состояния (лобби, игроки, игры) с оптимистичным версионированием.
+    Запись = (kind, key) -> (data: dict, version: int).
+    put(expected_version=N) пишет только если текущая версия == N (0 = записи еще нет),
+    expected_version=None пишет безусловно. Возвращает новую версию.
+    shared=True — хранилище общее для реплик и переживает рестарт (иначе копия живет только в этом процессе).
+    """
+
+    shared = False
+
+    @abstractmethod
+    def get(self, kind: str, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        pass
+
+    @abstractmethod
+    def put(self, kind: str, key: str, data: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        pass
+
+    @abstractmethod
+    def delete(self, kind: str, key: str):
+        pass
+
+    def version(self, kind: str, key: str) -> int:
+        """Текущая версия записи (0 — записи нет) без чтения данных"""
+        record = self.get(kind, key)
+        return record[1] if record else 0
+
+    @abstractmethod
+    def keys(self, kind: str) -> List[str]:
+        pass
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        item = self._data.get((kind, key))
+        if not item: return None
+        raw, version = item
+        return json.loads(raw), version
+
+    def put(self, kind: str, key: str, data: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        # Сериализуем, как и персистентный бэкенд: наружу не утекают ссылки на живые объекты
+        raw = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            current = self._data.get((kind, key))
+            current_version = current[1] if current else 0
+            if expected_version is not None and expected_version != current_version:
+                raise VersionConflict(kind, key, expected_version, current_version)
+            self._data[(kind, key)] = (raw, current_version + 1)
+            return current_version + 1
+
+    def delete(self, kind: str, key: str):
+        with self._lock:
+            self._data.pop((kind, key), None)
+
+    def keys(self, kind: str) -> List[str]:
+        return [k for (kd, k) in list(self._data.keys()) if kd == kind]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Персистентный бэкенд на SQLite (WAL). Один файл может разделяться несколькими
+    репликами на одном хосте/томе; конфликты ловятся проверкой версии в UPDATE.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder: os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, version INTEGER NOT NULL, "
+            "data TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+        )
+
+    def get(self, kind: str, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data, version FROM records WHERE kind=? AND key=?",
+                                     (kind, key)).fetchone()
+        if not row: return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, kind: str, key: str, data: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        raw = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                row = cur.execute("SELECT version FROM records WHERE kind=? AND key=?", (kind, key)).fetchone()
+                current_version = row[0] if row else 0
+                if expected_version is not None and expected_version != current_version:
+                    raise VersionConflict(kind, key, expected_version, current_version)
+                if row:
+                    cur.execute("UPDATE records SET version=?, data=?, updated_at=? WHERE kind=? AND key=?",
+                                (current_version + 1, raw, now, kind, key))
+                else:
+                    cur.execute("INSERT INTO records (kind, key, version, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                                (kind, key, 1, raw, now))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return current_version + 1
+
+    def version(self, kind: str, key: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM records WHERE kind=? AND key=?", (kind, key)).fetchone()
+        return row[0] if row else 0
+
+    def delete(self, kind: str, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM records WHERE kind=? AND key=?", (kind, key))
+
+    def keys(self, kind: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM records WHERE kind=?", (kind,)).fetchall()
+        return [r[0] for r in rows]
+
+
+def create_state_store(url: str) -> StateStore:
+    """
+    STATE_STORE=memory (по умолчанию) или STATE_STORE=sqlite:///Data/state.db
+    """
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        print(f"💾 State store: SQLite ({path})")
+        return SQLiteStateStore(path)
+    if url != "memory":
+        print(f"⚠️ Unknown STATE_STORE '{url}', falling back to memory")
+    return MemoryStateStore()
+
+
+# Глобальный инстанс
+state_store = create_state_store(os.getenv("STATE_STORE", "memory"))
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from src.core.metrics import metrics
+
+# Сколько фоновых задач одного владельца могут выполняться одновременно
+# ("turns", lobby_id) — цепочки ходов игры: строго по одной, в порядке запуска
+# ("chat", chat_id) — индикатор "печатает..." (одна задача на чат)
+DEFAULT_CAPS = {"game": 4, "turns": 1, "lobby": 2, "chat": 1, "system": 16}
+
+
+class TaskSupervisor:
+    """
+    Реестр фоновых задач вместо голого asyncio.create_task:
+    - держит сильные ссылки (задачи не соберет GC посреди работы)
+    - группирует задачи по владельцу: ("game", lobby_id), ("turns", lobby_id), ("lobby", lobby_id), ("chat", chat_id),
+      ("system", name)
+    - ограничивает параллелизм на владельца (лишние задачи ждут своей очереди)
+    - логирует исключения и считает их в метриках
+    - supervise(): критичные циклы перезапускаются после падения
+    """
+
+    def __init__(self, caps: Optional[Dict[str, int]] = None):
+        self.caps = dict(DEFAULT_CAPS)
+        if caps: self.caps.update(caps)
+
+        self._tasks: Dict[asyncio.Task, Tuple[str, str, str]] = {}
+        self._coros: Dict[asyncio.Task, Coroutine] = {}
+        self._loops: Dict[str, asyncio.Task] = {}
+        self._semaphores: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+        self._owner_counts: Dict[Tuple[str, str], int] = {}
+
+        metrics.gauge("bot_background_tasks", self.counts_by_kind)
+
+    def spawn(self, coro: Coroutine, owner: str = "system", key: str = "", name: str = "") -> asyncio.Task:
+        owner_key = (owner, str(key))
+        sem = self._semaphores.get(owner_key)
+        if sem is None:
+            sem = self._semaphores[owner_key] = asyncio.Semaphore(self.caps.get(owner, self.caps["system"]))
+        self._owner_counts[owner_key] = self._owner_counts.get(owner_key, 0) + 1
+
+        async def runner():
+            async with sem:
+                return await coro
+
+        task = asyncio.create_task(runner(), name=name or None)
+        self._tasks[task] = (owner, str(key), name or getattr(coro, "__name__", "task"))
+        self._coros[task] = coro
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task):
+        owner, key, name = self._tasks.pop(task, ("system", "", "task"))
+        # Если задачу отменили в очереди, корутина так и не стартовала — закрываем ее
+        self._coros.pop(task).close()
+        owner_key = (owner, key)
+        left = self._owner_counts.get(owner_key, 1) - 1
+        if left <= 0:
+            self._owner_counts.pop(owner_key, None)
+            self._semaphores.pop(owner_key, None)
+        else:
+            self._owner_counts[owner_key] = left
+
+        if task.cancelled(): return
+        exc = task.exception()
+        if exc:
+            logging.error(f"Background task {owner}:{key}:{name} failed: {exc!r}", exc_info=exc)
+            metrics.inc("bot_background_task_failures_total", owner=owner)
+
+    def supervise(self, factory: Callable[[], Awaitable], name: str,
+                  restart_delay: float = 1.0, max_delay: float = 60.0) -> asyncio.Task:
+        """Критичный бесконечный цикл: при падении перезапускается с экспоненциальной паузой"""
+
+        async def loop():
+            delay = restart_delay
+            while True:
+                try:
+                    await factory()
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.error(f"Critical loop '{name}' crashed: {e!r}. Restart in {delay:.0f}s", exc_info=e)
+                    metrics.inc("bot_critical_loop_restarts_total", loop=name)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, max_delay)
+
+        task = asyncio.create_task(loop(), name=f"loop:{name}")
+        self._loops[name] = task
+        task.add_done_callback(lambda t: self._loops.pop(name, None))
+        return task
+
+    def cancel_owner(self, owner: str, key: str):
+        for task, (o, k, _) in list(self._tasks.items()):
+            if o == owner and k == str(key):
+                task.cancel()
+
+    def pending(self) -> List[Tuple[asyncio.Task, str]]:
+        """Незавершенные разовые задачи (без критичных циклов) с подписями для отчета"""
+        return [(t, f"{o}:{k}:{n}") for t, (o, k, n) in self._tasks.items() if not t.done()]
+
+    def stop_loops(self):
+        for task in list(self._loops.values()):
+            task.cancel()
+
+    def counts_by_kind(self) -> Dict[str, int]:
+        counts = {kind: 0 for kind in self.caps}
+        for owner, _, _ in self._tasks.values():
+            counts[owner] = counts.get(owner, 0) + 1
+        counts["loops"] = len(self._loops)
+        return counts
+
+
+# Глобальный инстанс
+task_supervisor = TaskSupervisor()
@@ -0,0 +1,68 @@
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from src.core.tasks import task_supervisor
+
+TimerCallback = Callable[[], Awaitable]
+
+
+class TimerWheel:
+    """
+    Хэшированное колесо таймеров: тысячи дедлайнов без отдельной asyncio-задачи на каждый.
+    - schedule/cancel за O(1); ключ таймера уникален (повторный schedule переставляет таймер)
+    - тик раз в tick секунд обходит только один слот колеса
+    - сработавший колбэк запускается через task_supervisor (владелец — owner_key)
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots = slots
+        self._wheel: List[Dict[Hashable, Tuple[int, TimerCallback, str]]] = [{} for _ in range(slots)]
+        self._where: Dict[Hashable, int] = {}
+        self._cursor = 0
+
+    def schedule(self, key: Hashable, delay: float, callback: TimerCallback, owner_key: str = ""):
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % self.slots
+        rounds = (ticks - 1) // self.slots
+        self._wheel[slot][key] = (rounds, callback, owner_key)
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            self._wheel[slot].pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def advance(self):
+        """Один тик: срабатывают таймеры текущего слота, у остальных уменьшается число оборотов"""
+        self._cursor = (self._cursor + 1) % self.slots
+        bucket = self._wheel[self._cursor]
+        due = []
+        for key, (rounds, callback, owner_key) in list(bucket.items()):
+            if rounds > 0:
+                bucket[key] = (rounds - 1, callback, owner_key)
+                continue
+            del bucket[key]
+            del self._where[key]
+            due.append((key, callback, owner_key))
+
+        for key, callback, owner_key in due:
+            task_supervisor.spawn(callback(), owner="game", key=owner_key or str(key), name="timer")
+
+    async def run(self):
+        # Считаем тики по monotonic: задержки event loop не растягивают дедлайны
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            while time.monotonic() >= next_tick:
+                self.advance()
+                next_tick += self.tick
@@ -0,0 +1,98 @@
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.core.abstract_game import GameEngine
+from src.core.timers import TimerWheel
+
+
+class TurnDeadlines:
+    """
+    Дедлайны ходов людей и уборка зависших игр.
+    - arm(game) после каждой пачки событий: дедлайн ставится, когда игра переходит на новый шаг
+      (раунд, фаза, ход) и ждет людей (pending_humans). Ходы части людей внутри шага дедлайн не продлевают —
+      по истечении пропускаются только те, кто так и не походил
+    - за warning секунд до конца — предупреждение, по истечении — on_expire (пропуск хода / замена на AI)
+    - игра без прогресса и без ввода idle_timeout секунд отдается on_idle (закрытие)
+    Колбэки задает ядро: сами таймеры ничего не знают про Telegram.
+    """
+
+    def __init__(self, wheel: TimerWheel, timeout: float = 120.0, warning: float = 30.0,
+                 idle_timeout: float = 1800.0):
+        self.wheel = wheel
+        self.timeout = timeout
+        self.warning = warning
+        self.idle_timeout = idle_timeout
+
+        self.on_warning: Optional[Callable[[str, List[int]], Awaitable]] = None
+        self.on_expire: Optional[Callable[[str, List[int]], Awaitable]] = None
+        self.on_idle: Optional[Callable[[str], Awaitable]] = None
+
+        # lobby_id -> (шаг (раунд, фаза, ход), кого ждем)
+        self._armed: Dict[str, Tuple[tuple, tuple]] = {}
+        self._misses: Dict[Tuple[str, int], int] = {}
+        self._activity: Dict[str, float] = {}
+
+    def arm(self, game: GameEngine):
+        lid = game.lobby_id
+        if not game.state: return
+        pending = tuple(sorted(game.pending_humans()))
+        step = (game.state.round, str(game.state.phase), getattr(game, "current_turn_index", 0))
+        armed = self._armed.get(lid)
+        if armed == (step, pending): return
+
+        # Игра сдвинулась — это тоже активность
+        self._armed[lid] = (step, pending)
+        self._activity[lid] = time.monotonic()
+        if self.idle_timeout > 0 and ("idle", lid) not in self.wheel:
+            self.wheel.schedule(("idle", lid), self.idle_timeout, lambda: self._check_idle(lid), owner_key=lid)
+
+        if not pending or self.timeout <= 0:
+            self.wheel.cancel(("warn", lid))
+            self.wheel.cancel(("turn", lid))
+            return
+        # Тот же шаг, часть людей уже походила: дедлайн шага остается прежним
+        if armed and armed[0] == step and armed[1]: return
+
+        if 0 < self.warning < self.timeout:
+            self.wheel.schedule(("warn", lid), self.timeout - self.warning,
+                                lambda: self._fire(lid, step, self.on_warning), owner_key=lid)
+        self.wheel.schedule(("turn", lid), self.timeout,
+                            lambda: self._fire(lid, step, self.on_expire), owner_key=lid)
+
+    def touch(self, lobby_id: str, player_id: int):
+        """Ввод человека: сбрасывает счетчик пропусков и таймер простоя"""
+        self._misses.pop((lobby_id, player_id), None)
+        self._activity[lobby_id] = time.monotonic()
+
+    def miss(self, lobby_id: str, player_id: int) -> int:
+        """Засчитывает пропуск хода, возвращает число пропусков подряд"""
+        key = (lobby_id, player_id)
+        self._misses[key] = self._misses.get(key, 0) + 1
+        return self._misses[key]
+
+    def release(self, lobby_id: str):
+        for kind in ("warn", "turn", "idle"):
+            self.wheel.cancel((kind, lobby_id))
+        self._armed.pop(lobby_id, None)
+        self._activity.pop(lobby_id, None)
+        for key in [k for k in self._misses if k[0] == lobby_id]:
+            del self._misses[key]
+
+    def __len__(self) -> int:
+        return len(self._armed)
+
+    async def _fire(self, lobby_id: str, step: tuple, handler):
+        # Шаг уже сменился или все походили — таймер устарел
+        armed = self._armed.get(lobby_id)
+        if not armed or armed[0] != step or not armed[1] or not handler: return
+        await handler(lobby_id, list(armed[1]))
+
+    async def _check_idle(self, lobby_id: str):
+        if lobby_id not in self._activity: return
+        idle_for = time.monotonic() - self._activity[lobby_id]
+        if idle_for < self.idle_timeout:
+            self.wheel.schedule(("idle", lobby_id), self.idle_timeout - idle_for,
+                                lambda: self._check_idle(lobby_id), owner_key=lobby_id)
+            return
+        if self.on_idle:
+            await self.on_idle(lobby_id)
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable
+
+from src.core.tasks import task_supervisor
+
+# Telegram гасит "печатает..." через ~5 секунд, обновляем чуть раньше
+TYPING_REFRESH_INTERVAL = 4.0
+
+
+class TypingManager:
+    """
+    Держит индикатор "печатает..." в чатах, пока бот думает.
+    На каждый чат крутится одна задача, которая обновляет статус каждые ~4 с
+    до вызова stop(). Повторные start() для того же чата только увеличивают счетчик.
+    Задачи — в task_supervisor с владельцем ("chat", chat_id).
+    """
+
+    def __init__(self, send_action: Callable[[int, str], Awaitable], interval: float = TYPING_REFRESH_INTERVAL):
+        self._send_action = send_action
+        self.interval = interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._refs: Dict[int, int] = {}
+
+    def start(self, chat_ids: Iterable[int]):
+        for cid in chat_ids:
+            self._refs[cid] = self._refs.get(cid, 0) + 1
+            if cid not in self._tasks:
+                self._tasks[cid] = task_supervisor.spawn(self._loop(cid), owner="chat", key=cid, name="typing")
+
+    def stop(self, chat_ids: Iterable[int]):
+        for cid in chat_ids:
+            left = self._refs.get(cid, 0) - 1
+            if left > 0:
+                self._refs[cid] = left
+                continue
+            self._refs.pop(cid, None)
+            if self._tasks.pop(cid, None):
+                task_supervisor.cancel_owner("chat", cid)
+
+    def stop_all(self):
+        """Остановка бота: индикаторы гасятся сразу, не дожидаясь конца генераций"""
+        for cid in self._tasks: self._refs[cid] = 1
+        self.stop(list(self._tasks))
+
+    def active_count(self) -> int:
+        return len(self._tasks)
+
+    async def _loop(self, chat_id: int):
+        try:
+            while True:
+                try:
+                    await self._send_action(chat_id, "typing")
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    pass
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            pass
@@ -6,6 +6,7 @@ from collections import Counter
 from src.core.abstract_game import GameEngine
 from src.core.schemas import BasePlayer, BaseGameState, GameEvent
 from src.core.logger import SessionLogger
+from src.core.callbacks import callback_codec
 
 from src.games.bunker.config import bunker_cfg
 from src.games.bunker.utils import BunkerUtils
@@ -18,6 +19,7 @@ class BunkerGame(GameEngine):
     def __init__(self, lobby_id: str, host_name: str):
         super().__init__(lobby_id, host_name)
         self.logger = SessionLogger("Bunker", lobby_id, host_name)
+        self.logger.context = self.log_context
 
         self.bot_agent = BotAgent()
         self.judge_agent = JudgeAgent()
@@ -93,7 +95,8 @@ class BunkerGame(GameEngine):
         personal_topic = self._get_personal_topic(current_player)
 
         self.logger.log_event("TURN_START",
-                              f"Active player: {current_player.name} (ID: {current_player.id}, Human: {current_player.is_human})")
+                              f"Active player: {current_player.name} (ID: {current_player.id}, Human: {current_player.is_human})",
+                              actor=current_player.name)
 
         # ХОД ЧЕЛОВЕКА
         if current_player.is_human:
@@ -111,7 +114,8 @@ class BunkerGame(GameEngine):
             others = [p.id for p in self.players if p.id != current_player.id]
             if others:
                 events.append(
-                    GameEvent(type="message", target_ids=others, content=f"⏳ Ходит <b>{current_player.name}</b>..."))
+                    GameEvent(type="message", target_ids=others, content=f"⏳ Ходит <b>{current_player.name}</b>...",
+                              extra_data={"public": True}))
             return events
 
         # ХОД БОТА
@@ -131,7 +135,7 @@ class BunkerGame(GameEngine):
 
     # --- ЭТАП 2: ВЫПОЛНЕНИЕ ХОДА ---
     async def execute_bot_turn(self, bot_id: int, token: str) -> List[GameEvent]:
-        bot = next((p for p in self.players if p.id == bot_id), None)
+        bot = self.get_player(bot_id)
         if not bot: return []
 
         events = []
@@ -159,7 +163,7 @@ class BunkerGame(GameEngine):
             )
 
             self.state.history.append(f"[{bot.name}]: {speech}")
-            self.logger.log_event("BOT_SPEECH", f"{bot.name}: {speech}")
+            self.logger.log_event("BOT_SPEECH", f"{bot.name}: {speech}", actor=bot.name)
 
             display_name = BunkerUtils.get_display_name(bot, self.state.round)
             final_msg = f"{display_name}:\n{speech}"
@@ -177,7 +181,7 @@ class BunkerGame(GameEngine):
 
     async def process_message(self, player_id: int, text: str) -> List[GameEvent]:
         events = []
-        player = next((p for p in self.players if p.id == player_id), None)
+        player = self.get_player(player_id)
         if not player or not player.is_alive: return []
 
         if self.state.phase == "voting":
@@ -200,7 +204,7 @@ class BunkerGame(GameEngine):
             return []
 
         self.state.history.append(f"[{player.name}]: {text}")
-        self.logger.log_event("CHAT", f"{player.name}: {text}")
+        self.logger.log_event("CHAT", f"{player.name}: {text}", actor=player.name)
 
         personal_topic = self._get_personal_topic(player)
         await self.judge_agent.analyze_move(player, text, personal_topic, self.state.round, logger=self.logger)
@@ -210,25 +214,28 @@ class BunkerGame(GameEngine):
 
         others = [p.id for p in self.players if p.id != player_id]
         if others:
-            events.append(GameEvent(type="message", target_ids=others, content=msg))
+            events.append(GameEvent(type="message", target_ids=others, content=msg, extra_data={"public": True}))
 
         self.current_turn_index += 1
         events.append(GameEvent(type="switch_turn"))
         return events
 
     async def handle_action(self, player_id: int, action_data: str) -> List[GameEvent]:
-        if not action_data.startswith("vote_"): return []
+        action, args = callback_codec.unpack(action_data)
+        if action != "vote" or not args: return []
         if self.state.phase != "voting": return []
 
-        target_name = action_data.split("_", 1)[1]
-        player = next((p for p in self.players if p.id == player_id), None)
+        player = self.get_player(player_id)
         if not player: return []
+        target = self.get_player(args[0])
+        if not target: return []
+        target_name = target.name
 
         if player.name in self.votes:
             return [GameEvent(type="callback_answer", target_ids=[player_id], content="Вы уже голосовали")]
 
         self.votes[player.name] = target_name
-        self.logger.log_event("VOTE", f"{player.name} voted for {target_name}")
+        self.logger.log_event("VOTE", f"{player.name} voted for {target_name}", actor=player.name)
 
         events = [
             GameEvent(type="callback_answer", target_ids=[player.id], content=f"Голос принят: {target_name}"),
@@ -244,12 +251,12 @@ class BunkerGame(GameEngine):
 
     async def player_leave(self, player_id: int) -> List[GameEvent]:
         events = []
-        player = next((p for p in self.players if p.id == player_id), None)
+        player = self.get_player(player_id)
         if not player or not player.is_alive: return []
 
         player.is_alive = False
         self._mark_dead_in_history(player.name)
-        self.logger.log_event("PLAYER_LEFT", f"{player.name} left the game")
+        self.logger.log_event("PLAYER_LEFT", f"{player.name} left the game", actor=player.name)
 
         events.append(GameEvent(type="message", content=f"🚪 <b>{player.name}</b> покинул игру (дезертировал)."))
 
@@ -366,7 +373,7 @@ class BunkerGame(GameEngine):
                 else:
                     keyboard_data = []
                     for t in my_targets:
-                        keyboard_data.append({"text": f"☠ {t.name}", "callback_data": f"vote_{t.name}"})
+                        keyboard_data.append({"text": f"☠ {t.name}", "callback_data": callback_codec.pack("vote", t.id)})
                     events.append(GameEvent(type="message", target_ids=[p.id], content="🛑 <b>ГОЛОСОВАНИЕ</b>",
                                             reply_markup=keyboard_data))
 
@@ -454,4 +461,70 @@ class BunkerGame(GameEngine):
         return events
 
     def get_player_view(self, viewer_id: int) -> str:
-        return ""
\ No newline at end of file
+        return ""
+
+    # --- ДЕДЛАЙНЫ ХОДА ---
+    def _turn_queue(self) -> List[BasePlayer]:
+        alive_players = [p for p in self.players if p.is_alive]
+        if self.state.phase == "runoff":
+            candidates = self.state.shared_data["runoff_candidates"]
+            return [p for p in alive_players if p.name in candidates]
+        return alive_players
+
+    def pending_humans(self) -> List[int]:
+        if not self.state: return []
+        if self.state.phase == "voting":
+            return [p.id for p in self.players if p.is_alive and p.is_human and p.name not in self.votes]
+        if self.state.phase not in ("presentation", "discussion", "runoff"): return []
+
+        queue = self._turn_queue()
+        if self.current_turn_index < len(queue) and queue[self.current_turn_index].is_human:
+            return [queue[self.current_turn_index].id]
+        return []
+
+    async def skip_turn(self, player_id: int) -> List[GameEvent]:
+        if player_id not in self.pending_humans(): return []
+        player = self.get_player(player_id)
+
+        if self.state.phase == "voting":
+            # Голос за молчащего: случайная цель из тех, кто на вылет
+            if self.state.shared_data["runoff_candidates"]:
+                candidates = [p for p in self.players if p.name in self.state.shared_data["runoff_candidates"]]
+            else:
+                candidates = [p for p in self.players if p.is_alive]
+            targets = [t for t in candidates if t.name != player.name]
+            if not targets: return []
+            target = random.choice(targets)
+            self.votes[player.name] = target.name
+            self.logger.log_event("AFK_VOTE", f"{player.name} timed out, random vote for {target.name}",
+                                  actor=player.name)
+
+            events = [GameEvent(type="message", target_ids=[player.id],
+                                content=f"⌛ Время вышло. Случайный голос против <b>{target.name}</b>")]
+            if len(self.votes) >= sum(1 for p in self.players if p.is_alive):
+                events.extend(await self._finish_voting())
+            return events
+
+        self.logger.log_event("AFK_SKIP", f"{player.name} timed out in {self.state.phase}", actor=player.name)
+        self.current_turn_index += 1
+        return [
+            GameEvent(type="message", content=f"⌛ <b>{player.name}</b> промолчал — ход пропущен."),
+            GameEvent(type="switch_turn")
+        ]
+
+    async def resume(self) -> List[GameEvent]:
+        if self.state.phase == "voting":
+            # Клавиатуры голосования остались в чатах, ждем недостающие голоса
+            return []
+        return await self.process_turn()
+
+    def dump_state(self) -> Dict:
+        data = super().dump_state()
+        data["current_turn_index"] = self.current_turn_index
+        data["votes"] = dict(self.votes)
+        return data
+
+    def load_state(self, data: Dict):
+        super().load_state(data)
+        self.current_turn_index = data.get("current_turn_index", 0)
+        self.votes = dict(data.get("votes", {}))
\ No newline at end of file
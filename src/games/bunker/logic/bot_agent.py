@@ -169,7 +169,8 @@ class BotAgent:
                 {"role": "user", "content": f"Topic: {state.shared_data.get('topic')}. Action!"}
             ],
             json_mode=True,
-            logger=logger
+            logger=logger,
+            actor=bot.name
         )
 
         decision = llm_client.parse_json(response)
@@ -257,7 +258,8 @@ class BotAgent:
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
             json_mode=True,
-            logger=logger
+            logger=logger,
+            actor=bot.name
         )
 
         data = llm_client.parse_json(response)
@@ -95,7 +95,8 @@ class DirectorAgent:
             model_config=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.9,  # Высокая температура для креативности
-            logger=logger
+            logger=logger,
+            actor="director"
         )
 
         return instruction.strip()
\ No newline at end of file
@@ -68,7 +68,8 @@ class JudgeAgent:
             messages=[{"role": "system", "content": system_prompt}],
             temperature=0.1,
             json_mode=True,
-            logger=logger
+            logger=logger,
+            actor="judge"
         )
 
         data = llm_client.parse_json(response)
@@ -5,6 +5,7 @@ from typing import List, Dict, Optional
 from src.core.abstract_game import GameEngine
 from src.core.schemas import BasePlayer, BaseGameState, GameEvent
 from src.core.logger import SessionLogger
+from src.core.callbacks import callback_codec
 
 from src.games.detective.schemas import DetectiveStateData, DetectiveScenario, DetectivePlayerProfile, GamePhase, Fact, \
     RoleType, BotState
@@ -20,6 +21,7 @@ class DetectiveGame(GameEngine):
     def __init__(self, lobby_id: str, host_name: str):
         super().__init__(lobby_id, host_name)
         self.logger = SessionLogger("Detective", lobby_id, host_name)
+        self.logger.context = self.log_context
 
         self.scenario_gen = ScenarioGenerator()
         self.suggestion_agent = SuggestionAgent()
@@ -88,6 +90,7 @@ class DetectiveGame(GameEngine):
         if finder_idx != -1:
             finder = self.players.pop(finder_idx)
             self.players.insert(0, finder)
+            self.players_changed()
             self.logger.log_event("INIT", f"Finder found: {finder.name}, moved to start.")
 
         roles_log = {p.name: p.attributes["detective_profile"].dict(include={'character_name', 'role'}) for p in
@@ -175,7 +178,8 @@ class DetectiveGame(GameEngine):
         prof = current_player.attributes["detective_profile"]
         display_name = f"{prof.character_name} [{prof.tag}]"
 
-        self.logger.log_event("TURN", f"Current turn: {current_player.name} ({display_name})")
+        self.logger.log_event("TURN", f"Current turn: {current_player.name} ({display_name})",
+                              actor=current_player.name)
 
         if not current_player.is_human:
             t_count = self.state.shared_data["turn_count"]
@@ -199,7 +203,8 @@ class DetectiveGame(GameEngine):
                 events.append(GameEvent(
                     type="message",
                     target_ids=others,
-                    content=f"⏳ Ходит <b>{prof.character_name}</b>..."
+                    content=f"⏳ Ходит <b>{prof.character_name}</b>...",
+                    extra_data={"public": True}
                 ))
             return events
 
@@ -237,7 +242,7 @@ class DetectiveGame(GameEngine):
         return fact_id  # оригинал безопасен
 
     async def execute_bot_turn(self, bot_id: int, token: str) -> List[GameEvent]:
-        bot = next((p for p in self.players if p.id == bot_id), None)
+        bot = self.get_player(bot_id)
         if not bot: return []
 
         scen_data = self.state.shared_data["scenario"]
@@ -285,7 +290,7 @@ class DetectiveGame(GameEngine):
         return events
 
     async def process_message(self, player_id: int, text: str) -> List[GameEvent]:
-        p = next((x for x in self.players if x.id == player_id), None)
+        p = self.get_player(player_id)
         if not p: return []
 
         active_player = self.players[self.current_turn_index % len(self.players)]
@@ -299,7 +304,7 @@ class DetectiveGame(GameEngine):
                 content=f"⚠️ <b>Не ваш ход!</b> Сейчас говорит {active_display}."
             )]
 
-        self.logger.log_event("CHAT", f"{p.name} -> {text}")
+        self.logger.log_event("CHAT", f"{p.name} -> {text}", actor=p.name)
 
         my_prof = p.attributes["detective_profile"]
 
@@ -307,34 +312,37 @@ class DetectiveGame(GameEngine):
 
         msg = f"<b>{my_prof.character_name} [{my_prof.tag}]</b>: {text}"
         others = [x.id for x in self.players if x.id != player_id]
-        events = [GameEvent(type="message", target_ids=others, content=msg)]
+        events = [GameEvent(type="message", target_ids=others, content=msg, extra_data={"public": True})]
 
         self.current_turn_index += 1
         events.append(GameEvent(type="switch_turn"))
         return events
 
     async def handle_action(self, player_id: int, action_data: str) -> List[GameEvent]:
-        p = next((x for x in self.players if x.id == player_id), None)
+        p = self.get_player(player_id)
         if not p: return []
 
-        self.logger.log_event("ACTION", f"{p.name} -> {action_data}")
+        self.logger.log_event("ACTION", f"{p.name} -> {action_data}", actor=p.name)
 
         active_player = self.players[self.current_turn_index % len(self.players)]
         is_my_turn = (p.id == active_player.id)
 
-        if action_data.startswith("preview_"):
-            fid = action_data.split("_")[1]
-            return self._preview_fact(p, fid)
+        action, args = callback_codec.unpack(action_data)
+        if not args: return []
 
-        elif action_data.startswith("reveal_"):
+        if action == "preview":
+            return self._preview_fact(p, args[0])
+
+        elif action == "reveal":
             if not is_my_turn:
                 return [GameEvent(type="callback_answer", target_ids=[player_id], content="Только в свой ход!")]
 
-            fid = action_data.split("_")[1]
-            return await self._reveal_fact(p, fid)
+            return await self._reveal_fact(p, args[0])
 
-        elif action_data.startswith("vote_"):
-            return await self._handle_human_vote(p, action_data.split("_")[1])
+        elif action == "vote":
+            target = self.get_player(args[0])
+            if not target: return []
+            return await self._handle_human_vote(p, target.name)
 
         return []
 
@@ -349,7 +357,7 @@ class DetectiveGame(GameEngine):
         type_name = FACT_TYPE_NAMES.get(fact['type'], fact['type'])
 
         text = f"🕵️‍♂️ <b>ИЗУЧЕНИЕ УЛИКИ</b>\n\n🏷 <b>{fact['keyword']}</b>\n📜 <i>{fact['text']}</i>\n\n❓ <b>Тип:</b> {type_name}\n\nВы хотите предъявить это обвинение всем?"
-        kb = [{"text": "📢 ОПУБЛИКОВАТЬ", "callback_data": f"reveal_{fact_id}"}]
+        kb = [{"text": "📢 ОПУБЛИКОВАТЬ", "callback_data": callback_codec.pack("reveal", fact_id)}]
 
         return [
             GameEvent(type="callback_answer", target_ids=[player.id], content="Загрузка..."),
@@ -370,7 +378,7 @@ class DetectiveGame(GameEngine):
         if fact["is_public"] or fact_id in self.state.shared_data["public_facts"]:
             return [GameEvent(type="callback_answer", target_ids=[player.id], content="Уже вскрыто!")]
 
-        self.logger.log_event("FACT_REVEAL", f"{player.name} revealed {fact['text']}")
+        self.logger.log_event("FACT_REVEAL", f"{player.name} revealed {fact['text']}", actor=player.name)
 
         fact["is_public"] = True
         self.state.shared_data["public_facts"].append(fact_id)
@@ -428,7 +436,7 @@ class DetectiveGame(GameEngine):
 
                     prof = cand.attributes["detective_profile"]
                     btn_text = f"{prof.character_name} [{prof.tag}]"
-                    kb.append({"text": btn_text, "callback_data": f"vote_{cand.name}"})
+                    kb.append({"text": btn_text, "callback_data": callback_codec.pack("vote", cand.id)})
 
                 events.append(
                     GameEvent(type="message", target_ids=[p.id], content="👉 <b>Кто совершил преступление?</b>",
@@ -470,7 +478,7 @@ class DetectiveGame(GameEngine):
         if player.name in self.votes:
             return [GameEvent(type="callback_answer", target_ids=[player.id], content="Голос уже принят")]
 
-        self.logger.log_event("VOTE", f"{player.name} -> {target_name}")
+        self.logger.log_event("VOTE", f"{player.name} -> {target_name}", actor=player.name)
         self.votes[player.name] = target_name
 
         target_p = next((p for p in self.players if p.name == target_name), None)
@@ -536,12 +544,70 @@ class DetectiveGame(GameEngine):
         else:
             return [GameEvent(type="edit_message", target_ids=[player.id], content=text, reply_markup=kb, token=token)]
 
+    # --- ДЕДЛАЙНЫ ХОДА ---
+    def pending_humans(self) -> List[int]:
+        if not self.state or not self.players: return []
+        if self.state.phase == GamePhase.FINAL_VOTE:
+            return [p.id for p in self.players if p.is_human and p.name not in self.votes]
+        if self.state.phase != GamePhase.INVESTIGATION: return []
+
+        if self.current_turn_index < len(self.players) and self.players[self.current_turn_index].is_human:
+            return [self.players[self.current_turn_index].id]
+        return []
+
+    async def skip_turn(self, player_id: int) -> List[GameEvent]:
+        if player_id not in self.pending_humans(): return []
+        player = self.get_player(player_id)
+        char_name = player.attributes["detective_profile"].character_name
+
+        if self.state.phase == GamePhase.FINAL_VOTE:
+            import random
+            others = [p for p in self.players if p.id != player.id]
+            if not others: return []
+            self.logger.log_event("AFK_VOTE", f"{player.name} timed out, random vote", actor=player.name)
+            events = await self._handle_human_vote(player, random.choice(others).name)
+            # Ответа на кнопку не было — callback_answer некуда отправлять
+            return [e for e in events if e.type != "callback_answer"]
+
+        self.logger.log_event("AFK_SKIP", f"{player.name} ({char_name}) timed out", actor=player.name)
+        self.state.history.append(f"[{char_name}]: (молчит)")
+        self.current_turn_index += 1
+        return [
+            GameEvent(type="message", content=f"⌛ <b>{char_name}</b> промолчал — ход пропущен."),
+            GameEvent(type="switch_turn")
+        ]
+
+    async def substitute_bot(self, player_id: int) -> List[GameEvent]:
+        player = self.get_player(player_id)
+        if not player or not player.is_human: return []
+        player.is_human = False
+        prof = player.attributes["detective_profile"]
+        prof.bot_state = BotState()
+        self.players_changed()
+        return [GameEvent(type="message", content=f"🤖 <b>{prof.character_name}</b> не отвечает — за него играет AI.")]
+
     def get_player_view(self, viewer_id: int) -> str:
         return "Detective View"
 
+    def dump_state(self) -> Dict:
+        data = super().dump_state()
+        data["current_turn_index"] = self.current_turn_index
+        data["votes"] = dict(self.votes)
+        return data
+
+    def load_state(self, data: Dict):
+        super().load_state(data)
+        # Профили после JSON приходят словарями — возвращаем им тип (вместе с BotState)
+        for p in self.players:
+            prof = p.attributes.get("detective_profile")
+            if isinstance(prof, dict):
+                p.attributes["detective_profile"] = DetectivePlayerProfile(**prof)
+        self.current_turn_index = data.get("current_turn_index", 0)
+        self.votes = dict(data.get("votes", {}))
+
     async def player_leave(self, player_id: int) -> List[GameEvent]:
-        p = next((x for x in self.players if x.id == player_id), None)
+        p = self.get_player(player_id)
         if not p: return []
         char_name = p.attributes["detective_profile"].character_name
-        self.logger.log_event("PLAYER_LEFT", f"{p.name} ({char_name}) left")
+        self.logger.log_event("PLAYER_LEFT", f"{p.name} ({char_name}) left", actor=p.name)
         return [GameEvent(type="message", content=f"🚪 {char_name} покинул комнату...")]
\ No newline at end of file
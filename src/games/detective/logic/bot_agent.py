@@ -290,7 +290,8 @@ class DetectiveBotAgent:
                     messages=messages,
                     temperature=temp,
                     json_mode=True,
-                    logger=logger
+                    logger=logger,
+                    actor=bot.name
                 )
                 data = llm_client.parse_json(response)
 
@@ -335,7 +336,7 @@ class DetectiveBotAgent:
             logger.log_event("BOT_DECISION", f"{bot.name} ({prof.character_name}) acted", {
                 **data,
                 "emotion": state.emotion.dict()
-            })
+            }, actor=bot.name)
 
         return data
 
@@ -388,7 +389,8 @@ class DetectiveBotAgent:
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,
                 json_mode=True,
-                logger=logger
+                logger=logger,
+                actor=bot.name
             )
             data = llm_client.parse_json(response)
             target_char = data.get("vote_target_name", "")
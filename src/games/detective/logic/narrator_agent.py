@@ -31,7 +31,8 @@ class NarratorAgent:
                 model_config=model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.7,  # Снижена температура для реализма
-                logger=logger
+                logger=logger,
+                actor="narrator"
             )
 
             clean_text = response.strip().strip('"')
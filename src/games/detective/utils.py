@@ -1,6 +1,7 @@
 import random
 from typing import List, Dict
 from src.core.schemas import BasePlayer
+from src.core.callbacks import callback_codec
 from src.games.detective.schemas import Fact, DetectivePlayerProfile, FactType, RoleType
 
 ROLE_MAP = {
@@ -85,9 +86,9 @@ class DetectiveUtils:
             if fact and not fact.is_public:
                 icon = FACT_TYPE_ICONS.get(fact.type, "📄")
                 btn_text = f"{icon} {fact.keyword}"
-                kb.append({"text": btn_text, "callback_data": f"preview_{fid}"})
+                kb.append({"text": btn_text, "callback_data": callback_codec.pack("preview", fid)})
 
         if not kb:
-            kb.append({"text": "📭 Карт нет / Лимит исчерпан", "callback_data": "dummy_empty"})
+            kb.append({"text": "📭 Карт нет / Лимит исчерпан", "callback_data": callback_codec.pack("noop")})
 
         return kb
\ No newline at end of file